@@ -0,0 +1,85 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.config import *
+from main import make_data_handler, make_swarm
+from modules.HistoryLog import HistoryReader
+
+
+def read_targets(args, data):
+    """
+        Target genes from --targets, --targets-file (one gene per line, # comments) or the --top-k most variable genes
+    """
+    targets = list(args.targets or [])
+
+    if args.targets_file:
+        with open(args.targets_file, "r") as infile:
+            targets += [line.split("#")[0].strip() for line in infile if line.split("#")[0].strip()]
+
+    if args.top_k:
+        targets += [gene["gene_symbol"] for gene in data.variability_index.top_k(RANK_STATISTIC, args.top_k)]
+
+    # Keep the first occurrence of each target
+    return list(dict.fromkeys(targets))
+
+def main():
+
+    parser = argparse.ArgumentParser(description="PSO gene selection for several target genes in one process")
+    parser.add_argument("--targets", nargs="+", metavar="GENE", help="target gene symbols")
+    parser.add_argument("--targets-file", help="file with one target gene symbol per line")
+    parser.add_argument("--top-k", type=int, help="also run the k most variable genes (by RANK_STATISTIC)")
+    parser.add_argument("--workers", type=int, default=BATCH_NUM_WORKERS or os.cpu_count(),
+                        help="threads for the per-target correlation and baseline stages")
+    parser.add_argument("--output-dir", default=BATCH_OUTPUT_PATH, help="per-target outputs go to OUTPUT_DIR/<gene>/")
+    parser.add_argument("--seed", type=int, default=SEED, help="run seed (default: SEED in modules/config.py)")
+    args = parser.parse_args()
+
+    if not (args.targets or args.targets_file or args.top_k):
+        parser.error("give --targets, --targets-file and/or --top-k")
+
+    # Expression store, covariate encodings and variability index are loaded once and shared by every target
+    data = make_data_handler(load_target=False, seed=args.seed)
+
+    targets = read_targets(args, data)
+    unknown = [target for target in targets if target not in data.gene_index]
+    if unknown:
+        parser.error("unknown target genes: {}".format(", ".join(unknown)))
+
+    # Per-target stages (correlation screening, baseline) run concurrently; both spend their time in NumPy / scikit-learn.
+    # Concurrent targets split the cores between their baseline forests instead of each fitting on all of them.
+    num_threads = max(1, min(args.workers, len(targets)))
+    baseline_n_jobs = max(1, (os.cpu_count() or 1) // num_threads) if num_threads > 1 else None
+    print("Preparing {} targets on {} threads...".format(len(targets), num_threads))
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        target_data = list(executor.map(lambda target: data.for_target(target, baseline_n_jobs), targets))
+
+    # One PSO per target; each run already spreads its evaluations over NUM_WORKERS processes
+    summary = []
+    for target, target_data_i in zip(targets, target_data):
+        print("\n=== {} ({} / {}) ===".format(target, len(summary) + 1, len(targets)))
+
+        target_dir = os.path.join(args.output_dir, target)
+        history_path = os.path.join(target_dir, "history_{}_agents.bin".format(target_data_i.num_agents))
+        pso_swarm = make_swarm(target_data_i, checkpoint_path=os.path.join(target_dir, "checkpoint.pkl"), history_path=history_path)
+        pso_swarm.run()
+
+        # Final global best (earlier epochs may be on the proxy evaluator's scale)
+        history = HistoryReader(history_path)
+        summary.append({
+            "target_gene"       : target,
+            "baseline_error"    : float(target_data_i.baseline_error),
+            "baseline_std"      : target_data_i.baseline_std,
+            "best_error"        : float(history.column("best_error")[-1]),
+            "num_genes"         : target_data_i.num_genes,
+            "num_genes_active"  : int(history.column("num_genes_active")[-1]),
+            "history_path"      : history_path
+        })
+
+        # Rewritten after every target, so finished targets are recorded even if a later one fails
+        with open(os.path.join(args.output_dir, "summary.json"), "w") as outfile:
+            json.dump(summary, outfile, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+    Micro-benchmark of DataHandler.get_expression_levels: per-call latency of the original per-row
+    covariate encoding + pandas concatenation vs. the precomputed covariate block and buffered column gather.
+
+    Usage: python benchmarks/expression_levels.py [--genes 500] [--samples 524] [--calls 200]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules.DataHandler import DataHandler
+
+
+def build_handler(num_genes, num_samples, seed=0):
+    """
+        DataHandler populated with synthetic data, bypassing the file loading in __init__
+    """
+    rng = np.random.RandomState(seed)
+
+    handler = DataHandler.__new__(DataHandler)
+    handler.features = ["age", "gender", "structure_acronym"]
+    columns_metadata_df = pd.DataFrame({
+        "donor_name"        : rng.choice(["H376.{}".format(i) for i in range(42)], num_samples),
+        "age"               : rng.choice(["{} pcw".format(i) for i in range(8, 38)], num_samples),
+        "gender"            : rng.choice(["M", "F"], num_samples),
+        "structure_acronym" : rng.choice(["S{}".format(i) for i in range(26)], num_samples)
+    })
+    handler.selected_columns_df = columns_metadata_df[handler.features]      # input of the legacy implementation
+    handler.columns_metadata = {column : columns_metadata_df[column].values for column in columns_metadata_df.columns}
+    handler.selected_columns = {feature_raw : handler.columns_metadata[feature_raw] for feature_raw in handler.features}
+    handler._DataHandler__2_setup_feature_encodings()
+
+    gene_names = ["G{}".format(i) for i in range(num_genes)]
+    handler.gene_expression_data = pd.DataFrame(rng.lognormal(size=(num_genes, num_samples)), index=gene_names)
+    handler.target_gene_data = rng.lognormal(size=num_samples)
+    handler.num_genes = num_genes
+    handler.expression_matrix = np.ascontiguousarray(handler.gene_expression_data, dtype=np.float32)
+    handler.X_buffer = np.empty(num_samples * (num_genes + handler.encoded_covariates.shape[1]), dtype=np.float32)
+
+    return handler
+
+def legacy_get_expression_levels(handler, active_gene_indices):
+    """
+        The original implementation: re-encodes every sample row and concatenates with a transposed pandas slice
+    """
+    expression_data = handler.gene_expression_data.iloc[active_gene_indices].T
+
+    encoded_column_data = []
+    for col_data in np.array(handler.selected_columns_df):
+        encoded_values = []
+        for val, feature_raw in zip(col_data, handler.features):
+            feature = feature_raw.split("_")[0]
+            encoded_val = handler.encoding_lookups[feature](val)
+            if type(encoded_val) is type([]):
+                encoded_values += encoded_val
+            else:
+                encoded_values.append(encoded_val)
+        encoded_column_data.append(encoded_values)
+
+    encoded_column_data = np.array(encoded_column_data)
+
+    X = np.concatenate([expression_data, encoded_column_data], axis=1)
+    return X, handler.target_gene_data
+
+def time_calls(function, positions):
+    start = time.perf_counter()
+    for position in positions:
+        function(np.where(position == 1))
+    return (time.perf_counter() - start) / len(positions)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=524)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    handler = build_handler(args.genes, args.samples)
+    positions = (np.random.RandomState(1).uniform(size=(args.calls, args.genes)) > 0.5).astype(np.float64)
+
+    # Sanity check: both implementations produce the same X
+    X_before, _ = legacy_get_expression_levels(handler, np.where(positions[0] == 1))
+    X_after, _ = handler.get_expression_levels(np.where(positions[0] == 1))
+    assert np.allclose(np.asarray(X_before, dtype=np.float32), X_after)
+
+    before = time_calls(lambda active: legacy_get_expression_levels(handler, active), positions)
+    after = time_calls(handler.get_expression_levels, positions)
+
+    print("get_expression_levels ({} genes, {} samples, {} calls)".format(args.genes, args.samples, args.calls))
+    print("  before : {:10.3f} ms / call".format(before * 1e3))
+    print("  after  : {:10.3f} ms / call".format(after * 1e3))
+    print("  speedup: {:10.1f}x".format(before / after))
+
+if __name__ == "__main__":
+    main()
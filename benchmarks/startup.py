@@ -0,0 +1,124 @@
+"""
+    Startup benchmark: import and initialization time of the entry points, each measured in a fresh interpreter.
+    - import_main / import_worker / import_plotter: importing main.py, the evaluation worker modules (worker.py, ParallelEvaluator)
+      and the Plotter, with the heavy libraries each one loaded.
+    - load_lazy / load_eager: imports + DataHandler for a target whose correlations and baseline are cached, with lazy=True / False.
+    - ready_lazy / ready_eager: the same, plus the first get_expression_levels call (when the lazy stages load).
+    Data is synthetic (see benchmarks/synthetic_data.py); caches are warmed before timing.
+
+    Usage: python benchmarks/startup.py [--genes 10000] [--repeats 5] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import io
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from benchmarks.synthetic_data import generate
+
+HEAVY_MODULES = ("pandas", "matplotlib", "seaborn", "scipy", "sklearn")
+FEATURES = ["age", "gender", "structure_acronym"]
+
+# Run in a fresh interpreter; prints {"seconds", "modules"} as JSON on the last line
+CHILD_TEMPLATE = """
+import sys, time, json
+start = time.perf_counter()
+{statements}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds" : seconds, "modules" : [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+HANDLER_STATEMENTS = """
+from modules.DataHandler import DataHandler
+import numpy as np
+data = DataHandler(percentiles={{"top" : 95, "bottom" : 5}}, features={features}, data_dir={data_dir!r}, num_agents=10,
+                   baseline_iterations=1, num_subset_genes=False, target_gene={target!r}, lazy={lazy}, seed={seed!r})
+"""
+
+
+def run_child(statements, repeats):
+    """
+        Seconds of every repeat, and the heavy modules loaded, of statements run in a new interpreter
+    """
+    code = CHILD_TEMPLATE.format(statements=statements, heavy=repr(HEAVY_MODULES))
+    seconds = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, "-W", "ignore", "-c", code], cwd=ROOT, stderr=subprocess.DEVNULL)
+        result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+    return seconds, result["modules"]
+
+def scenarios(data_dir, target, seed):
+    # Same seed as warm_caches, so the timed handlers find the cached baseline
+    handler = lambda lazy: HANDLER_STATEMENTS.format(features=FEATURES, data_dir=data_dir, target=target, lazy=lazy, seed=seed)
+    first_X = "\ndata.get_expression_levels(np.arange(data.num_genes // 2))\n"
+    return [
+        ("import_main",         "import main"),
+        ("import_worker",       "import modules.Distributed\nimport modules.ParallelEvaluator"),
+        ("import_plotter",      "import modules.Plotter"),
+        ("load_lazy",           handler(True)),
+        ("load_eager",          handler(False)),
+        ("ready_lazy",          handler(True) + first_X),
+        ("ready_eager",         handler(False) + first_X)
+    ]
+
+def warm_caches(data_dir, num_genes, num_samples, seed):
+    """
+        Synthetic data, expression store, stats, correlations and baseline of the most variable gene; returns that gene
+    """
+    from modules.DataHandler import DataHandler
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate(data_dir, num_genes, num_samples, seed)
+        data = DataHandler({"top" : 95, "bottom" : 5}, FEATURES, data_dir=data_dir, num_agents=10, baseline_iterations=1,
+                           num_subset_genes=False, load_target=False, seed=seed)
+        target = data.variability_index.top_k("range", 1)[0]["gene_symbol"]
+        data.for_target(target)
+    return target
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=10000, help="dataset size (genes)")
+    parser.add_argument("--samples", type=int, default=524)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="pso_startup_")
+    results = []
+    try:
+        data_dir = os.path.join(work_dir, "data")
+        target = warm_caches(data_dir, args.genes, args.samples, args.seed)
+
+        print("{} genes x {} samples, best of {} fresh interpreters".format(args.genes, args.samples, args.repeats))
+        for name, statements in scenarios(data_dir, target, args.seed):
+            seconds, modules = run_child(statements, args.repeats)
+            results.append({
+                "benchmark"     : name,
+                "seconds"       : float(np.median(seconds)),
+                "min_seconds"   : float(np.min(seconds)),
+                "repeats"       : len(seconds),
+                "modules"       : modules,
+                "num_genes"     : args.genes,
+                "num_samples"   : args.samples
+            })
+            print("  {:16s} {:>10.1f} ms   {}".format(name, np.min(seconds) * 1e3, ", ".join(modules) or "-"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump({"created" : time.strftime("%Y-%m-%dT%H:%M:%S"), "results" : results}, outfile, indent=2)
+        print("\nWrote {}".format(args.output))
+
+if __name__ == "__main__":
+    main()
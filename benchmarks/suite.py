@@ -0,0 +1,261 @@
+"""
+    Benchmark suite for the data pipeline and the PSO loop on synthetic data (see benchmarks/synthetic_data.py).
+    For every dataset size (--genes) it times: ingest, variability stats, DataHandler load, Pearson screening of one target,
+    the per-target stages (correlations + baseline, computed and cached), get_expression_levels, Agent.evaluate per evaluator, and, for every
+    swarm size (--agents), the batched velocity/position update and one full epoch per evaluator.
+    Results are written as JSON; --compare OLD.json prints the ratio to an earlier run and exits with status 1 on a regression.
+
+    Usage: python benchmarks/suite.py [--genes 2000 10000] [--agents 10 50] [--output results.json] [--compare old.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import sklearn
+from modules.Agent import Agent
+from modules.Swarm import Swarm
+from modules.SwarmState import SwarmState
+from modules.DataHandler import DataHandler
+from modules.Correlation import pearson_correlations
+from modules.ExpressionStore import ExpressionStore, ingest
+from modules.VariabilityIndex import VariabilityIndex
+from modules.FitnessEvaluator import make_evaluator
+from benchmarks.synthetic_data import generate
+
+AGENT_PARAMS = {"c1" : 2, "c2" : 2, "v_min" : -4, "v_max" : 4, "weight" : 0.4}
+FEATURES = ["age", "gender", "structure_acronym"]
+
+
+class BenchmarkRun(object):
+    def __init__(self, args):
+        self.args = args
+        self.results = []
+
+    def record(self, benchmark, seconds, per_call=False, **sizes):
+        entry = {
+            "benchmark"     : benchmark,
+            "seconds"       : float(np.median(seconds)),
+            "min_seconds"   : float(np.min(seconds)),
+            "repeats"       : len(seconds),
+            "per_call"      : per_call
+        }
+        entry.update(sizes)
+        self.results.append(entry)
+        print("  {:32s} {:>12.3f} ms{}".format(benchmark, entry["seconds"] * 1e3, " / call" if per_call else ""))
+
+    def timed(self, function, repeats=None):
+        """
+            Seconds per repeat of function(); output printed by the pipeline is suppressed unless --verbose.
+            Everything timed is seeded from --seed (RandomStreams), so every repeat runs the same workload.
+        """
+        seconds = []
+        for _ in range(repeats or self.args.repeats):
+            with contextlib.redirect_stdout(sys.stdout if self.args.verbose else io.StringIO()):
+                start = time.perf_counter()
+                function()
+                seconds.append(time.perf_counter() - start)
+        return seconds
+
+    def per_call(self, function, items):
+        """
+            Mean seconds per function(item), repeated --repeats times
+        """
+        return [seconds / len(items) for seconds in self.timed(lambda: [function(item) for item in items])]
+
+    def run_dataset(self, data_dir, num_genes):
+        args = self.args
+        sizes = {"num_genes" : num_genes, "num_samples" : args.samples}
+        print("\n{} genes x {} samples".format(num_genes, args.samples))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            source_dir = generate(data_dir, num_genes, args.samples, args.seed)
+
+        # Ingest, stats and load
+        # -----------------------------------------------------------------------------------------------
+        store_dir = os.path.join(data_dir, "expression_store")
+        self.record("ingest", self.timed(lambda: ingest(source_dir, store_dir), repeats=1), **sizes)
+        store = ExpressionStore(store_dir)
+
+        stats_path = os.path.join(data_dir, "expression_stats.npz")
+        self.record("stats", self.timed(lambda: VariabilityIndex.build(store.matrix, store.gene_symbols, store.fingerprint)), **sizes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            VariabilityIndex.build(store.matrix, store.gene_symbols, store.fingerprint).save(stats_path)
+
+        handler_params = {
+            "percentiles"           : {"top" : 95, "bottom" : 5},
+            "features"              : FEATURES,
+            "data_dir"              : data_dir,
+            "num_agents"            : max(args.agents),
+            "baseline_iterations"   : 1,
+            "num_subset_genes"      : False,
+            "load_target"           : False,
+            "seed"                  : args.seed
+        }
+        self.record("load", self.timed(lambda: DataHandler(**handler_params)), **sizes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            data = DataHandler(**handler_params)
+        # -----------------------------------------------------------------------------------------------
+
+        # Per-target stages, for the most variable gene
+        # -----------------------------------------------------------------------------------------------
+        target = data.variability_index.top_k("range", 1)[0]
+        y = np.array(store.matrix[target["row"]], dtype=np.float64)
+        self.record("correlation", self.timed(lambda: pearson_correlations(store.matrix, y)), **sizes)
+
+        # Correlations and baselines are cached per target: the first call computes them, later calls load them
+        self.record("target_stages", self.timed(lambda: data.for_target(target["gene_symbol"]), repeats=1), **sizes)
+        self.record("target_stages_cached", self.timed(lambda: data.for_target(target["gene_symbol"])), **sizes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            target_data = data.for_target(target["gene_symbol"])
+
+        sizes["num_pso_genes"] = target_data.num_genes
+        # -----------------------------------------------------------------------------------------------
+
+        # Fitness evaluation
+        # -----------------------------------------------------------------------------------------------
+        rng = np.random.RandomState(args.seed)
+        positions = (rng.uniform(size=(args.calls, target_data.num_genes)) > 0.5).astype(np.float64)
+        active_indices = [np.flatnonzero(position) for position in positions]
+        self.record("get_expression_levels", self.per_call(target_data.get_expression_levels, active_indices), per_call=True, **sizes)
+
+        num_evaluations = min(args.calls, args.evaluate_calls)
+        state = SwarmState(num_evaluations, target_data.num_genes, num_importances=target_data.importance_layout.size, seed=args.seed, **AGENT_PARAMS)
+        state.set_positions(positions[:num_evaluations])
+        for evaluator_name in args.evaluators:
+            evaluator = make_evaluator(evaluator_name, **self.evaluator_params(evaluator_name))
+            agents = [Agent(agent_i, state, target_data, evaluator) for agent_i in range(num_evaluations)]
+            reset = getattr(evaluator, "reset", lambda: None)
+            self.record("agent_evaluate_{}".format(evaluator_name), self.per_call(lambda agent_i: (reset(), agent_i.evaluate()), agents), per_call=True, **sizes)
+        # -----------------------------------------------------------------------------------------------
+
+        # Swarm updates and full epochs
+        # -----------------------------------------------------------------------------------------------
+        for num_agents in args.agents:
+            agent_sizes = dict(sizes, num_agents=num_agents)
+            state = SwarmState(num_agents, target_data.num_genes, seed=args.seed, **AGENT_PARAMS)
+            best_global_position = state.position(0).copy()
+            update = lambda _: (state.update_velocities(best_global_position), state.update_positions())
+            self.record("swarm_update", self.per_call(update, range(args.calls)), per_call=True, **agent_sizes)
+
+            for evaluator_name in args.evaluators:
+                history_path = os.path.join(data_dir, "history.bin")
+                def epoch():
+                    swarm_params = {
+                        "num_agents"            : num_agents,
+                        "max_epochs"            : 1,
+                        "agent_params"          : dict(AGENT_PARAMS, data=target_data),
+                        "plot_gene_activity"    : False,
+                        "fitness_cache_size"    : 0,
+                        "evaluator"             : make_evaluator(evaluator_name, **self.evaluator_params(evaluator_name)),
+                        "history_path"          : history_path,
+                        "seed"                  : args.seed
+                    }
+                    Swarm(**swarm_params).run()
+                self.record("epoch_{}".format(evaluator_name), self.timed(epoch), **agent_sizes)
+        # -----------------------------------------------------------------------------------------------
+
+    def evaluator_params(self, evaluator_name):
+        if evaluator_name == "forest":
+            return {"forest_params" : {"n_estimators" : self.args.n_estimators}}
+        return {}
+
+    def report(self):
+        return {
+            "created"       : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit"    : git_commit(),
+            "platform"      : {
+                "python"        : platform.python_version(),
+                "numpy"         : np.__version__,
+                "sklearn"       : sklearn.__version__,
+                "machine"       : platform.machine(),
+                "cpu_count"     : os.cpu_count()
+            },
+            "params"        : {key : val for key, val in vars(self.args).items() if key not in ("output", "compare", "verbose")},
+            "results"       : self.results
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(entry):
+    return (entry["benchmark"], entry["num_genes"], entry["num_samples"], entry.get("num_agents"))
+
+def compare(results, baseline_results, tolerance):
+    """
+        Print new / old time for every benchmark present in both runs; returns the keys that got slower than tolerance allows
+    """
+    baseline = {result_key(entry) : entry for entry in baseline_results}
+    regressions = []
+
+    print("\nComparison (new / old):")
+    for entry in results:
+        old = baseline.get(result_key(entry))
+        if old is None:
+            continue
+
+        # Best-of-repeats is far less sensitive to background load than the median
+        ratio = entry["min_seconds"] / old["min_seconds"] if old["min_seconds"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            regressions.append(result_key(entry))
+            flag = "  <-- REGRESSION"
+        print("  {:32s} {:>8} genes {:>5} agents {:8.2f}x{}".format(entry["benchmark"], entry["num_genes"], entry.get("num_agents") or "-", ratio, flag))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, nargs="+", default=[2000, 10000], help="dataset sizes (genes)")
+    parser.add_argument("--samples", type=int, default=524)
+    parser.add_argument("--agents", type=int, nargs="+", default=[10, 50], help="swarm sizes")
+    parser.add_argument("--evaluators", nargs="+", default=["forest", "ridge"])
+    parser.add_argument("--n-estimators", type=int, default=100, help="trees per forest fit")
+    parser.add_argument("--calls", type=int, default=200, help="calls per repeat of the per-call benchmarks")
+    parser.add_argument("--evaluate-calls", type=int, default=20, help="calls per repeat of agent_evaluate_*")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/results/benchmark_{}.json".format(time.strftime("%Y%m%d_%H%M%S")))
+    parser.add_argument("--compare", metavar="OLD_JSON", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown ratio above 1 reported as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args()
+
+    run = BenchmarkRun(args)
+    work_dir = tempfile.mkdtemp(prefix="pso_benchmark_")
+    try:
+        for num_genes in args.genes:
+            run.run_dataset(os.path.join(work_dir, "genes_{}".format(num_genes)), num_genes)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = run.report()
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(args.output, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+    print("\nWrote {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare, "r") as infile:
+            regressions = compare(report["results"], json.load(infile)["results"], args.tolerance)
+        if regressions:
+            print("{} regression(s)".format(len(regressions)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
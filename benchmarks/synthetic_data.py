@@ -0,0 +1,88 @@
+"""
+    Synthetic stand-in for data/genes_matrix_csv with the same files and columns as the real BrainSpan export:
+    expression_matrix.csv (row number + one value per sample, no header), columns_metadata.csv and rows_metadata.csv.
+    Expression is log-normal with a few shared latent factors, so target genes have genuinely correlated genes to find,
+    and a fraction of genes are all zero, as in the real data.
+
+    Usage: python benchmarks/synthetic_data.py OUTPUT_DATA_DIR [--genes 5000] [--samples 524] [--seed 0]
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+AGES = ["8 pcw", "9 pcw", "12 pcw", "13 pcw", "16 pcw", "17 pcw", "19 pcw", "21 pcw", "24 pcw", "25 pcw", "26 pcw", "35 pcw", "37 pcw",
+        "4 mos", "10 mos", "1 yrs", "2 yrs", "3 yrs", "4 yrs", "8 yrs", "11 yrs", "13 yrs", "15 yrs", "18 yrs", "19 yrs", "21 yrs",
+        "23 yrs", "30 yrs", "36 yrs", "37 yrs", "40 yrs"]
+STRUCTURES = ["A1C", "AMY", "CB", "CBC", "CGE", "DFC", "DTH", "HIP", "IPC", "ITC", "LGE", "M1C", "M1C-S1C", "MD", "MFC", "MGE",
+              "Ocx", "OFC", "PCx", "S1C", "STC", "STR", "TCx", "URL", "V1C", "VFC"]
+NUM_DONORS = 42
+NUM_FACTORS = 8
+ZERO_GENE_FRACTION = 0.05
+
+
+def generate(data_dir, num_genes=5000, num_samples=524, seed=0):
+    """
+        Write data_dir/genes_matrix_csv/{expression_matrix,columns_metadata,rows_metadata}.csv; returns that directory
+    """
+    rng = np.random.RandomState(seed)
+    source_dir = os.path.join(data_dir, "genes_matrix_csv")
+    if not os.path.isdir(source_dir):
+        os.makedirs(source_dir)
+
+    # Samples
+    # -----------------------------------------------------------------------------------------------
+    donor_ids = rng.randint(13058, 13058 + NUM_DONORS, num_samples)
+    structure_ids = rng.randint(len(STRUCTURES), size=num_samples)
+    columns_metadata_df = pd.DataFrame({
+        "column_num"        : np.arange(1, num_samples + 1),
+        "donor_id"          : donor_ids,
+        "donor_name"        : ["H376.{}".format(donor_id - 13058) for donor_id in donor_ids],
+        "age"               : [AGES[(donor_id * 7) % len(AGES)] for donor_id in donor_ids],            # one age per donor
+        "gender"            : ["M" if donor_id % 2 else "F" for donor_id in donor_ids],
+        "structure_id"      : 10000 + structure_ids,
+        "structure_acronym" : [STRUCTURES[structure_i] for structure_i in structure_ids],
+        "structure_name"    : ["structure {}".format(STRUCTURES[structure_i]) for structure_i in structure_ids]
+    })
+    columns_metadata_df.to_csv(os.path.join(source_dir, "columns_metadata.csv"), index=False)
+    # -----------------------------------------------------------------------------------------------
+
+    # Genes
+    # -----------------------------------------------------------------------------------------------
+    rows_metadata_df = pd.DataFrame({
+        "row_num"           : np.arange(1, num_genes + 1),
+        "gene_id"           : np.arange(7062, 7062 + num_genes),
+        "ensembl_gene_id"   : ["ENSG{:011d}".format(gene_i) for gene_i in range(num_genes)],
+        "gene_symbol"       : ["GENE{}".format(gene_i) for gene_i in range(num_genes)],
+        "entrez_id"         : np.arange(1, num_genes + 1)
+    })
+    rows_metadata_df.to_csv(os.path.join(source_dir, "rows_metadata.csv"), index=False)
+    # -----------------------------------------------------------------------------------------------
+
+    # Expression: log-normal around a per-gene level, driven by shared factors and the sample's structure
+    # -----------------------------------------------------------------------------------------------
+    factors = rng.normal(size=(NUM_FACTORS, num_samples)) + rng.normal(size=(NUM_FACTORS, len(STRUCTURES)))[:, structure_ids]
+    loadings = rng.normal(scale=0.5, size=(num_genes, NUM_FACTORS)) * (rng.uniform(size=(num_genes, 1)) < 0.3)
+    log_levels = rng.normal(1.0, 1.5, size=(num_genes, 1))
+    expression = np.exp(log_levels + np.dot(loadings, factors) + rng.normal(scale=0.5, size=(num_genes, num_samples)))
+    expression[rng.uniform(size=num_genes) < ZERO_GENE_FRACTION] = 0.0
+
+    expression_df = pd.DataFrame(np.round(expression, 6))
+    expression_df.insert(0, "row_num", np.arange(1, num_genes + 1))
+    expression_df.to_csv(os.path.join(source_dir, "expression_matrix.csv"), header=False, index=False)
+    # -----------------------------------------------------------------------------------------------
+
+    return source_dir
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir")
+    parser.add_argument("--genes", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=524)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("Wrote {}".format(generate(args.data_dir, args.genes, args.samples, args.seed)))
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,44 @@
-import numpy as np
+import argparse
 
 from modules.config import *
 from modules.Swarm import Swarm
 from modules.DataHandler import DataHandler
 from modules.Plotter import Plotter
+from modules.FitnessEvaluator import make_evaluator
+from modules.Racing import SuccessiveHalving
+from modules.Checkpoint import Checkpointer, load_checkpoint
+from modules.Convergence import StoppingRules
+from modules.Islands import IslandModel
 
-def main():
-
+def make_data_handler(**params):
+    """
+        DataHandler configured from modules/config.py; params override individual settings (e.g., target_gene)
+    """
     data_handler_params = {
         "data_dir"                  : DATA_PATH,
         "num_agents"                : NUM_AGENTS,
         "top_k_variable_genes"      : TOP_K_VARIABLE_GENES,
+        "rank_statistic"            : RANK_STATISTIC,
         "show_variability_plot"     : PLOT_GENE_VARIABILITY_ON_LOAD,
         "percentiles"               : PERCENTILES,
         "features"                  : FEATURES,
         "baseline_iterations"       : BASELINE_ITERATIONS,
-        "num_subset_genes"          : NUM_SUBSET_GENES
+        "baseline_n_jobs"           : BASELINE_N_JOBS,
+        "num_subset_genes"          : NUM_SUBSET_GENES,
+        "lazy"                      : LAZY_LOADING,
+        "seed"                      : SEED
     }
+    data_handler_params.update(params)
 
-    data = DataHandler(**data_handler_params)
+    return DataHandler(**data_handler_params)
 
-    #--- RUN ----------------------------------------------------------------------+
+def make_swarm(data, checkpoint_path=CHECKPOINT_PATH, history_path=None, num_agents=None, seed=None):
+    """
+        Swarm configured from modules/config.py for the target loaded in data (num_agents overrides data.num_agents;
+        seed overrides the data handler's run seed)
+    """
     swarm_params = {
-        "num_agents"                : data.num_agents,
+        "num_agents"                : num_agents or data.num_agents,
         "max_epochs"                : MAX_EPOCHS,
         "agent_params"                  : {
             "c1"                        : C1,
@@ -32,16 +48,74 @@ def main():
             "weight"                    : W,
             "data"                      : data
         },
-        "plot_gene_activity"            : PLOT_GENE_ACTIVITY
+        "plot_gene_activity"            : PLOT_GENE_ACTIVITY,
+        "fitness_cache_size"            : FITNESS_CACHE_SIZE,
+        "num_workers"                   : NUM_WORKERS,
+        "forest_params"                 : {"n_jobs" : FOREST_N_JOBS} if FOREST_N_JOBS else None,
+        "proxy_evaluator"               : make_evaluator(PROXY_EVALUATOR, alpha=RIDGE_ALPHA) if PROXY_EVALUATOR else None,
+        "proxy_epochs"                  : PROXY_EPOCHS,
+        "racing"                        : SuccessiveHalving(RACING_RUNGS, RACING_PROMOTION_RATIO) if RACING_RUNGS else None,
+        "distributed_params"            : {
+            "address"                   : COORDINATOR_ADDRESS,
+            "task_timeout"              : TASK_TIMEOUT,
+            "heartbeat_timeout"         : 6 * HEARTBEAT_INTERVAL
+        } if COORDINATOR_ADDRESS else None,
+        "asynchronous"                  : ASYNCHRONOUS,
+        "async_epoch_evaluations"       : ASYNC_EPOCH_EVALUATIONS,
+        "checkpointer"                  : Checkpointer(checkpoint_path, CHECKPOINT_EVERY_EPOCHS, CHECKPOINT_EVERY_SECONDS),
+        "history_path"                  : history_path,
+        "profiling"                     : PROFILING,
+        "metrics_path"                  : METRICS_PATH,
+        "stopping_rules"                : StoppingRules(STOP_PATIENCE, STOP_MIN_IMPROVEMENT, STOP_MIN_DIVERSITY, MAX_SECONDS, MAX_EVALUATIONS),
+        "seed"                          : seed
     }
 
-    pso_swarm = Swarm(**swarm_params)
-    pso_swarm.run()
+    return Swarm(**swarm_params)
+
+def main():
+
+    parser = argparse.ArgumentParser(description="PSO gene selection")
+    parser.add_argument("--resume", nargs="?", const=CHECKPOINT_PATH, default=None, metavar="CHECKPOINT",
+                        help="continue a run from its last checkpoint (default: {})".format(CHECKPOINT_PATH))
+    parser.add_argument("--target", default=None, metavar="GENE",
+                        help="target gene symbol (default: prompt with the most variable genes)")
+    parser.add_argument("--seed", type=int, default=SEED, help="run seed (default: SEED in modules/config.py)")
+    args = parser.parse_args()
+
+    checkpoint = load_checkpoint(args.resume) if args.resume else None
+    if checkpoint and args.target and args.target != checkpoint["target_gene"]:
+        parser.error("--target {} does not match the checkpoint's target {}".format(args.target, checkpoint["target_gene"]))
+
+    # A resumed run keeps the checkpoint's seed, so its gene set and baseline are the same
+    if checkpoint:
+        data = make_data_handler(target_gene=checkpoint["target_gene"], seed=checkpoint["seed"])
+    else:
+        data = make_data_handler(target_gene=args.target, seed=args.seed)
+
+    #--- RUN ----------------------------------------------------------------------+
+    if ISLANDS:
+        if checkpoint:
+            print("--resume is not supported with ISLANDS; starting new island runs")
+        island_agents = max(2, data.num_agents // ISLANDS)
+        islands = IslandModel(
+            data,
+            lambda data, **params: make_swarm(data, num_agents=island_agents, **params),
+            ISLANDS, MIGRATION_INTERVAL, MIGRATION_TOPOLOGY, ISLAND_OUTPUT_PATH
+        )
+        islands.run()
+        history_path = islands.history_path
+    else:
+        pso_swarm = make_swarm(data)
+        if checkpoint:
+            pso_swarm.restore(checkpoint)
+        pso_swarm.run()
+        history_path = pso_swarm.history_path
     #--- END ----------------------------------------------------------------------+
 
-    path = "results_5_agents.json"
-    plotter = Plotter()
-    plotter.plot_gene_activation_heatmap(pso_swarm.history, data.gene_name_list, data.baseline_error)
-    plotter.data_analysis_plots(path)
+    plotter = Plotter(num_workers=PLOT_NUM_WORKERS, dpi=PLOT_DPI)
+    if PLOT_GENE_ACTIVITY:
+        plotter.plot_gene_activation_heatmap(history_path, data.gene_name_list)
+    plotter.plot_activation_raster(history_path)
+    plotter.data_analysis_plots(history_path, data.baseline_error)
 if __name__ == "__main__":
     main()
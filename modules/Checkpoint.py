@@ -0,0 +1,58 @@
+import os
+import time
+import pickle
+
+CHECKPOINT_VERSION = 6
+
+
+def save_checkpoint(path, checkpoint):
+    """
+        Atomically write checkpoint: written to a temporary file, flushed to disk, then renamed over path,
+        so a crash mid-write leaves the previous checkpoint intact
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as outfile:
+        pickle.dump(checkpoint, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    with open(path, "rb") as infile:
+        checkpoint = pickle.load(infile)
+
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError("Unsupported checkpoint version in {}".format(path))
+
+    return checkpoint
+
+
+class Checkpointer(object):
+    """
+        Writes a swarm checkpoint every every_epochs epochs or every_seconds seconds, whichever comes first
+        (either may be None to disable that trigger)
+    """
+    def __init__(self, path, every_epochs=None, every_seconds=None):
+        self.path = path
+        self.every_epochs = every_epochs
+        self.every_seconds = every_seconds
+        self.last_save_time = time.time()
+        self.last_save_epoch = 0
+
+    def maybe_save(self, swarm, next_epoch, force=False):
+        """
+            next_epoch is the first epoch that has not run yet; returns True if a checkpoint was written
+        """
+        due_epochs = self.every_epochs and next_epoch - self.last_save_epoch >= self.every_epochs
+        due_seconds = self.every_seconds and time.time() - self.last_save_time >= self.every_seconds
+        if not (force or due_epochs or due_seconds):
+            return False
+
+        save_checkpoint(self.path, swarm.checkpoint(next_epoch))
+        self.last_save_time = time.time()
+        self.last_save_epoch = next_epoch
+        return True
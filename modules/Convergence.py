@@ -0,0 +1,105 @@
+import time
+import numpy as np
+
+from modules.Position import unpack
+
+# Why a run ended; stored per epoch in the run history ("" while the run continues)
+STOP_REASONS = ("", "max_epochs", "stagnation", "diversity", "time_budget", "evaluation_budget")
+
+
+def mean_pairwise_hamming(packed_positions, num_genes, block_size=256):
+    """
+        Mean Hamming distance over all pairs of rows of a bit-packed (agents x packed genes) matrix, as a fraction of the genes.
+        Column j contributes k_j * (n - k_j) differing pairs, where k_j agents have gene j on, so this is O(agents x genes)
+        instead of comparing every pair. Rows are unpacked block_size at a time to bound the temporary memory.
+    """
+    num_agents = packed_positions.shape[0]
+    if num_agents < 2 or num_genes == 0:
+        return 0.0
+
+    ones = np.zeros(num_genes)
+    for start in range(0, num_agents, block_size):
+        ones += unpack(packed_positions[start:start + block_size], num_genes, np.uint8).sum(axis=0)
+    differing_pairs = np.sum(ones * (num_agents - ones))
+    return differing_pairs / (num_agents * (num_agents - 1) / 2.0) / num_genes
+
+
+class StoppingRules(object):
+    """
+        Early stopping for Swarm.run. Every rule is optional (None disables it):
+            patience            stop when best_global_error has not improved by more than min_improvement (relative)
+                                for patience epochs
+            min_diversity       stop when the mean pairwise Hamming distance of the positions falls below this fraction of genes
+            max_seconds         wall-clock budget; stops before an epoch that would likely overrun it (last epoch's time)
+            max_evaluations     budget of forest fits (racing counts full-fit equivalents); same look-ahead as max_seconds
+    """
+    def __init__(self, patience=None, min_improvement=0.0, min_diversity=None, max_seconds=None, max_evaluations=None):
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.min_diversity = min_diversity
+        self.max_seconds = max_seconds
+        self.max_evaluations = max_evaluations
+
+        self.reference_error = None             # best error at the last improvement
+        self.epochs_without_improvement = 0
+        self.elapsed_seconds = 0.0              # run time before the current start() (e.g., before a resume)
+        self.total_evaluations = 0.0
+        self.last_epoch_seconds = 0.0
+        self.last_epoch_evaluations = 0.0
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+
+    def elapsed(self):
+        return self.elapsed_seconds + (time.time() - self.start_time if self.start_time is not None else 0.0)
+
+    def reset_stagnation(self):
+        """
+            Forget the reference error, e.g., after switching to an evaluator with a different error scale
+        """
+        self.reference_error = None
+        self.epochs_without_improvement = 0
+
+    def update(self, best_error, diversity, epoch_seconds, evaluations):
+        """
+            Record a finished epoch; returns the stop reason ("" to continue)
+        """
+        self.last_epoch_seconds = epoch_seconds
+        self.last_epoch_evaluations = evaluations
+        self.total_evaluations += evaluations
+
+        # Stagnation
+        # -----------------------------------------------------------------------------------------------
+        if best_error > 0 and (self.reference_error is None or best_error < self.reference_error * (1.0 - self.min_improvement)):
+            self.reference_error = best_error
+            self.epochs_without_improvement = 0
+        else:
+            self.epochs_without_improvement += 1
+
+        if self.patience is not None and self.epochs_without_improvement >= self.patience:
+            return "stagnation"
+        # -----------------------------------------------------------------------------------------------
+
+        if self.min_diversity is not None and diversity < self.min_diversity:
+            return "diversity"
+
+        # Budgets: stop if the next epoch is expected to exceed them
+        # -----------------------------------------------------------------------------------------------
+        if self.max_seconds is not None and self.elapsed() + self.last_epoch_seconds > self.max_seconds:
+            return "time_budget"
+
+        if self.max_evaluations is not None and self.total_evaluations + self.last_epoch_evaluations > self.max_evaluations:
+            return "evaluation_budget"
+        # -----------------------------------------------------------------------------------------------
+
+        return ""
+
+    def state(self):
+        """
+            Everything needed to continue the rules after a resume (see Swarm.checkpoint)
+        """
+        state = dict(vars(self))
+        state["elapsed_seconds"] = self.elapsed()
+        state["start_time"] = None
+        return state
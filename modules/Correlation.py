@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def pearson_correlations(expression, y, row_indices=None, chunk_size=4096):
+    """
+        Pearson correlation coefficient between every gene (row of expression, genes x samples) and the target y.
+        Rows are standardized and multiplied with the standardized target in fixed-size chunks, so memory stays
+        bounded at chunk_size x samples regardless of how many genes are screened.
+        Zero-variance rows have no defined coefficient and are given 0.0.
+        If row_indices is given, only those rows are screened (in that order).
+    """
+    y = np.asarray(y, dtype=np.float64).reshape(-1)
+    y_centered = y - y.mean()
+    y_norm = np.sqrt(np.dot(y_centered, y_centered))
+
+    num_rows = expression.shape[0] if row_indices is None else len(row_indices)
+    coefficients = np.zeros(num_rows, dtype=np.float64)
+
+    # Constant target: every coefficient is undefined
+    if y_norm == 0:
+        return coefficients
+
+    y_standardized = y_centered / y_norm
+
+    for start in range(0, num_rows, chunk_size):
+        stop = min(start + chunk_size, num_rows)
+
+        if row_indices is None:
+            chunk = np.asarray(expression[start:stop], dtype=np.float64)
+        else:
+            chunk = np.asarray(expression[np.asarray(row_indices[start:stop])], dtype=np.float64)
+
+        centered = chunk - chunk.mean(axis=1, keepdims=True)
+        norms = np.sqrt(np.einsum("ij,ij->i", centered, centered))
+
+        # Zero-variance rows keep their 0.0 coefficient
+        valid = norms > 0
+        coefficients[start:stop][valid] = np.dot(centered[valid], y_standardized) / norms[valid]
+
+    # Guard against rounding just outside [-1, 1]
+    return np.clip(coefficients, -1.0, 1.0)
+
+def percentile_mask(coefficients, bottom, top):
+    """
+        Boolean mask of the coefficients below the bottom percentile or above the top percentile
+    """
+    bottom_percentile, top_percentile = np.percentile(coefficients, [bottom, top])
+    return (coefficients < bottom_percentile) | (coefficients > top_percentile)
@@ -1,25 +1,86 @@
 import os
-import sys
+import copy
+import hashlib
+import importlib.metadata
 import numpy as np
-import pandas as pd
-import json
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from scipy.stats import stats
-from sklearn.ensemble import RandomForestRegressor
+
+from modules.Correlation import pearson_correlations, percentile_mask
+from modules.ExpressionStore import ExpressionStore, ingest, read_metadata
+from modules.VariabilityIndex import VariabilityIndex, STATISTICS
+from modules.ResultStore import ResultStore
+from modules.FeatureImportance import ImportanceLayout, covariate_groups
+from modules.Instrumentation import profiled
+from modules.RandomStreams import RandomStreams, SUBSET_STREAM, BASELINE_STREAM
+
+
+def encode_covariates(selected_columns, features, categories):
+    """
+        One-hot encode the selected feature columns ({feature : values per sample}) of every sample into one contiguous
+        (samples x encoded features) float32 block
+    """
+    encoded_blocks = []
+    for feature_raw in features:
+        feature = feature_raw.split("_")[0]
+        codes_lookup = {category : code for code, category in enumerate(categories[feature])}
+        codes = np.array([codes_lookup.get(value, -1) for value in selected_columns[feature_raw]], dtype=np.intp)
+        if np.any(codes < 0):
+            raise ValueError("Unknown value for feature '{}'".format(feature_raw))
+
+        encoded_blocks.append(np.identity(len(categories[feature]), dtype=np.float32)[codes])
+
+    return np.ascontiguousarray(np.concatenate(encoded_blocks, axis=1))
+
+@profiled("get_expression_levels")
+def gather_expression_levels(expression_matrix, encoded_covariates, active_gene_indices, out):
+    """
+        Assemble X for the active genes into the preallocated float32 buffer out, without intermediate copies.
+        expression_matrix is (genes x samples), so X^T is built row by row in a contiguous block and X is returned as its transpose.
+        The returned X is a view into out and is only valid until the next call.
+    """
+    active_gene_indices = np.asarray(active_gene_indices, dtype=np.intp).reshape(-1)
+    num_active = active_gene_indices.shape[0]
+    num_samples, num_covariates = encoded_covariates.shape
+
+    X_T = out[:(num_active + num_covariates) * num_samples].reshape(num_active + num_covariates, num_samples)
+
+    # Check the indices up front: mode="raise" would buffer the whole output, while "clip" lets take write straight into
+    # the buffer but silently maps a bad index to the last gene
+    if num_active and (active_gene_indices.min() < 0 or active_gene_indices.max() >= expression_matrix.shape[0]):
+        raise IndexError("Active gene indices out of range for {} genes".format(expression_matrix.shape[0]))
+    np.take(expression_matrix, active_gene_indices, axis=0, out=X_T[:num_active], mode="clip")
+    X_T[num_active:] = encoded_covariates.T
+
+    return X_T.T
 
 
 class DataHandler(object):
-    def __init__(self, percentiles, features, data_dir="../data", num_agents=None, top_k_variable_genes=10, show_variability_plot=False, baseline_iterations=5, num_subset_genes=5000):
+    """
+        With lazy=True, the stages that are not needed to select the target and look up its cached correlations and baseline
+        run on first access to one of their attributes (LAZY_STAGES): the sample metadata and covariate encodings, the
+        expression rows of the correlated genes, and the ridge Gram matrix. A forest-only run never builds the Gram matrix,
+        and handlers waiting in a batch do not hold their expression rows. lazy=False runs every stage while loading.
+    """
+
+    # Deferred stages: (stage, attributes it sets, needs a target gene)
+    LAZY_STAGES = (
+        (lambda self: self.__1A_load_metadata(), ("columns_metadata", "selected_columns"), False),
+        (lambda self: self.__2_setup_feature_encodings(), ("encoding_lookups", "encoding_sizes", "covariate_categories", "encoded_covariates"), False),
+        (lambda self: self.__5D_setup_importance_layout(), ("importance_layout",), True),
+        (lambda self: self.__5E_load_expression_rows(), ("gene_expression_data", "expression_matrix", "X_buffer"), True),
+        (lambda self: self.__5C_setup_gram_matrix(), ("num_samples", "gram_matrix", "gram_target", "gram_target_sum_squares"), True)
+    )
+
+    def __init__(self, percentiles, features, data_dir="../data", num_agents=None, top_k_variable_genes=10, rank_statistic="range", show_variability_plot=False, baseline_iterations=5, num_subset_genes=5000, target_gene=None, load_target=True, baseline_n_jobs=-1, lazy=True, seed=None):
 
         # Setup the directory paths
         self.data_dir = data_dir
         self.paths = {
-            "expression_data"   : "{}/genes_matrix_csv/expression_matrix.csv".format(data_dir),
-            "columns_metadata"  : "{}/genes_matrix_csv/columns_metadata.csv".format(data_dir),
-            "rows_metadata"     : "{}/genes_matrix_csv/rows_metadata.csv".format(data_dir),
-            "stats"             : "{}/genes_matrix_expression_variability.json".format(data_dir),
-            "correlation"       : "{}/gene_correlations.json".format(data_dir)
+            "source_zip"        : "{}/genes_matrix_csv.zip".format(data_dir),
+            "source_dir"        : "{}/genes_matrix_csv".format(data_dir),
+            "expression_store"  : "{}/expression_store".format(data_dir),
+            "stats"             : "{}/expression_stats.npz".format(data_dir),
+            "correlation"       : "{}/correlations".format(data_dir),
+            "baseline"          : "{}/baselines".format(data_dir)
         }
 
         # Setup the variables
@@ -31,36 +92,78 @@ class DataHandler(object):
         self.scale_num_agents = False if num_agents else True
 
         self.baseline_iterations = baseline_iterations
+        self.baseline_n_jobs = baseline_n_jobs          # n_jobs of each baseline forest (-1: every core)
         self.top_k_variable_genes = top_k_variable_genes
+        self.rank_statistic = rank_statistic
         self.show_variability_plot = show_variability_plot
 
         self.percentile_bounds = percentiles
+        self.lazy = lazy
+
+        # Run seed (None: fresh); the gene subset and baseline forests draw from their own streams of it, and Swarm defaults to it.
+        # Without an explicit seed the baseline forests are unseeded, so their cached scores are shared by every unseeded run.
+        self.random_streams = RandomStreams(seed)
+        self.seeded = seed is not None
 
         # Define other attributes
-        self.stats = {"mean" : [], "std" : [], "max" : [], "min" : [], "range" : []}
+        self.stats = {}
+        self.variability_index = None
         self.gene_expression_variability_high_to_low = []
-        self.encoding_lookups = []
         self.highly_correlated_genes = []
 
-        self.gene_expression_data = []      # X
         self.target_gene_data = []          # y
-        self.target_gene = ""
+        self.target_gene = target_gene or ""      # Set to skip the interactive target selection
         self.target_gene_index = None
 
-        # Load the data
+        # Load the data (load_target=False stops after the target-independent stages; see self.for_target)
+        self.load_target = load_target
         self.__MAIN_load()
 
+    def for_target(self, target_gene, baseline_n_jobs=None):
+        """
+            New handler for target_gene that shares this handler's expression store, covariate encodings and
+            variability index; only the per-target stages (correlations, baseline) are run.
+            Safe to call from several threads at once; baseline_n_jobs overrides this handler's for the new one.
+        """
+        handler = copy.copy(self)
+        handler.target_gene = target_gene
+        if baseline_n_jobs is not None:
+            handler.baseline_n_jobs = baseline_n_jobs
+        handler.num_agents = None if self.scale_num_agents else self.num_agents
+        handler.__MAIN_load_target()
+        if not handler.lazy:
+            handler.materialize()
+        return handler
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet: run the deferred stage that sets name
+        for stage, names, needs_target in DataHandler.LAZY_STAGES:
+            if name in names and (not needs_target or self.__dict__.get("target_gene_index") is not None):
+                stage(self)
+                return self.__dict__[name]
+        raise AttributeError("'DataHandler' object has no attribute '{}'".format(name))
+
+    def materialize(self):
+        """
+            Run every deferred stage now (e.g., before forking processes that should share the arrays)
+        """
+        for stage, names, needs_target in DataHandler.LAZY_STAGES:
+            if names[0] not in self.__dict__ and (not needs_target or self.target_gene_index is not None):
+                stage(self)
+
     def __MAIN_load(self):
         print("Loading Data...")
+        print("Seed: {}".format(self.random_streams.seed))
 
         # Load Data (expression, column metadata, row metadata)
         # ---------------------
         self.__1_load_data()
         # ---------------------
 
-        # Encode column features
+        # Encode column features (shared by every target of a batch, so only deferred when a target is loaded now)
         # ---------------------------------------------
-        self.__2_setup_feature_encodings()
+        if not (self.lazy and self.load_target):
+            self.__2_setup_feature_encodings()
         # ---------------------------------------------
 
         # Process gene expression variability
@@ -68,6 +171,15 @@ class DataHandler(object):
         self.__3_process_gene_expression_variability()
         # --------------------------------------------
 
+        if self.load_target:
+            self.__MAIN_load_target()
+
+        if not self.lazy:
+            self.materialize()
+
+        print("Load complete.")
+
+    def __MAIN_load_target(self):
         # Get target gene
         # ----------------------------
         self.__4_select_target_gene()
@@ -83,24 +195,23 @@ class DataHandler(object):
         self.__6_calculate_baseline()
         # ----------------------------
 
-        print("Load complete.")
-
     def __1_load_data(self):
-        # Load Expression Data
-        self.gene_expression_df = pd.read_csv(self.paths["expression_data"], header=None, index_col=0)
+        # Ingest the CSVs into the binary expression store on first use
+        if not ExpressionStore.exists(self.paths["expression_store"]):
+            source = self.paths["source_zip"] if os.path.exists(self.paths["source_zip"]) else self.paths["source_dir"]
+            ingest(source, self.paths["expression_store"])
 
-        # Load column data
-        self.columns_metadata_df = pd.read_csv(self.paths["columns_metadata"])
+        # Open the memory-mapped expression data (genes x samples); rows are paged in on access
+        self.expression_store = ExpressionStore(self.paths["expression_store"])
 
-        # Select columns of interest from column data
-        self.selected_columns_df = self.columns_metadata_df[self.features]
+        # Setup full gene list and gene symbol -> row lookup
+        self.full_gene_list = self.expression_store.gene_symbols
+        self.gene_index = self.expression_store.gene_index
 
-        # Load row data
-        self.rows_metadata_df = pd.read_csv(self.paths["rows_metadata"])
-
-        # Setup full gene list and assign list to row indices of expression df
-        self.full_gene_list = list(self.rows_metadata_df["gene_symbol"])
-        self.gene_expression_df.index = self.full_gene_list
+    def __1A_load_metadata(self):
+        # Load column data ({column : values per sample}) and select the columns of interest
+        self.columns_metadata = read_metadata(self.expression_store.paths["columns_metadata"])
+        self.selected_columns = {feature_raw : self.columns_metadata[feature_raw] for feature_raw in self.features}
 
     def __2_setup_feature_encodings(self):
         """
@@ -108,13 +219,13 @@ class DataHandler(object):
         """
         # Donor id
         # ---------------------------------------------------------------------------
-        donors = list(set(self.columns_metadata_df["donor_name"]))
+        donors = sorted(set(self.columns_metadata["donor_name"]))
         donors_onehot = np.identity(len(donors))
         # ---------------------------------------------------------------------------
 
         # Age
         # ---------------------------------------------------------------------------
-        ages = list(set(self.columns_metadata_df["age"]))
+        ages = sorted(set(self.columns_metadata["age"]))
         ages_onehot = np.identity(len(ages))
         # ---------------------------------------------------------------------------
 
@@ -125,7 +236,7 @@ class DataHandler(object):
 
         # Structure id
         # ---------------------------------------------------------------------------
-        structures = list(set(self.columns_metadata_df["structure_acronym"]))
+        structures = sorted(set(self.columns_metadata["structure_acronym"]))
         structures_onehot = np.identity(len(structures))
         # ---------------------------------------------------------------------------
 
@@ -145,95 +256,89 @@ class DataHandler(object):
             "structure"     : len(structures_onehot)
         }
 
+        # Encode the covariates of every sample once; they never change between evaluations
+        categories = {
+            "donor"         : donors,
+            "age"           : ages,
+            "gender"        : ["F", "M"],
+            "structure"     : structures
+        }
+        self.covariate_categories = categories
+        self.encoded_covariates = encode_covariates(self.selected_columns, self.features, categories)
+
     def __3_process_gene_expression_variability(self):
         """
-            Checks if stats file exists.
-            If stats file exists, load the file into self.gene_expression_variability_high_to_low and self.stats
-            Else, process stats on gene_expression_df into self.gene_expression_variability_high_to_low and self.stats
+            Checks if stats file exists (and matches the current expression store).
+            If stats file exists, load the variability index into self.variability_index and self.stats
+            Else, process stats on the expression store into self.variability_index and self.stats
+            self.gene_expression_variability_high_to_low holds the top-k genes by self.rank_statistic
         """
         print("Calculating Variability...")
 
         if os.path.exists(self.paths["stats"]):     # Stats exist - load them
             self.__3A_load_stats()
-        else:                                       # Stats do not exist - create them
+
+        if self.variability_index is None:          # Stats do not exist (or are stale) - create them
             self.__3B_process_stats()
 
+        self.stats = {statistic : self.variability_index.column(statistic) for statistic in STATISTICS}
+        self.gene_expression_variability_high_to_low = self.variability_index.top_k(self.rank_statistic, self.top_k_variable_genes)
+
     def __3A_load_stats(self):
         """
-            Load the stats from file and create self.gene_expression_variability_high_to_low and self.stats
+            Load the variability index from file, unless it was built from a different expression store
         """
         print("Loading stats data...")
 
-        # Write
-        with open(self.paths["stats"], "r") as infile:
-            self.gene_expression_variability_high_to_low = json.load(infile)
+        variability_index = VariabilityIndex.load(self.paths["stats"], self.full_gene_list)
+        if variability_index.fingerprint == self.expression_store.fingerprint:
+            self.variability_index = variability_index
 
     def __3B_process_stats(self):
         """
-            Create self.gene_expression_variability_high_to_low
+            Create self.variability_index in one streaming pass over the expression store and write it to file
         """
         print("Generating stats data...")
 
-        # Load dataframe
-        genes_df = pd.DataFrame(self.gene_expression_df.index, columns=["gene_symbol"])
-
-        # Calculate range of expression for each row
-        # --------------------------------------------------------------------------------------------
-        expression_range = self.gene_expression_df.apply(np.ptp, axis=1).reshape(-1, 1)
-        expression_range_df = pd.DataFrame(expression_range, columns=["range"])
-        # --------------------------------------------------------------------------------------------
-
-        # Concatenate with stats df
-        # -----------------------------------------------------------
-        stats_df = pd.concat([genes_df, expression_range_df], axis=1)
-        print(stats_df.head(4))
-        # -----------------------------------------------------------
-
-        # Sort the dataframe by range values
-        # --------------------------------------------------------------------------------
-        gene_expression_ranges_sorted = stats_df.sort_values(by="range")[::-1]
-        # --------------------------------------------------------------------------------
+        self.variability_index = VariabilityIndex.build(self.expression_store.matrix, self.full_gene_list, self.expression_store.fingerprint)
 
         # Plot the bar chart if enabled
         # ------------------------------------------------------------------------------------
         if self.show_variability_plot:
+            import pandas as pd
+            import matplotlib.pyplot as plt
+            from matplotlib import cm
             cmap = cm.get_cmap('Spectral') # Colour map (there are many others)
-            gene_expression_ranges_sorted[:20].plot(x="gene_symbol", y="range", kind="bar", colormap=cmap)
+            top_genes_df = pd.DataFrame(self.variability_index.top_k(self.rank_statistic, 20))
+            top_genes_df.plot(x="gene_symbol", y=self.rank_statistic, kind="bar", colormap=cmap)
             plt.show()
         # ------------------------------------------------------------------------------------
 
-        # Generate list of gene expression variability from high to low - for use in selecting target gene
-        # -----------------------------------------------------------------------------------------------------
-        self.gene_expression_variability_high_to_low = []
-        for gene_sym, gene_range in zip(list(gene_expression_ranges_sorted["gene_symbol"]), list(gene_expression_ranges_sorted["range"])):
-            self.gene_expression_variability_high_to_low.append({
-                "gene_symbol"   : gene_sym,
-                "range"         : gene_range
-            })
-        # -----------------------------------------------------------------------------------------------------
-
         # Write stats to file
-        # -----------------------------------------------------------------------------------------------------
-        with open(self.paths["stats"], "w") as outfile:
-            json.dump(self.gene_expression_variability_high_to_low, outfile)
-        # -----------------------------------------------------------------------------------------------------
+        self.variability_index.save(self.paths["stats"])
 
     def __4_select_target_gene(self):
         """
-            Select the target gene and target_gene_index
+            Select the target gene and target_gene_index (prompts the user unless a target gene was given)
         """
-        target_selected = False
+        if self.target_gene:
+            if self.target_gene not in self.gene_index:
+                raise ValueError("Unknown target gene: {}".format(self.target_gene))
+            self.target_gene_index = self.gene_index[self.target_gene]
+            print("Target gene: {}".format(self.target_gene))
+
+        target_selected = bool(self.target_gene)
         while not target_selected:
             print("\n")
             print("Highly Variable Genes")
             print('---------------------')
             for i, gene_i in enumerate(self.gene_expression_variability_high_to_low[:self.top_k_variable_genes], 1):
-                print("{}. {:15s} -- {:10.3f}".format(i, gene_i["gene_symbol"], gene_i["range"]))
+                print("{}. {:15s} -- {:10.3f}".format(i, gene_i["gene_symbol"], gene_i[self.rank_statistic]))
 
             try:
-                selected_gene_input = int(raw_input("Select gene: "))
+                selected_gene_input = int(input("Select gene: "))
                 selected_gene = self.gene_expression_variability_high_to_low[selected_gene_input-1]["gene_symbol"]
-                self.target_gene_index = self.full_gene_list.index(selected_gene)
+                self.target_gene_index = self.gene_index[selected_gene]
                 self.target_gene = self.full_gene_list[self.target_gene_index]
 
                 # Error check
@@ -249,7 +354,10 @@ class DataHandler(object):
                 # Disply info to user for confirmation
                 # -------------------------------------------------
                 print("Target gene: {}".format(self.target_gene))
-                raw_input("Press any key to continue...")
+                try:
+                    input("Press any key to continue...")
+                except EOFError:
+                    print("")
                 # -------------------------------------------------
 
                 # Flag as selected to break loop
@@ -259,53 +367,98 @@ class DataHandler(object):
                 print("\nKeyboard interrupt. Exiting...")
                 exit(0)
 
-            except:
+            except EOFError:
+                print("\nNo gene selected (end of input). Exiting...")
+                exit(1)
+
+            except (ValueError, IndexError):
                 print("Invalid selection.")
 
         # Set target gene data
-        self.target_gene_data = np.array(self.gene_expression_df.ix[self.target_gene]).reshape(-1,)
+        self.target_gene_data = np.array(self.expression_store.matrix[self.target_gene_index], dtype=np.float64).reshape(-1,)
 
     def __5_get_correlations(self):
 
-        # Check if file exists
-        if os.path.exists(self.paths["correlation"]):
-            # If file exists, check if it contains correlation data for target gene
-            with open(self.paths["correlation"], "r") as infile:
-                correlation_data = json.load(infile)
+        # Look up this target + parameters in the correlation store; calculate and append if missing
+        self.correlation_store = ResultStore(self.paths["correlation"])
+        cached = self.correlation_store.get(self.__correlation_key())
 
-            if self.target_gene in correlation_data.keys():
-                self.highly_correlated_genes = correlation_data[self.target_gene]
-            else:
-                self.__5A_calculate_correlations()
+        if cached is not None:
+            self.highly_correlated_genes = [(self.full_gene_list[row], int(row), float(pearson_val)) for row, pearson_val in zip(cached["rows"], cached["pearson"])]
         else:
             self.__5A_calculate_correlations()
 
+        # Row indices of the correlated genes in the expression store
+        self.gene_row_indices = np.array([val[1] for val in self.highly_correlated_genes], dtype=np.intp)
+
         # Set gene name list
         self.gene_name_list = [val[0] for val in self.highly_correlated_genes]
 
-        # Set gene expression data, X
-        self.gene_expression_data = self.gene_expression_df.loc[self.gene_name_list]
-
         # Set number of genes
-        self.num_genes = self.gene_expression_data.shape[0]
+        self.num_genes = self.gene_row_indices.shape[0]
+
+        # Drop the previous target's deferred results (for_target copies them from the shared handler)
+        for _, names, needs_target in DataHandler.LAZY_STAGES:
+            if needs_target:
+                for name in names:
+                    self.__dict__.pop(name, None)
 
         # Set number of agents
         if self.scale_num_agents:
             self.num_agents = int(self.num_genes * 0.10) # Set the num agents to 1/10th the number of genes
 
-    def __5B_write_correlation_data(self):
-        # Check if file exists
-        if os.path.exists(self.paths["correlation"]):
-            # If file exists, open and read in data, then append and write
-            with open(self.paths["correlation"], "r") as infile:
-                correlation_data = json.load(infile)
+    def __5D_setup_importance_layout(self):
+        """
+            Layout of the importance vectors: genes, then the covariate groups actually encoded (in FEATURES order)
+        """
+        self.importance_layout = ImportanceLayout(self.gene_name_list, covariate_groups(self.features, self.encoding_sizes))
 
-            correlation_data[self.target_gene] = self.highly_correlated_genes
+    def __5E_load_expression_rows(self):
+        """
+            Contiguous float32 copy of the correlated genes (genes x samples): row j is column j of X.
+            X for any gene subset is gathered from it into one reusable buffer sized for all genes + covariates
+        """
+        # The store is float32, so the row gather is the only copy
+        self.expression_matrix = np.ascontiguousarray(self.expression_store.matrix[self.gene_row_indices], dtype=np.float32)
+        self.gene_expression_data = self.expression_matrix     # X
+        self.X_buffer = np.empty(self.encoded_covariates.shape[0] * (self.num_genes + self.encoded_covariates.shape[1]), dtype=np.float32)
 
-        else:
-            write_data = {self.target_gene : self.highly_correlated_genes}
-            with open(self.paths["correlation"], "w") as outfile:
-                json.dump(write_data, outfile)
+    def __5C_setup_gram_matrix(self):
+        """
+            Precompute Z^T Z, Z^T y and y^T y for Z = [correlated genes | encoded covariates] with standardized columns
+            and y centered, so a ridge fit on any gene subset only needs the matching sub-blocks
+        """
+        Z = np.concatenate([self.expression_matrix.T, self.encoded_covariates], axis=1).astype(np.float64)
+        Z -= Z.mean(axis=0)
+        scale = Z.std(axis=0)
+        Z /= np.where(scale > 0, scale, 1.0)
+
+        y = self.target_gene_data - np.mean(self.target_gene_data)
+
+        self.num_samples = Z.shape[0]
+        self.gram_matrix = np.dot(Z.T, Z)
+        self.gram_target = np.dot(Z.T, y)
+        self.gram_target_sum_squares = float(np.dot(y, y))
+
+    def __correlation_key(self):
+        """
+            Everything that determines the correlated gene set for the current target
+        """
+        return {
+            "target_gene"       : self.target_gene,
+            "num_subset_genes"  : self.num_subset_genes or None,
+            "subset_seed"       : self.random_streams.seed if self.num_subset_genes else None,
+            "percentiles"       : self.percentile_bounds,
+            "fingerprint"       : self.expression_store.fingerprint
+        }
+
+    def __5B_write_correlation_data(self):
+        # Append-only write of a compact binary entry; other targets' entries are never read or rewritten
+        self.correlation_store.put(
+            self.__correlation_key(),
+            rows=np.array([val[1] for val in self.highly_correlated_genes], dtype=np.int32),
+            pearson=np.array([val[2] for val in self.highly_correlated_genes], dtype=np.float64)
+        )
 
     def __5A_calculate_correlations(self):
         """
@@ -321,60 +474,27 @@ class DataHandler(object):
         # Calculate the Pearson correlation coefficients between each x_i in X and the target gene
         # -------------------------------------------------------------------------------------------
 
-        # Check for subset of genes
-        subset_of_genes = np.random.choice(self.full_gene_list, self.num_subset_genes) if self.num_subset_genes else self.full_gene_list
-
-        gene_correlation_data = []
-        for gene_i, gene_name in enumerate(subset_of_genes):
-
-            # Skip if current gene is target
-            if gene_name == self.target_gene:
-                continue
-
-            x_i = list(self.gene_expression_df.loc[gene_name])
-
-            # Calculate pearson correlation coefficient
-            pearson_val = stats.pearsonr(x_i, y)[0] # Take first element: correlation coefficient. Second element is probability
-
-            # Catch nan values and do not store these: DEBUG later
-            if not np.isnan(pearson_val):
-                # Store a tuple of the gene name and its pearson corr coeff
-                gene_correlation_data.append((gene_name, gene_i, pearson_val))
+        # Check for subset of genes (row indices into the full gene list, drawn without replacement)
+        num_total_genes = len(self.full_gene_list)
+        if self.num_subset_genes:
+            subset_rng = self.random_streams.generator(SUBSET_STREAM)
+            subset_indices = np.sort(subset_rng.choice(num_total_genes, min(self.num_subset_genes, num_total_genes), replace=False))
+        else:
+            subset_indices = np.arange(num_total_genes)
 
-            else:
-                try:
-                    pearson_val = 0.0
-                    gene_correlation_data.append((gene_name, gene_i, pearson_val))
-                except:
-                    print("Fail again.")
+        # Skip the target gene itself
+        subset_indices = subset_indices[subset_indices != self.target_gene_index]
 
-            sys.stdout.write("\r Gene {} / {}".format(gene_i+1, len(subset_of_genes)))
-            sys.stdout.flush()
-        # -------------------------------------------------------------------------------------------
-
-        # Calculate top and bottom percentiles
-        # -------------------------------------------------------------------------------------------
-        # Pearson_corr_coeff_values = np.array(gene_correlation_data)[:,2]
-        Pearson_corr_coeff_values = [val[2] for val in gene_correlation_data]
-        try:
-            top_percentile = np.percentile(Pearson_corr_coeff_values, self.percentile_bounds["top"])
-            bottom_percentile = np.percentile(Pearson_corr_coeff_values, self.percentile_bounds["bottom"])
-        except:
-            print("\nERROR!")
-            print("Pearson_corr_coeff_values")
-            print(Pearson_corr_coeff_values)
-            print("\n")
-            print("self.percentile_bounds")
-            print(self.percentile_bounds)
+        # Chunked, vectorized coefficients; zero-variance genes get 0.0
+        pearson_values = pearson_correlations(self.expression_store.matrix, y, row_indices=subset_indices)
+        print("{} genes screened.".format(subset_indices.shape[0]))
         # -------------------------------------------------------------------------------------------
 
         # Calculate the list of highly correlated genes given percentile constraints
         # -------------------------------------------------------------------------------------------
-        self.highly_correlated_genes = []
-        for gene_name, gene_index, pearson_val in gene_correlation_data:
-            # Check if gene's pearson corr coeff is within a percentile - if so, store it
-            if pearson_val < bottom_percentile or pearson_val > top_percentile:
-                self.highly_correlated_genes.append((gene_name, gene_index, pearson_val))
+        selected = np.where(percentile_mask(pearson_values, self.percentile_bounds["bottom"], self.percentile_bounds["top"]))[0]
+
+        self.highly_correlated_genes = [(self.full_gene_list[subset_indices[i]], int(subset_indices[i]), float(pearson_values[i])) for i in selected]
 
         print("\n")
         print("{} highly correlated genes.".format(len(self.highly_correlated_genes)))
@@ -383,53 +503,78 @@ class DataHandler(object):
         # Write correlation data
         self.__5B_write_correlation_data()
 
+    def __baseline_key(self):
+        """
+            Everything that determines the baseline scores for the current target and correlated gene set
+        """
+        return {
+            "target_gene"       : self.target_gene,
+            "gene_set"          : hashlib.sha1(self.gene_row_indices.astype(np.int64).tobytes()).hexdigest(),
+            "features"          : list(self.features),
+            "iterations"        : self.baseline_iterations,
+            "seed"              : self.random_streams.seed if self.seeded else None,
+            "estimator"         : {"name" : "RandomForestRegressor", "oob_score" : True, "sklearn" : importlib.metadata.version("scikit-learn")},
+            "fingerprint"       : self.expression_store.fingerprint
+        }
+
     def __6_calculate_baseline(self):
-        print("Calculating baseline...")
-        # self.
-        X, y = self.get_expression_levels([i for i in range(self.num_genes)])
+        # Look up this target + gene set in the baseline store; fit and append if missing
+        self.baseline_store = ResultStore(self.paths["baseline"])
+        cached = self.baseline_store.get(self.__baseline_key())
 
-        baseline_errors = []
-        for i in range(self.baseline_iterations):
-            baseline_reg = RandomForestRegressor(oob_score=True)
-            baseline_reg.fit(X, y)
-            baseline_error = baseline_reg.oob_score_
-            baseline_errors.append(baseline_error)
+        if cached is not None:
+            print("Loading baseline...")
+            self.baseline_errors = cached["scores"]
+        else:
+            print("Calculating baseline...")
+            self.__6A_fit_baseline()
 
-        self.baseline_error = np.mean(baseline_errors)
+        self.baseline_error = float(np.mean(self.baseline_errors))
+        self.baseline_std = float(np.std(self.baseline_errors))
 
         print("Baseline error: {}".format(self.baseline_error))
         print("\n")
 
-    def get_expression_levels(self, active_gene_indices):
+    def __6A_fit_baseline(self):
         """
-            Get the X, y for regression
+            Fit self.baseline_iterations forests on all correlated genes + covariates; the trees of each forest are built on
+            baseline_n_jobs cores. Scores are written to the baseline store.
         """
-        expression_data = self.gene_expression_data.iloc[active_gene_indices].T
+        from sklearn.ensemble import RandomForestRegressor         # only needed when the baseline is not cached
 
-        encoded_column_data = []
-        for col_data in np.array(self.selected_columns_df):
-            encoded_data = self.__encode_data(col_data)
-            encoded_column_data.append(encoded_data)
+        X, y = self.get_expression_levels(np.arange(self.num_genes))
 
-        encoded_column_data = np.array(encoded_column_data)
+        baseline_errors = []
+        for i in range(self.baseline_iterations):
+            random_state = self.random_streams.integer_seed(BASELINE_STREAM, i) if self.seeded else None
+            baseline_reg = RandomForestRegressor(oob_score=True, n_jobs=self.baseline_n_jobs, random_state=random_state)
+            baseline_reg.fit(X, y)
+            baseline_errors.append(baseline_reg.oob_score_)
+        self.baseline_errors = np.array(baseline_errors, dtype=np.float64)
+
+        self.baseline_store.put(
+            self.__baseline_key(),
+            scores=self.baseline_errors,
+            mean=np.mean(self.baseline_errors),
+            std=np.std(self.baseline_errors)
+        )
 
-        X = np.concatenate([expression_data, encoded_column_data], axis=1)
+    def get_expression_levels(self, active_gene_indices):
+        """
+            Get the X, y for regression.
+            X is a view into a reused buffer: fit on it before calling get_expression_levels again.
+        """
+        X = gather_expression_levels(self.expression_matrix, self.encoded_covariates, active_gene_indices, self.X_buffer)
         y = self.target_gene_data
 
         return X, y
 
-    def __encode_data(self, col_data):
+    def export_arrays(self):
         """
-            Encode the features using 1hot encoding setup in step 2
+            Plain NumPy arrays of everything get_expression_levels needs, for sharing with evaluation worker processes
         """
-        encoded_values = []
-        for val, feature_raw in zip(col_data, self.features):
-            feature = feature_raw.split("_")[0]
-            encoded_val = self.encoding_lookups[feature](val)
-
-            if type(encoded_val) is type([]):
-                encoded_values += encoded_val
-            else:
-                encoded_values.append(encoded_val)
-
-        return encoded_values
+        return {
+            "expression"    : self.expression_matrix,
+            "covariates"    : self.encoded_covariates,
+            "target"        : np.ascontiguousarray(self.target_gene_data, dtype=np.float64)
+        }
@@ -0,0 +1,358 @@
+import os
+import time
+import json
+import base64
+import socket
+import struct
+import hashlib
+import threading
+import collections
+import numpy as np
+
+from modules.FitnessEvaluator import evaluate_position
+from modules.DataHandler import encode_covariates
+from modules.ExpressionStore import ExpressionStore, read_metadata
+from modules.ParallelEvaluator import SharedExpressionData
+from modules.Instrumentation import PROFILER
+from modules.Position import PackedPosition
+from modules.FeatureImportance import covariate_groups
+
+# Every message is a 4-byte big-endian length followed by a UTF-8 JSON object with a "type" field
+HEADER = struct.Struct(">I")
+
+
+def send_message(sock, message):
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+def _recv_exactly(sock, num_bytes):
+    chunks = []
+    while num_bytes > 0:
+        chunk = sock.recv(num_bytes)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock):
+    """
+        Next message from sock, or None once the connection is closed
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+
+    payload = _recv_exactly(sock, HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+
+    return json.loads(payload.decode("utf-8"))
+
+def encode_position(position):
+    return base64.b64encode(position.key()).decode("ascii")
+
+def decode_position(encoded, num_genes):
+    return PackedPosition(np.frombuffer(base64.b64decode(encoded), dtype=np.uint8), num_genes)
+
+def encode_importances(importances):
+    return base64.b64encode(np.asarray(importances, dtype="<f4").tobytes()).decode("ascii")
+
+def decode_importances(encoded):
+    return np.frombuffer(base64.b64decode(encoded), dtype="<f4").astype(np.float32)
+
+
+class _WorkerConnection(object):
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.send_lock = threading.Lock()
+        self.last_seen = time.time()
+        self.ready = False
+        self.task_id = None             # task currently running on this worker
+        self.alive = True
+
+    def send(self, message):
+        with self.send_lock:
+            send_message(self.sock, message)
+
+
+class DistributedEvaluator(object):
+    """
+        Coordinator side of multi-node evaluation.
+        Listens on address for evaluation workers (worker.py), which may join or leave at any time during a run.
+        Each worker is sent the run setup once (dataset fingerprint, target, correlated gene rows, covariate encoding),
+        then receives packed position bitmasks and returns (error, importance vector).
+        Workers send heartbeats while busy; a worker that misses heartbeat_timeout is dropped and its task reassigned,
+        and a task running longer than task_timeout is handed to another idle worker (the first result to arrive wins).
+        Same evaluate / close interface as ParallelEvaluator.
+    """
+    def __init__(self, data, address, forest_params=None, task_timeout=600.0, heartbeat_timeout=30.0):
+        self.address = address
+        self.task_timeout = task_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.num_genes = data.num_genes
+
+        # Forests on workers default to a single thread; run one worker process per core instead
+        forest_params = dict(forest_params or {})
+        forest_params.setdefault("n_jobs", 1)
+
+        self.setup = {
+            "type"              : "setup",
+            "fingerprint"       : data.expression_store.fingerprint,
+            "target_row"        : int(data.target_gene_index),
+            "gene_rows"         : [int(row) for row in data.gene_row_indices],
+            "gene_name_list"    : list(data.gene_name_list),
+            "features"          : list(data.features),
+            "categories"        : data.covariate_categories,
+            "covariate_groups"  : covariate_groups(data.features, data.encoding_sizes),
+            "forest_params"     : forest_params
+        }
+        self.setup["setup_id"] = hashlib.sha1(json.dumps(self.setup, sort_keys=True).encode("utf-8")).hexdigest()
+
+        self.condition = threading.Condition()
+        self.workers = []
+        self.next_task_id = 0
+        self.pending = collections.deque()          # task ids waiting for a worker
+        self.tasks = {}                             # task id -> {"message", "started", "result"}
+
+        self.server = socket.create_server(address, reuse_port=False)
+        self.server.settimeout(1.0)
+        self.closed = False
+        self.accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.accept_thread.start()
+        print("Coordinator listening on {}:{}".format(*self.server.getsockname()[:2]))
+
+    # Connection handling (background threads)
+    # -----------------------------------------------------------------------------------------------
+    def _accept_loop(self):
+        while not self.closed:
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker = _WorkerConnection(sock, address)
+            with self.condition:
+                self.workers.append(worker)
+            threading.Thread(target=self._reader_loop, args=(worker,), daemon=True).start()
+
+    def _reader_loop(self, worker):
+        try:
+            while True:
+                message = recv_message(worker.sock)
+                if message is None:
+                    break
+
+                with self.condition:
+                    worker.last_seen = time.time()
+
+                    if message["type"] == "hello":
+                        if message["fingerprint"] != self.setup["fingerprint"]:
+                            print("Rejecting worker {}: dataset fingerprint mismatch".format(worker.address))
+                            break
+                        worker.send(self.setup)
+
+                    elif message["type"] == "ready":
+                        worker.ready = message["setup_id"] == self.setup["setup_id"]
+                        print("Worker {} ready ({} workers)".format(worker.address, self._num_ready()))
+
+                    elif message["type"] == "result":
+                        PROFILER.merge(message.get("profile"))
+                        task = self.tasks.get(message["task_id"])
+                        if task is not None and task["result"] is None:
+                            task["result"] = (message["error"], decode_importances(message["importances"]))
+                        worker.task_id = None
+
+                    self.condition.notify_all()
+        except (OSError, ValueError):
+            pass
+
+        with self.condition:
+            self._drop_worker(worker)
+            self.condition.notify_all()
+
+    def _drop_worker(self, worker):
+        """
+            Forget a worker and put its unfinished task back at the front of the queue. Caller holds the lock.
+        """
+        if not worker.alive:
+            return
+
+        worker.alive = False
+        if worker in self.workers:
+            self.workers.remove(worker)
+
+        task = self.tasks.get(worker.task_id)
+        if task is not None and task["result"] is None and worker.task_id not in self.pending:
+            task["started"] = None
+            self.pending.appendleft(worker.task_id)
+        worker.task_id = None
+
+        try:
+            worker.sock.close()
+        except OSError:
+            pass
+
+        print("Worker {} dropped ({} workers)".format(worker.address, self._num_ready()))
+    # -----------------------------------------------------------------------------------------------
+
+    def _num_ready(self):
+        return sum(1 for worker in self.workers if worker.ready)
+
+    def _check_workers(self, now):
+        """
+            Drop silent workers and requeue tasks that exceeded the timeout. Caller holds the lock.
+        """
+        for worker in list(self.workers):
+            if now - worker.last_seen > self.heartbeat_timeout:
+                self._drop_worker(worker)
+
+        for task_id, task in self.tasks.items():
+            if task["result"] is None and task["started"] is not None and now - task["started"] > self.task_timeout and task_id not in self.pending:
+                print("Task {} timed out; reassigning".format(task_id))
+                task["started"] = None
+                self.pending.appendleft(task_id)
+
+    def _dispatch(self, now):
+        """
+            Hand pending tasks to idle, ready workers. Caller holds the lock.
+        """
+        for worker in self.workers:
+            if not self.pending:
+                break
+            if not worker.ready or worker.task_id is not None:
+                continue
+
+            task_id = self.pending.popleft()
+            if self.tasks[task_id]["result"] is not None:
+                continue
+
+            try:
+                worker.send(self.tasks[task_id]["message"])
+            except OSError:
+                self.pending.appendleft(task_id)
+                self._drop_worker(worker)
+                continue
+
+            worker.task_id = task_id
+            self.tasks[task_id]["started"] = now
+
+    def evaluate(self, positions, forest_params=None):
+        """
+            Evaluate a list of positions on the connected workers; results are returned in the same order as positions
+        """
+        with self.condition:
+            task_ids = []
+            for position in positions:
+                task_id = self.next_task_id
+                self.next_task_id += 1
+                self.tasks[task_id] = {
+                    "message"   : {"type" : "task", "task_id" : task_id, "position" : encode_position(position), "forest_params" : forest_params or {}},
+                    "started"   : None,
+                    "result"    : None
+                }
+                self.pending.append(task_id)
+                task_ids.append(task_id)
+
+            last_warning = time.time()
+            while any(self.tasks[task_id]["result"] is None for task_id in task_ids):
+                now = time.time()
+                self._check_workers(now)
+                self._dispatch(now)
+
+                if not self.workers and now - last_warning > 10.0:
+                    print("Waiting for evaluation workers on {}:{}...".format(*self.server.getsockname()[:2]))
+                    last_warning = now
+
+                self.condition.wait(timeout=1.0)
+
+            return [self.tasks.pop(task_id)["result"] for task_id in task_ids]
+
+    def close(self, shutdown_workers=True):
+        self.closed = True
+        with self.condition:
+            for worker in list(self.workers):
+                if shutdown_workers:
+                    try:
+                        worker.send({"type" : "shutdown"})
+                    except OSError:
+                        pass
+                self._drop_worker(worker)
+        self.server.close()
+
+
+def run_worker(host, port, data_dir, heartbeat_interval=5.0, retry_interval=2.0):
+    """
+        Evaluation worker: preloads the expression store from data_dir, connects to the coordinator and
+        evaluates tasks until told to shut down. Data views are kept per setup, so a worker can serve several runs.
+    """
+    store = ExpressionStore(os.path.join(data_dir, "expression_store"))
+    columns_metadata = read_metadata(store.paths["columns_metadata"])
+    views = {}
+
+    # Connect, retrying until the coordinator is up
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError:
+            time.sleep(retry_interval)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    send_lock = threading.Lock()
+    stop = threading.Event()
+
+    def send(message):
+        with send_lock:
+            send_message(sock, message)
+
+    def heartbeat_loop():
+        while not stop.wait(heartbeat_interval):
+            try:
+                send({"type" : "heartbeat"})
+            except OSError:
+                break
+
+    threading.Thread(target=heartbeat_loop, daemon=True).start()
+    send({"type" : "hello", "fingerprint" : store.fingerprint})
+    print("Connected to coordinator {}:{}".format(host, port))
+
+    view = None
+    try:
+        while True:
+            message = recv_message(sock)
+            if message is None or message["type"] == "shutdown":
+                break
+
+            if message["type"] == "setup":
+                if message["setup_id"] not in views:
+                    features = message["features"]
+                    covariates = encode_covariates(columns_metadata, features, message["categories"])
+                    views[message["setup_id"]] = (SharedExpressionData(
+                        np.ascontiguousarray(store.matrix[message["gene_rows"]], dtype=np.float32),
+                        covariates,
+                        np.array(store.matrix[message["target_row"]], dtype=np.float64),
+                        message["gene_name_list"],
+                        message["covariate_groups"]
+                    ), message["forest_params"])
+                view = views[message["setup_id"]]
+                send({"type" : "ready", "setup_id" : message["setup_id"]})
+
+            elif message["type"] == "task":
+                data, forest_params = view
+                position = decode_position(message["position"], data.num_genes)
+                error, importances = evaluate_position(data, position, dict(forest_params, **message["forest_params"]))
+                send({
+                    "type"          : "result",
+                    "task_id"       : message["task_id"],
+                    "error"         : float(error),
+                    "importances"   : encode_importances(importances),
+                    "profile"       : PROFILER.drain()
+                })
+    finally:
+        stop.set()
+        sock.close()
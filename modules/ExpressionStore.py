@@ -0,0 +1,157 @@
+import os
+import sys
+import csv
+import json
+import shutil
+import hashlib
+import zipfile
+import argparse
+import numpy as np
+
+EXPRESSION_FILE = "expression.f32"
+INDEX_FILE = "genes.json"
+META_FILE = "meta.json"
+METADATA_FILES = ["columns_metadata.csv", "rows_metadata.csv"]
+
+
+def _open_source(source, file_name):
+    """
+        Open file_name from either the genes_matrix_csv.zip archive or an extracted genes_matrix_csv directory
+    """
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        members = [name for name in archive.namelist() if os.path.basename(name) == file_name]
+        if not members:
+            raise IOError("{} not found in {}".format(file_name, source))
+        return archive.open(members[0])
+
+    return open(os.path.join(source, file_name), "rb")
+
+def read_metadata(path, columns=None):
+    """
+        Columns of a metadata CSV (all of them, or only those named in columns) as {name : array of str}.
+        Uses the csv module rather than pandas, so evaluation workers that only need the sample covariates do not import pandas.
+    """
+    with open(path, "r", newline="") as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+        rows = list(reader)
+
+    return {name : np.array([row[column_i] for row in rows]) for column_i, name in enumerate(header) if columns is None or name in columns}
+
+def ingest(source, store_dir, chunk_size=2000):
+    """
+        One-time conversion of expression_matrix.csv (streamed in chunks, straight out of the zip if given one)
+        into a float32 (genes x samples) binary file that can be memory mapped, plus a gene symbol -> row index.
+        meta.json is written last, so a store is only considered complete once it exists.
+    """
+    import pandas as pd             # only needed for the one-time ingest
+
+    print("Ingesting {} into {}...".format(source, store_dir))
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+
+    # Metadata CSVs are small: copy them next to the binary matrix
+    # -----------------------------------------------------------------------------------------------
+    for file_name in METADATA_FILES:
+        with _open_source(source, file_name) as infile, open(os.path.join(store_dir, file_name), "wb") as outfile:
+            shutil.copyfileobj(infile, outfile)
+
+    gene_symbols = list(pd.read_csv(os.path.join(store_dir, "rows_metadata.csv"))["gene_symbol"].astype(str))
+    # -----------------------------------------------------------------------------------------------
+
+    # Stream the expression matrix chunk by chunk into the binary file
+    # -----------------------------------------------------------------------------------------------
+    fingerprint = hashlib.sha1()
+    num_genes = 0
+    num_samples = None
+    tmp_path = os.path.join(store_dir, EXPRESSION_FILE + ".tmp")
+
+    with _open_source(source, "expression_matrix.csv") as infile, open(tmp_path, "wb") as outfile:
+        for chunk in pd.read_csv(infile, header=None, index_col=0, chunksize=chunk_size):
+            values = np.ascontiguousarray(chunk.values, dtype=np.float32)
+            num_samples = values.shape[1]
+            num_genes += values.shape[0]
+
+            outfile.write(values.tobytes())
+            fingerprint.update(values.tobytes())
+
+            sys.stdout.write("\r Gene {} / {}".format(num_genes, len(gene_symbols)))
+            sys.stdout.flush()
+    print("")
+
+    if num_genes != len(gene_symbols):
+        raise ValueError("expression_matrix.csv has {} rows but rows_metadata.csv has {}".format(num_genes, len(gene_symbols)))
+
+    os.replace(tmp_path, os.path.join(store_dir, EXPRESSION_FILE))
+    # -----------------------------------------------------------------------------------------------
+
+    # Gene symbol -> row index (first occurrence, as list.index would return)
+    # -----------------------------------------------------------------------------------------------
+    gene_index = {}
+    for row_i, gene_symbol in enumerate(gene_symbols):
+        gene_index.setdefault(gene_symbol, row_i)
+
+    with open(os.path.join(store_dir, INDEX_FILE), "w") as outfile:
+        json.dump({"gene_symbols" : gene_symbols, "gene_index" : gene_index}, outfile)
+    # -----------------------------------------------------------------------------------------------
+
+    meta = {
+        "num_genes"     : num_genes,
+        "num_samples"   : num_samples,
+        "dtype"         : "float32",
+        "fingerprint"   : fingerprint.hexdigest()
+    }
+    with open(os.path.join(store_dir, META_FILE + ".tmp"), "w") as outfile:
+        json.dump(meta, outfile)
+    os.replace(os.path.join(store_dir, META_FILE + ".tmp"), os.path.join(store_dir, META_FILE))
+
+    print("Ingest complete: {} genes x {} samples.".format(num_genes, num_samples))
+
+
+class ExpressionStore(object):
+    """
+        Read-only, memory-mapped view of an ingested expression matrix.
+        Opening is cheap: only the rows that are actually indexed get paged in from disk.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+        with open(os.path.join(store_dir, META_FILE), "r") as infile:
+            self.meta = json.load(infile)
+
+        with open(os.path.join(store_dir, INDEX_FILE), "r") as infile:
+            index = json.load(infile)
+
+        self.gene_symbols = index["gene_symbols"]
+        self.gene_index = index["gene_index"]
+        self.fingerprint = self.meta["fingerprint"]
+        self.shape = (self.meta["num_genes"], self.meta["num_samples"])
+
+        # genes x samples
+        self.matrix = np.memmap(os.path.join(store_dir, EXPRESSION_FILE), dtype=np.float32, mode="r", shape=self.shape)
+
+        self.paths = {file_name.split(".")[0] : os.path.join(store_dir, file_name) for file_name in METADATA_FILES}
+
+    @staticmethod
+    def exists(store_dir):
+        return os.path.exists(os.path.join(store_dir, META_FILE))
+
+    def row_index(self, gene_symbol):
+        return self.gene_index[gene_symbol]
+
+    def rows(self, gene_symbols):
+        """
+            Expression of the given genes as an in-memory float32 (genes x samples) array
+        """
+        return np.asarray(self.matrix[[self.gene_index[gene_symbol] for gene_symbol in gene_symbols]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest genes_matrix_csv(.zip) into a memory-mappable expression store")
+    parser.add_argument("source", help="genes_matrix_csv.zip or the extracted genes_matrix_csv directory")
+    parser.add_argument("store_dir", help="output directory, e.g. data/expression_store")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="CSV rows per chunk")
+    args = parser.parse_args()
+
+    ingest(args.source, args.store_dir, args.chunk_size)
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def covariate_groups(features, encoding_sizes):
+    """
+        (group name, encoded width) of each one-hot block of the encoded covariates, in X column order.
+        Only the selected features are encoded (see encode_covariates), so this is not simply encoding_sizes.
+    """
+    groups = []
+    for feature_raw in features:
+        feature = feature_raw.split("_")[0]
+        groups.append((feature, encoding_sizes[feature]))
+    return groups
+
+
+class ImportanceLayout(object):
+    """
+        Fixed layout of an importance vector: one float32 entry per correlated gene, then one per covariate group.
+        Genes that were not active in an evaluation are NaN. Covariate group sums come from a single np.add.reduceat
+        over the covariate columns of the regressor's importances, with segment starts precomputed from the group widths.
+    """
+    def __init__(self, gene_name_list, groups):
+        self.num_genes = len(gene_name_list)
+        self.group_names = [name for name, _ in groups]
+        self.names = list(gene_name_list) + self.group_names
+        self.size = len(self.names)
+
+        widths = np.array([width for _, width in groups], dtype=np.intp)
+        self.group_starts = np.concatenate([[0], np.cumsum(widths)[:-1]]).astype(np.intp)
+        self.num_covariate_columns = int(widths.sum())
+
+    def empty(self):
+        return np.full(self.size, np.nan, dtype=np.float32)
+
+    def vector(self, importances, active_gene_indices):
+        """
+            Importance vector of one fit; importances are in X column order (active genes, then encoded covariates)
+        """
+        out = self.empty()
+        num_active = active_gene_indices.shape[0]
+        out[active_gene_indices] = importances[:num_active]
+        if self.group_names:
+            out[self.num_genes:] = np.add.reduceat(importances[num_active:num_active + self.num_covariate_columns], self.group_starts)
+        return out
+
+
+class ImportanceAccumulator(object):
+    """
+        Running mean / variance (Welford) of every entry of the importance vectors of all evaluations.
+        A gene's statistics only cover the evaluations in which it was active; frequency is the fraction of evaluations
+        that selected it. Updates are in-place array operations, so accumulating costs nothing per gene name.
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.num_evaluations = 0
+        self.count = np.zeros(len(self.names), dtype=np.int64)
+        self.mean = np.zeros(len(self.names))
+        self.m2 = np.zeros(len(self.names))
+
+    def add(self, importances):
+        active = np.flatnonzero(~np.isnan(importances))
+        values = importances[active].astype(np.float64)
+
+        self.num_evaluations += 1
+        self.count[active] += 1
+        delta = values - self.mean[active]
+        self.mean[active] += delta / self.count[active]
+        self.m2[active] += delta * (values - self.mean[active])
+
+    def variance(self):
+        return np.divide(self.m2, self.count - 1, out=np.zeros_like(self.m2), where=self.count > 1)
+
+    def frequency(self):
+        return self.count / float(max(self.num_evaluations, 1))
+
+    def ranking(self, top_k=None, min_count=1):
+        """
+            Consensus ranking: [(name, mean, std, frequency)] by mean importance, over entries seen at least min_count times
+        """
+        std = np.sqrt(self.variance())
+        frequency = self.frequency()
+        candidates = np.flatnonzero(self.count >= min_count)
+        order = candidates[np.argsort(-self.mean[candidates], kind="stable")][:top_k]
+        return [(self.names[i], float(self.mean[i]), float(std[i]), float(frequency[i])) for i in order]
+
+    def save(self, path):
+        np.savez(path, names=np.array(self.names), num_evaluations=self.num_evaluations, count=self.count, mean=self.mean,
+                 std=np.sqrt(self.variance()), frequency=self.frequency())
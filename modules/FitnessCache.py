@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+class FitnessCache(object):
+    """
+        Bounded LRU cache of agent fitness, keyed by the bit-packed gene selection of a position.
+        Each entry holds the (error, full feature importances) pair produced by evaluating that position.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        # Counters since the last call to self.epoch_stats()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(position):
+        """
+            Packed bitmask of the active genes (a PackedPosition's bytes); 1 bit per gene instead of 8 bytes
+        """
+        return position.key()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """
+            Return the cached (error, feature importances) for key, or None. Counts a hit or a miss.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        # Mark as most recently used
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key]
+
+    def put(self, key, error, feature_importances):
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = (error, feature_importances)
+        self.entries.move_to_end(key)
+
+        # Evict the least recently used entries
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def epoch_stats(self):
+        """
+            Return the hit/miss counts accumulated since the previous call and reset them
+        """
+        stats = {
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "size"      : len(self.entries)
+        }
+        self.hits = 0
+        self.misses = 0
+        return stats
@@ -0,0 +1,237 @@
+import numpy as np
+from scipy.linalg import cholesky, solve_triangular
+from sklearn.ensemble import RandomForestRegressor
+
+from modules.Instrumentation import PROFILER, profiled
+from modules.RandomStreams import forest_random_state
+
+
+@profiled("feature_importances")
+def _calculate_feature_importances(data, feature_importances, active_gene_indices):
+    """
+        Regressor importances (X column order) as the data's fixed-layout importance vector: active genes at their
+        gene index, inactive genes NaN, and one summed entry per one-hot covariate group
+    """
+    return data.importance_layout.vector(feature_importances, active_gene_indices)
+
+@profiled("evaluation")
+def evaluate_position(data, position, forest_params=None):
+    """
+        Fit the regressor on the active genes of position (a PackedPosition).
+        Returns (error, importance vector); does not touch any agent state so results can be cached.
+        forest_params are passed through to the RandomForestRegressor (e.g., n_jobs), except "seed": the run seed that,
+        together with the position, sets the forest's random_state (see RandomStreams.forest_random_state).
+    """
+    # Get the active gene indicies (cached on the PackedPosition)
+    active_gene_indices = position.active_indices
+
+    # If all turned off, set error very high
+    if active_gene_indices.shape[0] == 0:
+        return 500, data.importance_layout.empty()
+
+    # Get X, y from data handler for active genes only
+    X, y = data.get_expression_levels(active_gene_indices)
+
+    # Instantiate random forest regressor
+    forest_params = dict(forest_params or {})
+    seed = forest_params.pop("seed", None)
+    if seed is not None:
+        forest_params["random_state"] = forest_random_state(seed, position)
+    random_forest = RandomForestRegressor(oob_score=True, **forest_params)
+
+    # Fit the regressor
+    with PROFILER.section("forest_fit"):
+        random_forest.fit(X, y)
+
+    # Obtain oob score and feature importances
+    return random_forest.oob_score_, _calculate_feature_importances(data, random_forest.feature_importances_, active_gene_indices)
+
+
+class FitnessEvaluator(object):
+    """
+        Interface for scoring a gene selection.
+        evaluate(data, position, agent_id) returns (error, importance vector) of a PackedPosition; lower error is better.
+        Evaluators with parallel = True are stateless and may be run in worker processes.
+    """
+    name = None
+    parallel = False
+
+    def evaluate(self, data, position, agent_id=None):
+        raise NotImplementedError
+
+
+class RandomForestEvaluator(FitnessEvaluator):
+    """
+        Out-of-bag score of a RandomForestRegressor fitted on the active genes and covariates
+    """
+    name = "forest"
+    parallel = True
+
+    def __init__(self, forest_params=None):
+        self.forest_params = forest_params or {}
+
+    def evaluate(self, data, position, agent_id=None):
+        return evaluate_position(data, position, self.forest_params)
+
+
+def _cholesky_rank_one_update(L, x):
+    """
+        Return the lower Cholesky factor of L L^T + x x^T in O(k^2)
+    """
+    L = L.copy()
+    x = x.copy()
+    for k in range(x.shape[0]):
+        r = np.hypot(L[k, k], x[k])
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        L[k+1:, k] = (L[k+1:, k] + s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:, k]
+    return L
+
+
+class RidgeEvaluator(FitnessEvaluator):
+    """
+        Cheap proxy fitness: ridge regression on the active genes + covariates, solved entirely from the Gram matrix
+        of the standardized correlated genes and encoded covariates that DataHandler precomputes (no raw samples are touched).
+
+        The error is the generalized cross-validation estimate of the leave-one-out mean squared error,
+            n * RSS / (n - trace(H))^2,
+        i.e. the hat-matrix shortcut with the trace of H in place of its diagonal, which is what the Gram matrix gives us.
+
+        Each agent's Cholesky factor of (G_S + alpha I) and trace((G_S + alpha I)^-1) are kept between calls. When a new position
+        differs from the agent's previous one by at most max_updates genes, the factor is updated column by column
+        (appended columns are solved in; removed columns are a rank-one update of the trailing block) in O(k^2) each,
+        instead of being refactored in O(k^3).
+    """
+    name = "ridge"
+    parallel = False
+
+    def __init__(self, alpha=1.0, max_updates=16, refactor_every=64):
+        self.alpha = alpha
+        self.max_updates = max_updates          # max genes added + removed before refactoring from scratch
+        self.refactor_every = refactor_every    # refactor after this many incremental updates to bound round-off drift
+
+        # agent_id -> {"order": Gram column of each factor row, "L": factor, "trace_inv": trace of A^-1, "updates": count}
+        self.factors = {}
+
+    def reset(self):
+        self.factors = {}
+
+    def _factorize(self, data, order):
+        A = data.gram_matrix[np.ix_(order, order)] + self.alpha * np.identity(len(order))
+        L = cholesky(A, lower=True)
+        L_inv = solve_triangular(L, np.identity(len(order)), lower=True)
+        return {"order" : list(order), "L" : L, "trace_inv" : float(np.sum(L_inv ** 2)), "updates" : 0}
+
+    def _remove(self, data, factor, column):
+        L = factor["L"]
+        p = factor["order"].index(column)
+
+        # trace(A_-p^-1) = trace(A^-1) - ||A^-1 e_p||^2 / (A^-1)_pp
+        e_p = np.zeros(L.shape[0])
+        e_p[p] = 1.0
+        w = solve_triangular(L, solve_triangular(L, e_p, lower=True), lower=True, trans="T")
+        factor["trace_inv"] -= np.dot(w, w) / w[p]
+
+        # Drop row/column p: the trailing block absorbs the removed column as a rank-one update
+        L_new = np.delete(np.delete(L, p, axis=0), p, axis=1)
+        if p < L_new.shape[0]:
+            L_new[p:, p:] = _cholesky_rank_one_update(L_new[p:, p:], L[p+1:, p])
+
+        factor["L"] = L_new
+        del factor["order"][p]
+
+    def _append(self, data, factor, column):
+        L = factor["L"]
+        a = data.gram_matrix[factor["order"], column]
+        d = data.gram_matrix[column, column] + self.alpha
+
+        l = solve_triangular(L, a, lower=True)
+        schur = d - np.dot(l, l)
+
+        # trace(A_+^-1) = trace(A^-1) + (1 + ||A^-1 a||^2) / schur
+        A_inv_a = solve_triangular(L, l, lower=True, trans="T")
+        factor["trace_inv"] += (1.0 + np.dot(A_inv_a, A_inv_a)) / schur
+
+        k = L.shape[0]
+        L_new = np.zeros((k + 1, k + 1))
+        L_new[:k, :k] = L
+        L_new[k, :k] = l
+        L_new[k, k] = np.sqrt(schur)
+
+        factor["L"] = L_new
+        factor["order"].append(column)
+
+    def _get_factor(self, data, columns, agent_id):
+        """
+            Cholesky factor for the Gram columns in columns, updated from agent_id's previous factor when cheap enough
+        """
+        previous = self.factors.get(agent_id) if agent_id is not None else None
+
+        if previous is not None:
+            previous_columns = set(previous["order"])
+            removed = previous_columns.difference(columns)
+            added = set(columns).difference(previous_columns)
+
+            if len(removed) + len(added) <= self.max_updates and previous["updates"] + len(removed) + len(added) <= self.refactor_every:
+                for column in sorted(removed):
+                    self._remove(data, previous, column)
+                for column in sorted(added):
+                    self._append(data, previous, column)
+                previous["updates"] += len(removed) + len(added)
+                return previous
+
+        factor = self._factorize(data, columns)
+        if agent_id is not None:
+            self.factors[agent_id] = factor
+        return factor
+
+    @profiled("evaluation")
+    def evaluate(self, data, position, agent_id=None):
+        # Get the active gene indicies (cached on the PackedPosition)
+        active_gene_indices = position.active_indices
+
+        # If all turned off, set error very high
+        if active_gene_indices.shape[0] == 0:
+            return 500, data.importance_layout.empty()
+
+        # Gram columns: covariates first (always present, so they are never removed from the factor), then active genes
+        num_genes = data.num_genes
+        covariate_columns = list(range(num_genes, data.gram_matrix.shape[0]))
+        columns = covariate_columns + list(active_gene_indices)
+
+        factor = self._get_factor(data, columns, agent_id)
+        order = np.array(factor["order"])
+        L = factor["L"]
+
+        # Ridge coefficients in factor order: (G_S + alpha I) beta = Z_S^T y
+        b = data.gram_target[order]
+        beta = solve_triangular(L, solve_triangular(L, b, lower=True), lower=True, trans="T")
+
+        # RSS = y'y - 2 beta'b + beta'G_S beta, with G_S beta = b - alpha beta
+        rss = max(data.gram_target_sum_squares - np.dot(beta, b) - self.alpha * np.dot(beta, beta), 0.0)
+
+        # trace(H) = trace(G_S A^-1) = k - alpha trace(A^-1)
+        n = data.num_samples
+        trace_hat = len(order) - self.alpha * factor["trace_inv"]
+        error = n * rss / max(n - trace_hat, 1.0) ** 2
+
+        # Importances: |beta| of the standardized features, in X column order (active genes, then covariates)
+        importances = np.zeros(data.gram_matrix.shape[0])
+        importances[order] = np.abs(beta)
+        x_order_importances = np.concatenate([importances[active_gene_indices], importances[num_genes:]])
+        total = np.sum(x_order_importances)
+        if total > 0:
+            x_order_importances /= total
+
+        return error, _calculate_feature_importances(data, x_order_importances, active_gene_indices)
+
+
+EVALUATORS = {
+    RandomForestEvaluator.name  : RandomForestEvaluator,
+    RidgeEvaluator.name         : RidgeEvaluator
+}
+
+def make_evaluator(name, **params):
+    return EVALUATORS[name](**params)
@@ -0,0 +1,290 @@
+import os
+import json
+import struct
+import numpy as np
+
+from modules.Instrumentation import SECTIONS, LATENCY_BUCKETS, LATENCY_SECTION
+from modules.Convergence import STOP_REASONS
+
+# File layout: MAGIC, uint32 header length, JSON header (padded to HEADER_ALIGN bytes), then one fixed-size record per epoch.
+# Records never change size, so epoch i starts at header_size + i * record_size and a crash can at most leave a
+# partial trailing record, which readers ignore.
+MAGIC = b"PSOHIST1"
+HEADER_LENGTH = struct.Struct("<I")
+HEADER_ALIGN = 64
+
+
+def _record_fields(num_agents, num_genes, num_importances, num_rungs):
+    fields = [
+        ("best_error",          "<f8",  []),
+        ("num_genes_active",    "<i4",  []),
+        ("evaluator",           "u1",   []),                            # index into header["evaluators"]
+        ("errors",              "<f4",  [num_agents]),                  # every agent's error this epoch
+        ("best_position",       "u1",   [(num_genes + 7) // 8]),        # np.packbits of the global best position
+        ("importances",         "<f4",  [num_importances]),             # in header["importance_names"] order
+        ("cache_stats",         "<i4",  [4]),                           # hits, misses, duplicates, size
+        ("epoch_seconds",       "<f4",  []),
+        ("section_seconds",     "<f4",  [len(SECTIONS)]),               # in header["sections"] order
+        ("section_calls",       "<i4",  [len(SECTIONS)]),
+        ("latency_counts",      "<i4",  [len(LATENCY_BUCKETS) + 1]),    # evaluations per header["latency_buckets"] bucket
+        ("diversity",           "<f4",  []),                            # mean pairwise Hamming distance / genes
+        ("evaluations",         "<f4",  []),                            # forest fits (full-fit equivalents)
+        ("stop_reason",         "u1",   []),                            # index into header["stop_reasons"]; set on the last epoch
+        ("epochs_saved",        "<i4",  []),
+        ("evaluations_saved",   "<f4",  [])
+    ]
+    if num_rungs:
+        fields += [
+            ("rung_sizes",          "<i4",  [num_rungs]),
+            ("evaluation_cost",     "<f4",  []),
+            ("racing_saved",        "<f4",  [])                             # evaluations saved by racing this epoch
+        ]
+    return fields
+
+def _record_dtype(fields):
+    return np.dtype([(name, dtype, tuple(shape)) for name, dtype, shape in fields])
+
+def _read_header(infile):
+    if infile.read(len(MAGIC)) != MAGIC:
+        raise ValueError("{} is not a run history log".format(infile.name))
+
+    header_length = HEADER_LENGTH.unpack(infile.read(HEADER_LENGTH.size))[0]
+    header = json.loads(infile.read(header_length).decode("utf-8"))
+    return header
+
+
+class HistoryWriter(object):
+    """
+        Append-only run history: one fixed-size binary record per epoch, flushed as soon as the epoch finishes.
+        resume_epoch keeps the first resume_epoch records of an existing log (e.g., when resuming from a checkpoint)
+        and continues after them; otherwise the log is started from scratch.
+    """
+    CACHE_STATS = ("hits", "misses", "duplicates", "size")
+
+    def __init__(self, path, num_agents, gene_name_list, covariate_names, evaluator_names, num_rungs=0, resume_epoch=None):
+        self.path = path
+        self.importance_names = list(gene_name_list) + list(covariate_names)
+        self.evaluator_names = list(evaluator_names)
+
+        fields = _record_fields(num_agents, len(gene_name_list), len(self.importance_names), num_rungs)
+        self.dtype = _record_dtype(fields)
+        header = {
+            "num_agents"        : num_agents,
+            "gene_name_list"    : list(gene_name_list),
+            "importance_names"  : self.importance_names,
+            "evaluators"        : self.evaluator_names,
+            "sections"          : list(SECTIONS),
+            "latency_buckets"   : list(LATENCY_BUCKETS),
+            "stop_reasons"      : list(STOP_REASONS),
+            "fields"            : fields
+        }
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if resume_epoch is not None and os.path.exists(path):
+            with open(path, "rb") as infile:
+                if _read_header(infile) != json.loads(json.dumps(header)):
+                    raise ValueError("History log {} was written by a different run".format(path))
+                self.header_size = HEADER_ALIGN * int(np.ceil(infile.tell() / float(HEADER_ALIGN)))
+
+            # Drop epochs written after the checkpoint
+            self.outfile = open(path, "r+b")
+            self.outfile.truncate(self.header_size + resume_epoch * self.dtype.itemsize)
+            self.outfile.seek(0, os.SEEK_END)
+        else:
+            payload = json.dumps(header).encode("utf-8")
+            prefix_size = len(MAGIC) + HEADER_LENGTH.size + len(payload)
+            self.header_size = HEADER_ALIGN * int(np.ceil(prefix_size / float(HEADER_ALIGN)))
+
+            self.outfile = open(path, "wb")
+            self.outfile.write(MAGIC + HEADER_LENGTH.pack(len(payload)) + payload + b" " * (self.header_size - prefix_size))
+            self.outfile.flush()
+
+    def append(self, best_error, best_position, errors, feature_importances, cache_stats, evaluator_name, racing_stats=None, profile=None,
+               diversity=0.0, evaluations=0.0, stop_reason="", savings=None):
+        record = np.zeros(1, dtype=self.dtype)[0]
+
+        record["best_error"] = best_error
+        record["evaluator"] = self.evaluator_names.index(evaluator_name)
+        record["errors"] = errors
+
+        # best_position is a PackedPosition (None until some agent scores an error > 0), stored as is
+        if best_position is not None:
+            record["num_genes_active"] = best_position.popcount()
+            record["best_position"] = best_position.bits
+        record["cache_stats"] = [cache_stats.get(key, 0) for key in self.CACHE_STATS]
+
+        # Importance vector in importance_names order; inactive genes (NaN) are stored as 0
+        if feature_importances is not None:
+            record["importances"] = np.nan_to_num(feature_importances)
+
+        if racing_stats is not None and "rung_sizes" in self.dtype.names:
+            record["rung_sizes"][:len(racing_stats["rung_sizes"])] = racing_stats["rung_sizes"]
+            record["evaluation_cost"] = racing_stats["evaluation_cost"]
+            record["racing_saved"] = racing_stats["evaluations_saved"]
+
+        if profile is not None:
+            record["epoch_seconds"] = profile["epoch_seconds"]
+            record["section_seconds"] = [profile["seconds"][name] for name in SECTIONS]
+            record["section_calls"] = [profile["calls"][name] for name in SECTIONS]
+            record["latency_counts"] = profile["latency"]
+
+        record["diversity"] = diversity
+        record["evaluations"] = evaluations
+        record["stop_reason"] = STOP_REASONS.index(stop_reason)
+        if savings is not None:
+            record["epochs_saved"] = savings["epochs_saved"]
+            record["evaluations_saved"] = savings["evaluations_saved"]
+
+        self.outfile.write(record.tobytes())
+        self.outfile.flush()
+
+    def append_record(self, record):
+        """
+            Write a complete record of self.dtype (e.g., built by merge_histories)
+        """
+        self.outfile.write(record.tobytes())
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+
+class HistoryReader(object):
+    """
+        Reads a log written by HistoryWriter. Records are memory-mapped, so column(name) and the per-epoch accessors
+        only touch the bytes they need instead of loading the whole run.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as infile:
+            self.header = _read_header(infile)
+            self.header_size = HEADER_ALIGN * int(np.ceil(infile.tell() / float(HEADER_ALIGN)))
+
+        self.gene_name_list = self.header["gene_name_list"]
+        self.importance_names = self.header["importance_names"]
+        self.evaluator_names = self.header["evaluators"]
+        self.sections = self.header["sections"]
+        self.num_genes = len(self.gene_name_list)
+        self.dtype = _record_dtype(self.header["fields"])
+
+        # Ignore a partially written trailing record
+        self.num_epochs = (os.path.getsize(path) - self.header_size) // self.dtype.itemsize
+        if self.num_epochs > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=self.header_size, shape=(self.num_epochs,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.num_epochs
+
+    def column(self, name):
+        """
+            One field for every epoch, e.g. column("best_error") or column("errors") (epochs x agents)
+        """
+        return np.array(self.records[name])
+
+    def positions(self, epochs=None):
+        """
+            Global best positions (epochs x genes, 0/1) for the selected epochs (all by default)
+        """
+        packed = self.records["best_position"] if epochs is None else self.records["best_position"][epochs]
+        return np.unpackbits(np.asarray(packed), axis=-1, count=self.num_genes)
+
+    def position(self, epoch_i):
+        return np.unpackbits(self.records[epoch_i]["best_position"], count=self.num_genes)
+
+    def feature_importances(self, epoch_i):
+        """
+            Global best feature importances of epoch_i as a {name : importance} dict of the nonzero entries
+        """
+        importances = self.records[epoch_i]["importances"]
+        return {self.importance_names[name_i] : float(importances[name_i]) for name_i in np.flatnonzero(importances)}
+
+    def evaluators(self):
+        return [self.evaluator_names[evaluator_i] for evaluator_i in self.records["evaluator"]]
+
+    def stop_reason(self):
+        """
+            Why the run ended and what stopping early saved; reason is "" if the run has not finished
+        """
+        if self.num_epochs == 0:
+            return {"reason" : "", "epochs_saved" : 0, "evaluations_saved" : 0.0}
+
+        record = self.records[-1]
+        return {
+            "reason"                : self.header["stop_reasons"][record["stop_reason"]],
+            "epochs_saved"          : int(record["epochs_saved"]),
+            "evaluations_saved"     : float(record["evaluations_saved"])
+        }
+
+    def profile(self, epoch_i):
+        """
+            Per-section {"seconds", "calls"} of epoch_i, with its wall time and evaluation throughput
+        """
+        record = self.records[epoch_i]
+        evaluations = int(record["section_calls"][self.sections.index(LATENCY_SECTION)])
+        return {
+            "sections"                  : {name : {"seconds" : float(record["section_seconds"][name_i]), "calls" : int(record["section_calls"][name_i])}
+                                           for name_i, name in enumerate(self.sections)},
+            "epoch_seconds"             : float(record["epoch_seconds"]),
+            "evaluations_per_second"    : evaluations / float(record["epoch_seconds"]) if record["epoch_seconds"] > 0 else 0.0,
+            "latency_counts"            : dict(zip([str(bound) for bound in self.header["latency_buckets"]] + ["+Inf"], record["latency_counts"].tolist()))
+        }
+
+    def error_stats(self):
+        """
+            Mean and standard deviation of the agent errors per epoch
+        """
+        errors = self.column("errors")
+        return {"mean" : errors.mean(axis=1), "std" : errors.std(axis=1)}
+
+
+def merge_histories(input_paths, output_path):
+    """
+        Merge the logs of concurrent swarms over the same genes (e.g., islands) into one log with all their agents.
+        Each merged epoch takes the global best of the swarm with the lowest error above 0 (the swarm's own rule), concatenates
+        the agent errors, sums cache stats, section timings and evaluations, and averages the per-swarm diversities.
+        Swarms that stopped early contribute their last epoch (errors and best) but no further time or evaluations.
+        Raises ValueError if no log has a record (e.g., every island stopped before its first epoch).
+    """
+    readers = [reader for reader in (HistoryReader(path) for path in input_paths if os.path.exists(path)) if len(reader)]
+    if not readers:
+        raise ValueError("No history records to merge in {}".format(", ".join(input_paths)))
+    first = readers[0]
+    num_rungs = first.dtype["rung_sizes"].shape[0] if "rung_sizes" in first.dtype.names else 0
+    writer = HistoryWriter(output_path, sum(reader.header["num_agents"] for reader in readers), first.gene_name_list,
+                           first.importance_names[first.num_genes:], first.evaluator_names, num_rungs)
+
+    num_epochs = max(len(reader) for reader in readers)
+    longest = max(range(len(readers)), key=lambda reader_i: len(readers[reader_i]))
+    summed = ["cache_stats", "section_seconds", "section_calls", "latency_counts", "evaluations"]
+    if num_rungs:
+        summed += ["rung_sizes", "evaluation_cost", "racing_saved"]
+
+    for epoch_i in range(num_epochs):
+        records = [reader.records[min(epoch_i, len(reader) - 1)] for reader in readers]
+        running = [record for reader, record in zip(readers, records) if epoch_i < len(reader)]
+
+        best_errors = [float(record["best_error"]) for record in records]
+        candidates = [record_i for record_i, error in enumerate(best_errors) if error > 0]
+        best = min(candidates, key=best_errors.__getitem__) if candidates else 0
+
+        record = np.zeros(1, dtype=writer.dtype)[0]
+        for name in ("best_error", "num_genes_active", "evaluator", "best_position", "importances"):
+            record[name] = records[best][name]
+        record["errors"] = np.concatenate([source["errors"] for source in records])
+        for name in summed:
+            record[name] = np.sum([source[name] for source in running], axis=0)
+        record["epoch_seconds"] = max(source["epoch_seconds"] for source in running)
+        record["diversity"] = np.mean([source["diversity"] for source in records])
+
+        if epoch_i == num_epochs - 1:
+            for name in ("stop_reason", "epochs_saved", "evaluations_saved"):
+                record[name] = records[longest][name]
+
+        writer.append_record(record)
+
+    writer.close()
@@ -0,0 +1,180 @@
+import os
+import time
+import bisect
+import functools
+import threading
+
+# Instrumented hot-path sections, in the order they are stored in the run history
+SECTIONS = ("evaluation", "get_expression_levels", "forest_fit", "feature_importances", "global_best", "velocity_update", "position_update")
+
+# Upper bounds (seconds) of the per-evaluation latency histogram buckets; the last bucket counts everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LATENCY_SECTION = "evaluation"
+
+
+class _Section(object):
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class _NoSection(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Profiler(object):
+    """
+        Accumulates wall time and call counts per section, plus a latency histogram of LATENCY_SECTION.
+        A section costs two perf_counter calls when enabled and nothing when disabled.
+        Worker processes have their own profiler; they drain() it after each task and the parent merge()s the snapshot.
+        Updates hold a lock, since remote worker snapshots are merged from the coordinator's connection threads while the
+        main thread is timing its own sections.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._no_section = _NoSection()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.seconds = dict.fromkeys(SECTIONS, 0.0)
+        self.calls = dict.fromkeys(SECTIONS, 0)
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def section(self, name):
+        """
+            with profiler.section("forest_fit"): ...
+        """
+        return _Section(self, name) if self.enabled else self._no_section
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+            if name == LATENCY_SECTION:
+                self.latency[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def drain(self):
+        """
+            Snapshot of everything accumulated since the last drain, then reset
+        """
+        with self._lock:
+            snapshot = {"seconds" : self.seconds, "calls" : self.calls, "latency" : self.latency}
+            self._reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        if not self.enabled or not snapshot:
+            return
+
+        with self._lock:
+            for name in SECTIONS:
+                self.seconds[name] += snapshot["seconds"][name]
+                self.calls[name] += snapshot["calls"][name]
+            self.latency = [count + other for count, other in zip(self.latency, snapshot["latency"])]
+
+    def epoch_summary(self, epoch_seconds):
+        """
+            drain() plus the epoch's wall time and evaluation throughput
+        """
+        summary = self.drain()
+        summary["epoch_seconds"] = epoch_seconds
+        summary["evaluations_per_second"] = summary["calls"][LATENCY_SECTION] / epoch_seconds if epoch_seconds > 0 else 0.0
+        return summary
+
+
+# Process-wide profiler used by the instrumented code
+PROFILER = Profiler()
+
+# A process forked while another thread held the lock would inherit it locked
+os.register_at_fork(after_in_child=lambda: setattr(PROFILER, "_lock", threading.Lock()))
+
+def profiled(name):
+    """
+        Decorator timing every call of the function as section name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with PROFILER.section(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PrometheusExporter(object):
+    """
+        Writes run metrics in the Prometheus text exposition format for node_exporter's textfile collector.
+        Section times and the latency histogram are cumulative over the run; the rest are gauges for the latest epoch.
+        The file is replaced atomically, so the collector never reads a partial write.
+    """
+    def __init__(self, path, labels=None):
+        self.path = path
+        self.labels = labels or {}
+        self.totals = Profiler()
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(key, str(val).replace('"', '\\"')) for key, val in sorted(labels.items())) + "}"
+
+    def write(self, epoch_i, best_error, summary):
+        self.totals.merge(summary)
+
+        lines = [
+            "# HELP pso_section_seconds_total Wall time spent in each instrumented section.",
+            "# TYPE pso_section_seconds_total counter"
+        ]
+        lines += ["pso_section_seconds_total{} {}".format(self._labels(section=name), self.totals.seconds[name]) for name in SECTIONS]
+
+        lines += [
+            "# HELP pso_section_calls_total Calls of each instrumented section.",
+            "# TYPE pso_section_calls_total counter"
+        ]
+        lines += ["pso_section_calls_total{} {}".format(self._labels(section=name), self.totals.calls[name]) for name in SECTIONS]
+
+        lines += [
+            "# HELP pso_evaluation_latency_seconds Latency of single fitness evaluations.",
+            "# TYPE pso_evaluation_latency_seconds histogram"
+        ]
+        cumulative = 0
+        for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.totals.latency):
+            cumulative += count
+            lines.append("pso_evaluation_latency_seconds_bucket{} {}".format(self._labels(le=bound), cumulative))
+        lines.append("pso_evaluation_latency_seconds_sum{} {}".format(self._labels(), self.totals.seconds[LATENCY_SECTION]))
+        lines.append("pso_evaluation_latency_seconds_count{} {}".format(self._labels(), self.totals.calls[LATENCY_SECTION]))
+
+        gauges = [
+            ("pso_epoch", "Last completed epoch.", epoch_i),
+            ("pso_best_error", "Global best error.", best_error),
+            ("pso_epoch_seconds", "Wall time of the last epoch.", summary["epoch_seconds"]),
+            ("pso_evaluations_per_second", "Fitness evaluations per second in the last epoch.", summary["evaluations_per_second"])
+        ]
+        for name, help_text, value in gauges:
+            lines += ["# HELP {} {}".format(name, help_text), "# TYPE {} gauge".format(name), "{}{} {}".format(name, self._labels(), value)]
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as outfile:
+            outfile.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
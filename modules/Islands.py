@@ -0,0 +1,167 @@
+import os
+import queue
+import multiprocessing
+import numpy as np
+
+from modules.HistoryLog import merge_histories
+from modules.RandomStreams import ISLAND_STREAM
+
+TOPOLOGIES = ("ring", "full")
+
+
+def neighbours(island_i, num_islands, topology):
+    """
+        Islands that island_i sends its best position to
+    """
+    if topology == "ring":
+        return [(island_i + 1) % num_islands] if num_islands > 1 else []
+    if topology == "full":
+        return [other_i for other_i in range(num_islands) if other_i != island_i]
+    raise ValueError("Unknown migration topology: {} (expected one of {})".format(topology, ", ".join(TOPOLOGIES)))
+
+
+class Migration(object):
+    """
+        Migration channel of one island: every interval epochs it sends its global best to its neighbours' inboxes and takes
+        whatever has arrived in its own inbox, without waiting for anyone (islands never synchronize).
+        An immigrant replaces the next position of the island's worst agent, and becomes the island's global best if it is better.
+        Immigrants scored by a different evaluator (e.g., a neighbour still in its proxy epochs) are dropped.
+    """
+    def __init__(self, island_i, inboxes, topology, interval):
+        self.island_i = island_i
+        self.inboxes = inboxes
+        self.targets = neighbours(island_i, len(inboxes), topology)
+        self.interval = interval
+        self.num_received = 0
+
+        # Do not block on exit for messages no island will read anymore (e.g., to an island that stopped early)
+        for inbox in inboxes:
+            inbox.cancel_join_thread()
+
+    def exchange(self, swarm, epoch_i, evaluator_name):
+        if (epoch_i + 1) % self.interval:
+            return
+
+        # Emigrate
+        # -----------------------------------------------------------------------------------------------
+        if swarm.best_global_position is not None:
+            emigrant = (evaluator_name, float(swarm.best_global_error), swarm.best_global_position.bits, swarm.best_global_feature_importances)
+            for target_i in self.targets:
+                self.inboxes[target_i].put(emigrant)
+        # -----------------------------------------------------------------------------------------------
+
+        # Immigrate
+        # -----------------------------------------------------------------------------------------------
+        immigrants = []
+        while True:
+            try:
+                immigrants.append(self.inboxes[self.island_i].get_nowait())
+            except queue.Empty:
+                break
+
+        immigrants = sorted([immigrant for immigrant in immigrants if immigrant[0] == evaluator_name and immigrant[1] > 0], key=lambda immigrant: immigrant[1])
+        immigrants = immigrants[:swarm.num_agents]
+
+        # Worst agents first; unscored (-1) and empty (500) positions count as worst
+        errors = swarm.state.current_errors
+        worst_agents = np.argsort(-np.where((errors > 0) & (errors != 500), errors, np.inf), kind="stable")
+
+        for (_, error, bits, importances), agent_i in zip(immigrants, worst_agents):
+            swarm.state.positions[agent_i] = bits
+            swarm.state.invalidate_positions(slice(agent_i, agent_i + 1))
+
+            if error < swarm.best_global_error or swarm.best_global_error == -1:
+                swarm.best_global_error = error
+                swarm.best_global_position = swarm.state.position(agent_i).copy()
+                swarm.best_global_feature_importances = importances
+        # -----------------------------------------------------------------------------------------------
+
+        self.num_received += len(immigrants)
+
+
+def _run_island(island_i, make_swarm, data, history_path, checkpoint_path, seed, migration, results):
+    swarm = make_swarm(data, history_path=history_path, checkpoint_path=checkpoint_path, seed=seed)
+    swarm.migration = migration
+    swarm.asynchronous = False          # immigrants rewrite positions between epochs, which needs epoch barriers
+    swarm.run()
+
+    results.put({
+        "island"            : island_i,
+        "best_error"        : float(swarm.best_global_error),
+        "stop_reason"       : swarm.stop_reason,
+        "immigrants"        : migration.num_received,
+        "history_path"      : history_path
+    })
+
+
+class IslandModel(object):
+    """
+        Runs num_islands independent swarms in separate processes on the same DataHandler, exchanging best positions
+        every migration_interval epochs over per-island queues (topology "ring" or "full").
+        Processes are forked, so every island reads the parent's loaded data without copying or re-loading it (fork is
+        required: the DataHandler is not picklable). Each island writes its own history log and checkpoint under output_dir;
+        merge_histories combines the logs into output_dir/history_merged.bin when all islands have finished.
+
+        make_swarm(data, history_path=..., checkpoint_path=..., seed=...) builds one island's Swarm. Island i's seed is
+        stream (ISLAND_STREAM, i) of the data handler's run seed.
+    """
+    def __init__(self, data, make_swarm, num_islands, migration_interval=5, topology="ring", output_dir="experiments/islands"):
+        neighbours(0, num_islands, topology)        # validate the topology
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("The island model needs the fork start method (Linux / macOS)")
+
+        self.data = data
+        self.make_swarm = make_swarm
+        self.num_islands = num_islands
+        self.migration_interval = migration_interval
+        self.topology = topology
+        self.output_dir = output_dir
+        self.history_path = os.path.join(output_dir, "history_merged.bin")
+        self.results = []
+
+    def island_paths(self, island_i):
+        island_dir = os.path.join(self.output_dir, "island_{}".format(island_i))
+        return os.path.join(island_dir, "history.bin"), os.path.join(island_dir, "checkpoint.pkl")
+
+    def run(self):
+        # Load deferred data stages once, before forking, so every island shares them
+        self.data.materialize()
+
+        context = multiprocessing.get_context("fork")
+        inboxes = [context.Queue() for _ in range(self.num_islands)]
+        results = context.Queue()
+
+        # Independent streams per island, derived from the run seed
+        seeds = [self.data.random_streams.integer_seed(ISLAND_STREAM, island_i) for island_i in range(self.num_islands)]
+
+        print("Starting {} islands ({} migration every {} epochs)...".format(self.num_islands, self.topology, self.migration_interval))
+        processes = []
+        for island_i in range(self.num_islands):
+            history_path, checkpoint_path = self.island_paths(island_i)
+            migration = Migration(island_i, inboxes, self.topology, self.migration_interval)
+            process = context.Process(
+                target=_run_island,
+                args=(island_i, self.make_swarm, self.data, history_path, checkpoint_path, int(seeds[island_i]), migration, results)
+            )
+            process.start()
+            processes.append(process)
+
+        # Collect results before joining, so no island blocks on a full results pipe
+        while len(self.results) < self.num_islands:
+            try:
+                self.results.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+        for island_i, process in enumerate(processes):
+            process.join()
+            if process.exitcode != 0:
+                print("Island {} exited with code {}".format(island_i, process.exitcode))
+        self.results.sort(key=lambda result: result["island"])
+
+        for result in self.results:
+            print("Island {}: best error {} ({}, {} immigrants)".format(result["island"], result["best_error"], result["stop_reason"], result["immigrants"]))
+
+        merge_histories([self.island_paths(island_i)[0] for island_i in range(self.num_islands)], self.history_path)
+        print("Merged history: {}".format(self.history_path))
+        return self.results
@@ -0,0 +1,123 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from modules.FitnessEvaluator import evaluate_position
+from modules.DataHandler import gather_expression_levels
+from modules.Instrumentation import PROFILER
+from modules.Position import PackedPosition
+from modules.FeatureImportance import ImportanceLayout, covariate_groups
+
+# Per-process state of an evaluation worker (set once by _init_worker)
+_worker_data = None
+_worker_forest_params = None
+_worker_blocks = []
+
+
+class SharedExpressionData(object):
+    """
+        Read-only stand-in for DataHandler inside worker processes.
+        Exposes the attributes and get_expression_levels used by FitnessEvaluator.evaluate_position, backed by NumPy arrays.
+    """
+    def __init__(self, expression, covariates, target, gene_name_list, covariate_groups):
+        self.expression_matrix = expression             # genes x samples
+        self.encoded_covariates = covariates            # samples x encoded covariates
+        self.target_gene_data = target                  # y
+        self.gene_name_list = gene_name_list
+        self.num_genes = expression.shape[0]
+        self.importance_layout = ImportanceLayout(gene_name_list, covariate_groups)
+
+        # Per-process X buffer (the shared arrays themselves are never written)
+        self.X_buffer = np.empty(covariates.shape[0] * (self.num_genes + covariates.shape[1]), dtype=np.float32)
+
+    def get_expression_levels(self, active_gene_indices):
+        """
+            Get the X, y for regression
+        """
+        X = gather_expression_levels(self.expression_matrix, self.encoded_covariates, active_gene_indices, self.X_buffer)
+        return X, self.target_gene_data
+
+
+def _init_worker(block_specs, gene_name_list, covariate_groups, forest_params):
+    """
+        Attach to the parent's shared memory blocks once per worker process
+    """
+    global _worker_data, _worker_forest_params, _worker_blocks
+
+    arrays = {}
+    for name, (shm_name, shape, dtype) in block_specs.items():
+        block = shared_memory.SharedMemory(name=shm_name)
+        _worker_blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    _worker_data = SharedExpressionData(arrays["expression"], arrays["covariates"], arrays["target"], gene_name_list, covariate_groups)
+    _worker_forest_params = forest_params
+
+def _evaluate_task(packed_position, forest_params=None):
+    position = PackedPosition(packed_position, _worker_data.num_genes)
+    error, importances = evaluate_position(_worker_data, position, dict(_worker_forest_params, **(forest_params or {})))
+
+    # Ship this task's timings back to the parent's profiler
+    return error, importances, PROFILER.drain()
+
+
+class ParallelEvaluator(object):
+    """
+        Evaluates agent positions on a pool of worker processes.
+        The expression matrix, encoded covariates and target are placed in shared memory once;
+        each task only ships a packed position bitmask and returns (error, importance vector).
+    """
+    def __init__(self, data, num_workers, forest_params=None):
+        self.num_workers = num_workers
+        self.num_genes = data.num_genes
+
+        # Forests inside workers default to a single thread so the pool does not oversubscribe the cores
+        forest_params = dict(forest_params or {})
+        forest_params.setdefault("n_jobs", 1)
+
+        # Copy the data arrays into shared memory
+        # -----------------------------------------------------------------------------------------------
+        self.blocks = []
+        block_specs = {}
+        for name, array in data.export_arrays().items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            block_specs[name] = (block.name, array.shape, array.dtype.str)
+        # -----------------------------------------------------------------------------------------------
+
+        self.pool = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(block_specs, list(data.gene_name_list), covariate_groups(data.features, data.encoding_sizes), forest_params)
+        )
+
+    def evaluate(self, positions, forest_params=None):
+        """
+            Evaluate a list of positions; results are returned in the same order as positions.
+            forest_params override the pool's forest parameters for these tasks only (e.g., a cheaper racing rung).
+        """
+        futures = [self.submit(position, forest_params) for position in positions]
+        return [self.collect(future) for future in futures]
+
+    def submit(self, position, forest_params=None):
+        """
+            Start evaluating one PackedPosition; pass the returned future to collect() for its result
+        """
+        return self.pool.submit(_evaluate_task, position.bits, forest_params)
+
+    def collect(self, future):
+        """
+            (error, importance vector) of a finished task; its worker timings are merged into this process's profiler
+        """
+        error, importances, profile = future.result()
+        PROFILER.merge(profile)
+        return error, importances
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
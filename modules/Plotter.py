@@ -1,114 +1,235 @@
 import os
+import re
+import shutil
 import numpy as np
-import json
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-import seaborn as sns
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.HistoryLog import HistoryReader
+
+# matplotlib, seaborn and pandas are imported by the methods that draw, so importing this module (e.g., from main.py) stays cheap
+ACTIVATION_COLORS = ["#ffcccc", "#99ff99"]          # OFF, ON
+
+# Per-process frame renderer (set once by _init_frame_worker)
+_frame_renderer = None
+
+
+class _FrameRenderer(object):
+    """
+        One figure reused for every heatmap frame: only the cell colors and the title change between frames.
+        Uses a bare matplotlib Figure rather than pyplot, so no global figure state is shared or leaked.
+    """
+    def __init__(self, gene_names, num_cols, dpi, figures_dir):
+        from matplotlib.figure import Figure
+        from matplotlib.colors import ListedColormap
+
+        self.dpi = dpi
+        self.figures_dir = figures_dir
+        self.num_genes = len(gene_names)
+        self.num_cols = num_cols
+        self.num_rows = int(np.ceil(self.num_genes / float(num_cols)))
+
+        self.figure = Figure()
+        ax = self.figure.add_subplot(111)
+        self.image = ax.imshow(self._grid(np.zeros(self.num_genes)), cmap=ListedColormap(ACTIVATION_COLORS), vmin=0, vmax=1, interpolation="nearest")
+
+        # Cell borders and gene names are the same in every frame
+        ax.set_xticks(np.arange(-0.5, num_cols), minor=True)
+        ax.set_yticks(np.arange(-0.5, self.num_rows), minor=True)
+        ax.grid(which="minor", color="white", linewidth=1.5)
+        ax.tick_params(which="both", length=0, labelbottom=False, labelleft=False)
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        for gene_i, gene_name in enumerate(gene_names):
+            ax.text(gene_i % num_cols, gene_i // num_cols, gene_name, ha="center", va="center", fontsize=6)
+
+        cbar = self.figure.colorbar(self.image, ax=ax)
+        cbar.set_ticks([0.25, 0.75])
+        cbar.set_ticklabels(["OFF", "ON"])
+
+        self.title = ax.set_title("")
+
+    def _grid(self, position):
+        # Pad the last row with OFF cells
+        grid = np.zeros(self.num_rows * self.num_cols)
+        grid[:self.num_genes] = position
+        return grid.reshape(self.num_rows, self.num_cols)
+
+    def render(self, epoch_i, num_epochs, position, best_error):
+        self.image.set_data(self._grid(position))
+        self.title.set_text("Timestep: {} / {} \n Best Error: {:0.4f}".format(epoch_i + 1, num_epochs, best_error))
+        path = os.path.join(self.figures_dir, "heatmap_{}.png".format(epoch_i + 1))
+
+        # Write a new file and move it into place: path may be a hard link shared with other frames of an earlier run,
+        # and saving into it would overwrite all of them
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        self.figure.savefig(temp_path, dpi=self.dpi, format="png")
+        os.replace(temp_path, path)
+        return path
+
+def _init_frame_worker(gene_names, num_cols, dpi, figures_dir):
+    global _frame_renderer
+    _frame_renderer = _FrameRenderer(gene_names, num_cols, dpi, figures_dir)
+
+def _render_frames(frames, num_epochs):
+    """
+        Render a chunk of (epoch, position, best error) frames with this process's renderer
+    """
+    return [_frame_renderer.render(epoch_i, num_epochs, position, best_error) for epoch_i, position, best_error in frames]
 
-class Plotter(object):
 
-    def __init__(self):
+class Plotter(object):
+    """
+        Post-run figures from a history log (modules/HistoryLog.py).
+        Heatmap frames are rendered on num_workers processes (None: one per core, 1: in this process).
+    """
+    def __init__(self, num_workers=None, dpi=300):
         self.paths = {
             "experiments"   : "experiments",
             "figures"       : "experiments/figs"
         }
-
-    def plot_gene_activation_heatmap(self, history_data, gene_names, baseline_error):
-        cbar_plotted = False # Prevents multiple cbar prints
-
-        for history_i, (history, best_error_i, best_feature_importance) in enumerate(zip(history_data["position"], history_data["error"], history_data["feature_importance"])):
-            # print("\n")
-            # print("History {}".format(history_i+1))
-            # print("Feature importances")
-            # for key, val in best_feature_importance.items():
-            #     print("\t{} : {}".format(key, val))
-            # print("\n")
-            # print("\n")
-
-            history = history[:100].reshape(100, 1)
-
-            num_genes = history.shape[0]
-            num_cols = 10
-            num_rows = int(np.ceil(num_genes / float(num_cols)))
-            reshaped_global_positions = history.reshape(num_rows, num_cols)
-
-            gene_names = gene_names[:100]
-
-            reshaped_global_gene_names = np.array(gene_names).reshape(num_rows, num_cols)
-
-            plot_params = {
-                "cmap"          : ListedColormap(["#ffcccc", "#99ff99"]),
-                "linewidths"    : 1.5,
-                "annot"         : reshaped_global_gene_names if len(reshaped_global_gene_names) < 100 else None,
-                "fmt"           : '',
-                "cbar"          : False if cbar_plotted else True
-            }
-            ax = sns.heatmap(reshaped_global_positions, **plot_params)
-
-            if not cbar_plotted:
-                cbar = ax.collections[0].colorbar
-                cbar.set_ticks([0.25, 0.75])
-                cbar.set_ticklabels(["OFF", "ON"])
-                cbar_plotted = True
-
-            plt.title("Timestep: {} / {} \n Best Error: {:0.4f}".format(history_i+1, len(history_data["position"]), best_error_i))
-            plt.axis('off')
-            plt.savefig("{}/heatmap_{}.png".format(self.paths["figures"], history_i+1), dpi=300)
-            plt.cla()
-
-        # Clear the axes
-        cbar.remove()
-
-    def data_analysis_plots(self, json_file):
-        plt.cla()
-
-        json_path = os.path.join(self.paths["experiments"], json_file)
-        with open(json_path, "r") as infile:
-            data = json.load(infile)
-
-        means = []
-        num_genes_active = []
-        errors = []
-        bests = []
-        timesteps = [i for i in range(len(data["error_stats"]))]
-        for timestep_i, data_i in enumerate(data["error_stats"]):
-            num_genes = data["num_genes_active"][timestep_i]
-            mean = data_i["mean"]
-            std = data_i["std"]
-            error_list = data_i["errors"]
-            best = np.min(error_list)
-            means.append(mean)
-            num_genes_active.append(num_genes)
-            errors.append(error_list)
-            bests.append(best)
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.dpi = dpi
+
+    def _figures_dir(self):
+        if not os.path.isdir(self.paths["figures"]):
+            os.makedirs(self.paths["figures"])
+        return self.paths["figures"]
+
+    def plot_gene_activation_heatmap(self, history_path, gene_names, max_genes=100, num_cols=10, frames_per_task=8):
+        """
+            One heatmap_<epoch>.png per epoch of the global best position over the first max_genes genes.
+            Only frames whose position or best error changed are rendered; the others are hard links to the previous frame.
+            Frames past the last epoch, left over from an earlier, longer run, are deleted.
+        """
+        history_data = HistoryReader(history_path)
+        num_epochs = len(history_data)
+        if num_epochs == 0:
+            return
+
+        figures_dir = self._figures_dir()
+        num_genes = min(max_genes, history_data.num_genes)
+        gene_names = list(gene_names[:num_genes])
+
+        # Frame contents: unpack only the bytes holding the first num_genes genes
+        packed = history_data.column("best_position")[:, :(num_genes + 7) // 8]
+        positions = np.unpackbits(packed, axis=1, count=num_genes)
+        errors = history_data.column("best_error")
+
+        changed = np.ones(num_epochs, dtype=bool)
+        changed[1:] = np.any(positions[1:] != positions[:-1], axis=1) | (errors[1:] != errors[:-1])
+        frames = [(epoch_i, positions[epoch_i], errors[epoch_i]) for epoch_i in np.flatnonzero(changed)]
+
+        # Render the distinct frames
+        # -----------------------------------------------------------------------------------------------
+        init_args = (gene_names, num_cols, self.dpi, figures_dir)
+        num_workers = min(self.num_workers, int(np.ceil(len(frames) / float(frames_per_task))))
+        if num_workers <= 1:
+            _init_frame_worker(*init_args)
+            _render_frames(frames, num_epochs)
+        else:
+            chunks = [frames[start:start + frames_per_task] for start in range(0, len(frames), frames_per_task)]
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_frame_worker, initargs=init_args) as pool:
+                list(pool.map(_render_frames, chunks, [num_epochs] * len(chunks)))
+        # -----------------------------------------------------------------------------------------------
+
+        # Unchanged epochs reuse the previous frame
+        # -----------------------------------------------------------------------------------------------
+        for epoch_i in np.flatnonzero(~changed):
+            source = os.path.join(figures_dir, "heatmap_{}.png".format(epoch_i))
+            target = os.path.join(figures_dir, "heatmap_{}.png".format(epoch_i + 1))
+            if os.path.exists(target):
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        # -----------------------------------------------------------------------------------------------
+
+        # Frames of an earlier, longer run
+        for filename in os.listdir(figures_dir):
+            match = re.match(r"heatmap_(\d+)\.png$", filename)
+            if match and int(match.group(1)) > num_epochs:
+                os.remove(os.path.join(figures_dir, filename))
+
+        print("Rendered {} / {} heatmap frames ({} unchanged)".format(len(frames), num_epochs, num_epochs - len(frames)))
+
+    def plot_activation_raster(self, history_path, sort_genes=True, max_rows=2000):
+        """
+            Every gene's global-best activation over the run as one genes x epochs image.
+            With sort_genes, genes are ordered by how many epochs they were active, so the consensus genes form the top rows.
+            Above max_rows genes, adjacent genes are averaged into max_rows rows (the fraction of them active) before drawing,
+            which is far cheaper than letting matplotlib resample the full raster.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.colors import LinearSegmentedColormap
+
+        history_data = HistoryReader(history_path)
+        if len(history_data) == 0:
+            return
+
+        raster = history_data.positions().T                     # genes x epochs
+        if sort_genes:
+            raster = raster[np.argsort(-raster.sum(axis=1, dtype=np.int64), kind="stable")]
+
+        num_genes = raster.shape[0]
+        if num_genes > max_rows:
+            starts = np.linspace(0, num_genes, max_rows, endpoint=False).astype(np.intp)
+            raster = np.add.reduceat(raster, starts, axis=0, dtype=np.float32) / np.diff(np.append(starts, num_genes))[:, np.newaxis]
+
+        figure = Figure(figsize=(8, 6))
+        ax = figure.add_subplot(111)
+        extent = (-0.5, raster.shape[1] - 0.5, num_genes - 0.5, -0.5)          # axes in epochs and genes even when rows were merged
+        image = ax.imshow(raster, cmap=LinearSegmentedColormap.from_list("activation_fraction", ACTIVATION_COLORS), vmin=0, vmax=1, aspect="auto", interpolation="nearest", extent=extent)
+        ax.set_title("Global Best Gene Activation")
+        ax.set_xlabel("Training Timesteps")
+        ax.set_ylabel("Genes{}".format(" (most active first)" if sort_genes else ""))
+        cbar = figure.colorbar(image, ax=ax)
+        cbar.set_ticks([0, 1])
+        cbar.set_ticklabels(["OFF", "ON"])
+        figure.savefig(os.path.join(self._figures_dir(), "activation_raster.png"), dpi=self.dpi)
+
+    def data_analysis_plots(self, history_path, baseline_error):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        import pandas as pd
+
+        # Read only the columns these plots use
+        data = HistoryReader(history_path)
+        errors = data.column("errors")
+        num_genes_active = data.column("num_genes_active")
+        means = errors.mean(axis=1)
+        bests = errors.min(axis=1)
+        timesteps = np.arange(len(data))
+        figures_dir = self._figures_dir()
 
         # Num genes vs. timesteps
+        fig, ax = plt.subplots()
         df = pd.concat([pd.DataFrame(num_genes_active, columns=["num_genes_active"]), pd.DataFrame(timesteps, columns=["timesteps"])], axis=1)
-        sns.regplot(x="timesteps", y="num_genes_active", data=df)
-        plt.plot(timesteps, [baseline_error for i in range(len(timesteps))], 'r--', label="Correlation Baseline: {}".format(baseline_error))
-        plt.title("Gene Count vs. Timesteps")
-        plt.xlabel("Training Timesteps")
-        plt.ylabel("Number of Genes for Regression")
-        plt.savefig("{}/gene_count.png".format(self.paths["figures"]), dpi=300)
-        plt.cla()
+        sns.regplot(x="timesteps", y="num_genes_active", data=df, ax=ax)
+        ax.set_title("Gene Count vs. Timesteps")
+        ax.set_xlabel("Training Timesteps")
+        ax.set_ylabel("Number of Genes for Regression")
+        fig.savefig("{}/gene_count.png".format(figures_dir), dpi=self.dpi)
+        plt.close(fig)
 
         # Best OOBs
+        fig, ax = plt.subplots()
         df = pd.concat([pd.DataFrame(bests, columns=["best"]), pd.DataFrame(timesteps, columns=["timesteps"])], axis=1)
-        sns.regplot(x="timesteps", y="best", data=df)
-        plt.plot(timesteps, [baseline_error for i in range(len(timesteps))], 'r--', label="Correlation Baseline: {}".format(baseline_error))
-        plt.legend()
-        plt.title("OOB Best Error vs. Timesteps")
-        plt.xlabel("Training Timesteps")
-        plt.ylabel("OOB Best Error")
-        plt.savefig("{}/best_oob.png".format(self.paths["figures"]), dpi=300)
-        plt.cla()
+        sns.regplot(x="timesteps", y="best", data=df, ax=ax)
+        ax.plot(timesteps, np.full(len(timesteps), baseline_error), 'r--', label="Correlation Baseline: {}".format(baseline_error))
+        ax.legend()
+        ax.set_title("OOB Best Error vs. Timesteps")
+        ax.set_xlabel("Training Timesteps")
+        ax.set_ylabel("OOB Best Error")
+        fig.savefig("{}/best_oob.png".format(figures_dir), dpi=self.dpi)
+        plt.close(fig)
 
         # Average OOBs
+        fig, ax = plt.subplots()
         df = pd.concat([pd.DataFrame(means, columns=["means"]), pd.DataFrame(timesteps, columns=["timesteps"])], axis=1)
-        sns.regplot(x="timesteps", y="means", data=df)
-        plt.title("OOB Mean Error vs. Timesteps")
-        plt.xlabel("Training Timesteps")
-        plt.ylabel("OOB Mean Error")
-        plt.savefig("{}/average_oob.png".format(self.paths["figures"]), dpi=300)
-        plt.cla()
+        sns.regplot(x="timesteps", y="means", data=df, ax=ax)
+        ax.set_title("OOB Mean Error vs. Timesteps")
+        ax.set_xlabel("Training Timesteps")
+        ax.set_ylabel("OOB Mean Error")
+        fig.savefig("{}/average_oob.png".format(figures_dir), dpi=self.dpi)
+        plt.close(fig)
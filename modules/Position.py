@@ -0,0 +1,101 @@
+import numpy as np
+
+# Set bits of every byte value, for popcounts of packed rows
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def packed_size(num_genes):
+    return (num_genes + 7) // 8
+
+def pack(positions):
+    """
+        Bit-pack 0/1 positions along the last axis (one bit per gene, big-endian within each byte as np.packbits)
+    """
+    return np.packbits(np.asarray(positions) > 0, axis=-1)
+
+def unpack(packed, num_genes, dtype=np.float64):
+    """
+        Dense 0/1 positions (..., num_genes) of packed rows
+    """
+    return np.unpackbits(packed, axis=-1, count=num_genes).astype(dtype, copy=False)
+
+def popcount(packed):
+    """
+        Number of active genes of each packed row
+    """
+    return POPCOUNT_TABLE[packed].sum(axis=-1, dtype=np.int64)
+
+def hamming(packed_a, packed_b):
+    """
+        Number of genes that differ between packed rows (broadcasts like np.bitwise_xor)
+    """
+    return popcount(np.bitwise_xor(packed_a, packed_b))
+
+
+class PackedPosition(object):
+    """
+        A gene selection stored as np.packbits bytes, 1 bit per gene instead of 8 bytes for a float64 0/1 vector.
+        bits may be a view into a SwarmState row; the active gene indices are computed on first use and cached,
+        so the owner has to drop the object when the row changes (SwarmState.update_positions does).
+    """
+    __slots__ = ("bits", "num_genes", "_active_indices")
+
+    def __init__(self, bits, num_genes, active_indices=None):
+        self.bits = bits
+        self.num_genes = num_genes
+        self._active_indices = active_indices
+
+    @classmethod
+    def from_dense(cls, position):
+        position = np.asarray(position)
+        return cls(pack(position), position.shape[-1])
+
+    def __len__(self):
+        return self.num_genes
+
+    def __eq__(self, other):
+        return isinstance(other, PackedPosition) and self.num_genes == other.num_genes and np.array_equal(self.bits, other.bits)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    @property
+    def active_indices(self):
+        """
+            Sorted indices of the active genes
+        """
+        if self._active_indices is None:
+            self._active_indices = np.flatnonzero(unpack(self.bits, self.num_genes, np.uint8))
+        return self._active_indices
+
+    def dense(self, dtype=np.float64):
+        return unpack(self.bits, self.num_genes, dtype)
+
+    def key(self):
+        """
+            Hashable form of the selection (FitnessCache keys)
+        """
+        return self.bits.tobytes()
+
+    def copy(self):
+        """
+            Independent copy (the bits of a SwarmState row change in place on every position update)
+        """
+        return PackedPosition(self.bits.copy(), self.num_genes, self._active_indices)
+
+    def popcount(self):
+        return int(popcount(self.bits))
+
+    def hamming(self, other):
+        return int(hamming(self.bits, other.bits))
+
+    def diff(self, other):
+        """
+            (genes active here but not in other, genes active in other but not here)
+        """
+        changed = np.bitwise_xor(self.bits, other.bits)
+        added = np.flatnonzero(unpack(changed & self.bits, self.num_genes, np.uint8))
+        removed = np.flatnonzero(unpack(changed & other.bits, self.num_genes, np.uint8))
+        return added, removed
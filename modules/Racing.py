@@ -0,0 +1,80 @@
+import numpy as np
+
+from modules.FitnessEvaluator import RandomForestEvaluator
+
+DEFAULT_N_ESTIMATORS = 100          # RandomForestRegressor default
+
+
+class SuccessiveHalving(object):
+    """
+        Multi-fidelity racing of agent evaluations.
+        Every candidate is scored with the cheapest rung (e.g., few trees and/or a row subsample); only the best
+        promotion_ratio fraction (lowest error) moves on to the next, more expensive rung. The last rung is the full fit.
+        Candidates eliminated early keep the score of the highest rung they reached. That score only ranks them: race()
+        marks which results are full fidelity, and only those may become personal / global bests or be cached.
+
+        rungs: list of RandomForestRegressor parameter overrides, cheapest first, e.g.
+            [{"n_estimators" : 10, "max_samples" : 0.5}, {"n_estimators" : 30}, {}]
+        promotion_ratio: fraction promoted after each rung (a single value or one per rung transition)
+    """
+    def __init__(self, rungs, promotion_ratio=0.33):
+        self.rungs = rungs
+
+        num_transitions = len(rungs) - 1
+        if np.isscalar(promotion_ratio):
+            promotion_ratio = [promotion_ratio] * num_transitions
+        self.promotion_ratios = list(promotion_ratio)
+
+        if len(self.promotion_ratios) != num_transitions:
+            raise ValueError("Need one promotion ratio per rung transition ({})".format(num_transitions))
+
+    @staticmethod
+    def _cost(forest_params):
+        """
+            Relative cost of a forest fit: number of trees x fraction of rows each tree is grown on
+        """
+        max_samples = forest_params.get("max_samples") or 1.0
+        return forest_params.get("n_estimators", DEFAULT_N_ESTIMATORS) * (max_samples if isinstance(max_samples, float) else 1.0)
+
+    def rung_evaluators(self, evaluator):
+        return [RandomForestEvaluator(dict(evaluator.forest_params, **rung)) for rung in self.rungs]
+
+    def race(self, evaluator, num_candidates, fit):
+        """
+            Race num_candidates candidates through the rungs.
+            fit(rung_evaluator, candidate_indices) must return one (error, importances) result per index, in order.
+            Returns (results for every candidate, boolean mask of the results that are full fidelity, stats)
+        """
+        rung_evaluators = self.rung_evaluators(evaluator)
+        full_cost = self._cost(rung_evaluators[-1].forest_params)
+
+        results = [None] * num_candidates
+        survivors = list(range(num_candidates))
+        rung_sizes = []
+        cost = 0.0
+
+        for rung_i, rung_evaluator in enumerate(rung_evaluators):
+            if not survivors:
+                break
+
+            for candidate_i, result in zip(survivors, fit(rung_evaluator, survivors)):
+                results[candidate_i] = result
+
+            rung_sizes.append(len(survivors))
+            cost += len(survivors) * self._cost(rung_evaluator.forest_params) / full_cost
+
+            # Promote the lowest errors (ties broken by candidate order, so promotion is deterministic)
+            if rung_i < len(rung_evaluators) - 1:
+                num_promoted = max(1, int(np.ceil(len(survivors) * self.promotion_ratios[rung_i])))
+                survivors = sorted(survivors, key=lambda candidate_i: (results[candidate_i][0], candidate_i))[:num_promoted]
+
+        stats = {
+            "rung_sizes"            : rung_sizes,
+            "evaluation_cost"       : cost,                         # in full-fit equivalents
+            "evaluations_saved"     : num_candidates - cost
+        }
+        full_fidelity = np.zeros(num_candidates, dtype=bool)
+        if len(rung_sizes) == len(rung_evaluators):
+            full_fidelity[survivors] = True
+
+        return results, full_fidelity, stats
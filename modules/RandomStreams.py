@@ -0,0 +1,42 @@
+import hashlib
+import numpy as np
+
+# Stream ids under the run seed
+SUBSET_STREAM = 0           # gene subset screened for correlations
+AGENT_STREAM = 1            # one stream per agent: initial position / velocity and the PSO update draws
+FOREST_STREAM = 2           # forest random_state per scored position
+BASELINE_STREAM = 3         # one random_state per baseline forest
+ISLAND_STREAM = 4           # run seed of each island swarm
+
+
+class RandomStreams(object):
+    """
+        Independent random streams derived from one run seed with np.random.SeedSequence.
+        A stream is addressed by a fixed spawn key (stream id, index, ...) instead of being spawned in call order, so a seed
+        gives the same streams in every process, whichever order they are created in and however much the others draw.
+        seed=None draws fresh entropy; self.seed holds it, so the run can be repeated.
+    """
+    def __init__(self, seed=None):
+        self.seed = int(seed) if seed is not None else int(np.random.SeedSequence().entropy)
+
+    def sequence(self, *key):
+        return np.random.SeedSequence(self.seed, spawn_key=key)
+
+    def generator(self, *key):
+        return np.random.Generator(np.random.PCG64(self.sequence(*key)))
+
+    def integer_seed(self, *key):
+        """
+            A 32-bit seed (e.g., a scikit-learn random_state) for stream key
+        """
+        return int(self.sequence(*key).generate_state(1)[0])
+
+
+def forest_random_state(seed, position):
+    """
+        random_state of the forest that scores position (a PackedPosition) in the run with this seed.
+        It depends only on the seed and the selected genes, so a position gets the same forest in the main process,
+        a pool worker or a remote worker, in any evaluation order, and a cached score is exactly what a refit would give.
+    """
+    position_key = int.from_bytes(hashlib.sha1(position.key()).digest()[:8], "little")
+    return RandomStreams(seed).integer_seed(FOREST_STREAM, position_key)
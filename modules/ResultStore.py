@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+class ResultStore(object):
+    """
+        Append-only on-disk cache of small array payloads keyed by a dict of parameters.
+        Each entry is one compressed .npz file named by the hash of its key, so a lookup is a single path check and
+        writes never rewrite existing data. Payloads are written to a temporary file and renamed into place, which keeps
+        concurrent runs safe: readers see either nothing or a complete entry. index.jsonl records every entry for listing.
+    """
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+    @staticmethod
+    def key_hash(params):
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, params):
+        return os.path.join(self.store_dir, "{}.npz".format(self.key_hash(params)))
+
+    def __contains__(self, params):
+        return os.path.exists(self._path(params))
+
+    def get(self, params):
+        """
+            Return the payload arrays stored for params as a dict, or None if there is no entry
+        """
+        path = self._path(params)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as payload:
+            return {name : payload[name] for name in payload.files}
+
+    def put(self, params, **arrays):
+        path = self._path(params)
+        if os.path.exists(path):
+            return
+
+        # Write under a process-unique name, then atomically move into place
+        tmp_path = "{}.{}.tmp.npz".format(path[:-len(".npz")], os.getpid())
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+        # One O_APPEND write per entry, so lines from concurrent runs never interleave
+        line = json.dumps({"key" : self.key_hash(params), "params" : params}, sort_keys=True) + "\n"
+        fd = os.open(os.path.join(self.store_dir, self.INDEX_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def entries(self):
+        """
+            Parameters of every entry written so far
+        """
+        index_path = os.path.join(self.store_dir, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return []
+
+        with open(index_path, "r") as infile:
+            return [json.loads(line)["params"] for line in infile if line.strip()]
@@ -1,12 +1,23 @@
-import sys
-import json
+import os
 import numpy as np
 import time
+import collections
+from concurrent.futures import wait, FIRST_COMPLETED
 
 from modules.Agent import Agent
+from modules.FitnessEvaluator import RandomForestEvaluator
+from modules.FitnessCache import FitnessCache
+from modules.ParallelEvaluator import ParallelEvaluator
+from modules.Distributed import DistributedEvaluator
+from modules.SwarmState import SwarmState
+from modules.Checkpoint import CHECKPOINT_VERSION
+from modules.HistoryLog import HistoryWriter
+from modules.Instrumentation import PROFILER, PrometheusExporter
+from modules.Convergence import mean_pairwise_hamming
+from modules.FeatureImportance import ImportanceAccumulator
 
 class Swarm():
-    def __init__(self, num_agents, max_epochs, agent_params, plot_gene_activity):
+    def __init__(self, num_agents, max_epochs, agent_params, plot_gene_activity, fitness_cache_size=10000, num_workers=None, forest_params=None, evaluator=None, proxy_evaluator=None, proxy_epochs=0, racing=None, distributed_params=None, checkpointer=None, history_path=None, profiling=True, metrics_path=None, stopping_rules=None, asynchronous=False, async_epoch_evaluations=None, migration=None, seed=None):
         print("Creating swarm with {} agents...".format(num_agents))
         self.num_agents = num_agents
         self.max_epochs = max_epochs
@@ -14,74 +25,453 @@ class Swarm():
 
         # Global best errors and positions
         self.best_global_error      = -1                     # best error for group
-        self.best_global_position   = []                     # best position for group
-
-        self.history = {
-            "position"              : [],
-            "error"                 : [],
-            "feature_importance"    : [],
-            "num_genes_active"      : [],
-            "error_stats"           : []
-        }
+        self.best_global_position   = None                   # best position for group (PackedPosition)
+        self.best_global_feature_importances = None             # importance vector (data.importance_layout)
+
+        # Per-epoch history is streamed to disk (modules/HistoryLog.py); read it back with HistoryReader(self.history_path)
+        self.history_path = history_path or "experiments/history_{}_agents.bin".format(num_agents)
+        self.history_log = None
+
+        # Consensus feature importances over every main-evaluator fit, written next to the history log at the end of the run
+        self.importances_path = "{}_importances.npz".format(os.path.splitext(self.history_path)[0])
+
+        # Hot-path timers (modules/Instrumentation.py); per-epoch summaries go to the history log and,
+        # if metrics_path is set, to a Prometheus textfile
+        PROFILER.enabled = profiling
+        self.metrics_exporter = None
+        self.metrics_path = metrics_path
+
+        # Fitness memoization keyed by packed gene-selection bitmask
+        self.fitness_cache = FitnessCache(fitness_cache_size)
+
+        # Parallel evaluation: None/0 evaluates agents one after another in this process.
+        # distributed_params ({"address", "task_timeout", "heartbeat_timeout"}) evaluates on remote workers over TCP instead
+        self.num_workers = num_workers
+        self.distributed_params = distributed_params
+        self.forest_params = forest_params or {}
+        self.parallel_evaluator = None
+
+        # Fitness evaluators: the cheap proxy (if any) scores the first proxy_epochs epochs, then the main evaluator takes over
+        self.evaluator = evaluator or RandomForestEvaluator(self.forest_params)
+        self.proxy_evaluator = proxy_evaluator
+        self.proxy_epochs = proxy_epochs if proxy_evaluator is not None else 0
+
+        # Multi-fidelity racing (SuccessiveHalving) of the main forest evaluator; None fits every agent at full cost
+        self.racing = racing
+
+        # Periodic checkpoints (Checkpointer) and the epoch to start from (set by self.restore)
+        self.checkpointer = checkpointer
+        self.start_epoch = 0
+
+        # Steady-state updates instead of synchronous epochs (needs num_workers; see self._run_async)
+        self.asynchronous = asynchronous
+        self.async_epoch_evaluations = async_epoch_evaluations
+
+        # Early stopping (StoppingRules); None always runs max_epochs
+        self.stopping_rules = stopping_rules
+        self.stop_reason = ""
+
+        # Island model: exchanges best positions with other swarms every few epochs (modules/Islands.py)
+        self.migration = migration
 
         self.final_results = None
 
+        # Run seed of the agents' streams and the forest fits (None: the data handler's seed; see modules/RandomStreams.py)
+        self.seed = seed if seed is not None else agent_params["data"].random_streams.seed
+
+        # Every forest fit is seeded from the run seed and the position it scores, in whichever process it runs
+        for evaluator_i in (self.evaluator, self.proxy_evaluator):
+            if isinstance(evaluator_i, RandomForestEvaluator):
+                evaluator_i.forest_params.setdefault("seed", self.seed)
+
         # Create the swarm
         self._init_swarm(agent_params)
 
     def _init_swarm(self, agent_params):
-        self.swarm = [Agent(agent_i, **agent_params) for agent_i in range(self.num_agents)]
+        agent_params = dict(agent_params)
+        data = agent_params.pop("data")
+
+        # Positions, velocities and personal bests of every agent live in one struct-of-arrays state
+        self.state = SwarmState(self.num_agents, data.num_genes, num_importances=data.importance_layout.size, seed=self.seed, **agent_params)
+        self.swarm = [Agent(agent_i, self.state, data, self.evaluator) for agent_i in range(self.num_agents)]
+        self.data = data
+        self.importance_accumulator = ImportanceAccumulator(data.importance_layout.names)
+
+    def checkpoint(self, next_epoch):
+        """
+            Everything needed to continue the run exactly from next_epoch
+        """
+        evaluators = [evaluator for evaluator in (self.evaluator, self.proxy_evaluator) if evaluator is not None]
+        return {
+            "version"                           : CHECKPOINT_VERSION,
+            "next_epoch"                        : next_epoch,
+            "target_gene"                       : self.data.target_gene,
+            "gene_name_list"                    : list(self.data.gene_name_list),
+            "num_agents"                        : self.num_agents,
+            "state"                             : {name : getattr(self.state, name) for name in SwarmState.ARRAYS},
+            "best_global_error"                 : self.best_global_error,
+            "best_global_position"              : self.best_global_position,
+            "best_global_feature_importances"   : self.best_global_feature_importances,
+            "history_path"                      : self.history_path,
+            "fitness_cache"                     : self.fitness_cache.entries,
+            "importance_accumulator"            : vars(self.importance_accumulator),
+            "stop_reason"                       : self.stop_reason,
+            "stopping_rules"                    : self.stopping_rules.state() if self.stopping_rules is not None else None,
+            "evaluator_state"                   : {evaluator.name : vars(evaluator) for evaluator in evaluators},
+            "seed"                              : self.seed,
+            "rng_states"                        : self.state.generator_states()
+        }
+
+    def restore(self, checkpoint):
+        """
+            Continue from a checkpoint written by self.checkpoint (see modules/Checkpoint.py)
+        """
+        if checkpoint["num_agents"] != self.num_agents or checkpoint["gene_name_list"] != list(self.data.gene_name_list):
+            raise ValueError("Checkpoint does not match this swarm (different agents, target or gene set)")
+        if checkpoint["seed"] != self.seed:
+            print("Continuing with the checkpoint's seed {} (not {})".format(checkpoint["seed"], self.seed))
+            self.seed = checkpoint["seed"]
+
+        for name in SwarmState.ARRAYS:
+            getattr(self.state, name)[...] = checkpoint["state"][name]
+        self.state.invalidate_positions()
+
+        self.best_global_error = checkpoint["best_global_error"]
+        self.best_global_position = checkpoint["best_global_position"]
+        self.best_global_feature_importances = checkpoint["best_global_feature_importances"]
+        self.history_path = checkpoint["history_path"]
+        self.fitness_cache.entries.update(checkpoint["fitness_cache"])
+        vars(self.importance_accumulator).update(checkpoint["importance_accumulator"])
+        # A run that simply used up its epochs can be continued with a larger max_epochs
+        self.stop_reason = checkpoint["stop_reason"] if checkpoint["stop_reason"] != "max_epochs" else ""
+        if self.stopping_rules is not None and checkpoint["stopping_rules"] is not None:
+            vars(self.stopping_rules).update(checkpoint["stopping_rules"])
+
+        for evaluator in (self.evaluator, self.proxy_evaluator):
+            if evaluator is not None and evaluator.name in checkpoint["evaluator_state"]:
+                vars(evaluator).update(checkpoint["evaluator_state"][evaluator.name])
+
+        self.state.set_generator_states(checkpoint["rng_states"])
+        self.start_epoch = checkpoint["next_epoch"]
+        if self.checkpointer is not None:
+            self.checkpointer.last_save_epoch = self.start_epoch
+        print("Resuming from epoch {} / {}".format(self.start_epoch, self.max_epochs))
+
+    def _evaluator_for_epoch(self, epoch_i):
+        return self.proxy_evaluator if epoch_i < self.proxy_epochs else self.evaluator
+
+    def _reset_bests(self):
+        """
+            Forget personal and global bests; used when switching evaluators, whose errors are not comparable
+        """
+        self.state.best_errors[:] = -1
+        self.best_global_error = -1
+
+    def _evaluate_swarm(self, evaluator):
+        """
+            Evaluate every agent's current position.
+            Identical positions within the epoch are fitted once, and positions seen in earlier epochs come from the cache.
+        """
+        # Cache keys are per evaluator, since their errors are on different scales
+        prefix = evaluator.name.encode("utf-8") + b":"
+        keys = [prefix + FitnessCache.key(agent_i.current_position) for agent_i in self.swarm]
+
+        # Deduplicate positions before any fit runs
+        # -----------------------------------------------------------------------------------------------
+        epoch_results = {}
+        pending = {}
+        num_duplicates = 0
+        for agent_i, key in zip(self.swarm, keys):
+            if key in epoch_results or key in pending:
+                num_duplicates += 1
+                continue
+
+            cached = self.fitness_cache.get(key)
+            if cached is None:
+                pending[key] = agent_i
+            else:
+                epoch_results[key] = cached
+        # -----------------------------------------------------------------------------------------------
+
+        # Fit the distinct, uncached positions
+        # -----------------------------------------------------------------------------------------------
+        pending_keys = list(pending.keys())
+        pending_agents = list(pending.values())
+
+        racing_stats = None
+        if self.racing is not None and evaluator is self.evaluator:
+            fit = lambda rung_evaluator, indices: self._fit_agents(rung_evaluator, [pending_agents[i] for i in indices])
+            results, full_fidelity, racing_stats = self.racing.race(evaluator, len(pending_agents), fit)
+        else:
+            results = self._fit_agents(evaluator, pending_agents)
+            full_fidelity = np.ones(len(pending_agents), dtype=bool)
+
+        # Results come back in agent order, so the global best update below is independent of completion order
+        low_fidelity = set()
+        for key, result, full_fidelity_i in zip(pending_keys, results, full_fidelity):
+            epoch_results[key] = result
+            if not full_fidelity_i:
+                low_fidelity.add(key)
+
+        # Only full-fidelity results are cached
+        for i in np.flatnonzero(full_fidelity):
+            self._store_result(evaluator, pending_keys[i], results[i])
+        # -----------------------------------------------------------------------------------------------
+
+        # Hand results back to the agents; racing estimates only set the current error
+        for agent_i, key in zip(self.swarm, keys):
+            agent_i.set_fitness(*epoch_results[key], full_fidelity=key not in low_fidelity)
 
-    def _save_data(self):
-        write_data = {key : [list(values_i) for values_i in val] if key == "position" else val for key, val in self.history.items()}
+        cache_stats = self.fitness_cache.epoch_stats()
+        cache_stats["duplicates"] = num_duplicates
+        return cache_stats, racing_stats
 
-        with open("experiments/results_{}_agents.json".format(self.num_agents), "w") as outfile:
-            json.dump(write_data, outfile)
+    def _store_result(self, evaluator, key, result):
+        """
+            Cache a fresh full-fidelity result; main-evaluator importances also go into the consensus accumulator
+        """
+        self.fitness_cache.put(key, *result)
+        if evaluator is self.evaluator:
+            self.importance_accumulator.add(result[1])
+
+    def _fit_agents(self, evaluator, agents):
+        """
+            Score the agents' current positions with evaluator, on the process pool when possible; results in agent order
+        """
+        if self.parallel_evaluator is not None and evaluator.parallel:
+            return self.parallel_evaluator.evaluate([agent_i.current_position for agent_i in agents], evaluator.forest_params)
+
+        return [agent_i.compute_fitness(evaluator) for agent_i in agents]
+
+    def _open_history_log(self):
+        evaluators = [evaluator for evaluator in (self.proxy_evaluator, self.evaluator) if evaluator is not None]
+        return HistoryWriter(
+            self.history_path,
+            self.num_agents,
+            self.data.gene_name_list,
+            self.data.importance_layout.group_names,
+            [evaluator.name for evaluator in evaluators],
+            num_rungs=len(self.racing.rungs) if self.racing is not None else 0,
+            resume_epoch=self.start_epoch if self.start_epoch > 0 else None
+        )
 
     def run(self):
         """
             PSO Algorithm here
         """
+        if self.distributed_params and self.evaluator.parallel:
+            self.parallel_evaluator = DistributedEvaluator(self.data, forest_params=self.evaluator.forest_params, **self.distributed_params)
+        elif self.num_workers and self.evaluator.parallel:
+            print("Starting {} evaluation workers...".format(self.num_workers))
+            self.parallel_evaluator = ParallelEvaluator(self.data, self.num_workers, self.evaluator.forest_params)
+
+        if self.asynchronous and not isinstance(self.parallel_evaluator, ParallelEvaluator):
+            print("Asynchronous updates need NUM_WORKERS (a local process pool); running synchronous epochs")
+        elif self.asynchronous and self.racing is not None:
+            print("Racing is not used with asynchronous updates")
+
+        self.history_log = self._open_history_log()
+        if self.metrics_path:
+            self.metrics_exporter = PrometheusExporter(self.metrics_path, labels={"target" : self.data.target_gene})
+
+        if self.stopping_rules is not None:
+            self.stopping_rules.start()
+
+        try:
+            self._run_epochs()
+            self._save_importances()
+        finally:
+            self.history_log.close()
+            if self.parallel_evaluator is not None:
+                self.parallel_evaluator.close()
+                self.parallel_evaluator = None
+
+    def _save_importances(self, top_k=10):
+        self.importance_accumulator.save(self.importances_path)
+
+        ranking = self.importance_accumulator.ranking(top_k, min_count=max(1, self.importance_accumulator.num_evaluations // 100))
+        if ranking:
+            print("Consensus importances ({} evaluations):".format(self.importance_accumulator.num_evaluations))
+            for name, mean, std, frequency in ranking:
+                print("\t{:15s} {:.4f} +/- {:.4f} (selected {:.0%})".format(name, mean, std, frequency))
+
+    def _run_epochs(self):
         # begin optimization loop
-        for epoch_i in range(self.max_epochs):
+        for epoch_i in range(self.start_epoch, self.max_epochs):
+            if self.stop_reason:
+                print("Run already stopped ({})".format(self.stop_reason))
+                break
+
+            # Switch from the proxy to the main evaluator
+            evaluator = self._evaluator_for_epoch(epoch_i)
+            if epoch_i > 0 and evaluator is not self._evaluator_for_epoch(epoch_i - 1):
+                print("Switching fitness evaluator: {} -> {}".format(self._evaluator_for_epoch(epoch_i - 1).name, evaluator.name))
+                self._reset_bests()
+                if self.stopping_rules is not None:
+                    self.stopping_rules.reset_stagnation()
+
+            # Steady-state updates take over once the main evaluator runs on the process pool
+            if self.asynchronous and evaluator is self.evaluator and isinstance(self.parallel_evaluator, ParallelEvaluator):
+                self._run_async(epoch_i)
+                break
+
+            epoch_start = time.perf_counter()
+            PROFILER.reset()
+
+            # Evaluate fitness of every particle in the swarm
+            cache_stats_i, racing_stats_i = self._evaluate_swarm(evaluator)
+
+            # cycle through particles in swarm
+            with PROFILER.section("global_best"):
+                self._update_global_best(self.swarm)
+
+            # Diversity of the positions just evaluated (before they move)
+            diversity_i = mean_pairwise_hamming(self.state.positions, self.state.num_genes)
 
-            # cycle through particles in swarm and evaluate fitness
-            agent_errors = []
-            for agent_i in self.swarm:
+            # Update agent positions and velocities (batched over the whole swarm)
+            with PROFILER.section("velocity_update"):
+                self.state.update_velocities(self.best_global_position)
+            with PROFILER.section("position_update"):
+                self.state.update_positions()
 
-                # Evaluate the agent
-                agent_i.evaluate()
+            if self._end_epoch(epoch_i, evaluator, cache_stats_i, racing_stats_i, diversity_i, epoch_start):
+                break
 
-                # Update the agent errors
-                agent_errors.append(agent_i.current_error)
+    def _update_global_best(self, agents):
+        for agent_i in agents:
+            # determine if current particle is the best (globally)
+            if not agent_i.full_fidelity:
+                continue
+            if (agent_i.current_error < self.best_global_error or self.best_global_error == -1) and agent_i.current_error > 0:
+                self.best_global_position = agent_i.current_position.copy()
+                self.best_global_error = float(agent_i.current_error)
+                self.best_global_feature_importances = agent_i.full_feature_importances.copy()
 
-                # determine if current particle is the best (globally)
-                if (agent_i.current_error < self.best_global_error or self.best_global_error == -1) and agent_i.current_error > 0:
-                    self.best_global_position = agent_i.current_position
-                    self.best_global_error = float(agent_i.current_error)
-                    self.best_global_feature_importances = agent_i.full_feature_importances
+    def _end_epoch(self, epoch_i, evaluator, cache_stats_i, racing_stats_i, diversity_i, epoch_start):
+        """
+            Stopping rules, history, metrics, progress output and checkpoint of a finished (logical) epoch.
+            Returns True if the run should stop.
+        """
+        profile_i = PROFILER.epoch_summary(time.perf_counter() - epoch_start)
+
+        # Forest fits this epoch (racing counts full-fit equivalents)
+        evaluations_i = racing_stats_i["evaluation_cost"] if racing_stats_i is not None else cache_stats_i["misses"]
 
-            swarm_error_stats_i = {
-                "errors"        : agent_errors,
-                "mean"          : np.mean(agent_errors),
-                "std"           : np.std(agent_errors),
-                "best_error"    : self.best_global_error
+        # Stopping rules
+        # -----------------------------------------------------------------------------------------------
+        if self.stopping_rules is not None:
+            self.stop_reason = self.stopping_rules.update(self.best_global_error, diversity_i, profile_i["epoch_seconds"], evaluations_i)
+        if not self.stop_reason and epoch_i + 1 == self.max_epochs:
+            self.stop_reason = "max_epochs"
+
+        # Savings of stopping early: the remaining epochs at this run's mean cost per epoch
+        savings_i = None
+        if self.stop_reason and self.stop_reason != "max_epochs":
+            epochs_saved = self.max_epochs - (epoch_i + 1)
+            savings_i = {
+                "epochs_saved"          : epochs_saved,
+                "evaluations_saved"     : epochs_saved * self.stopping_rules.total_evaluations / (epoch_i + 1)
             }
+        # -----------------------------------------------------------------------------------------------
+
+        # Store timestep global best
+        self.history_log.append(self.best_global_error, self.best_global_position, self.state.current_errors, self.best_global_feature_importances,
+                                cache_stats_i, evaluator.name, racing_stats_i, profile_i,
+                                diversity_i, evaluations_i, self.stop_reason, savings_i)
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.write(epoch_i, self.best_global_error, profile_i)
+
+        # Update user with training info
+        print("{} / {} -- Best Error: {} -- Cache hits: {} / {}".format(epoch_i, self.max_epochs, self.best_global_error, cache_stats_i["hits"] + cache_stats_i["duplicates"], self.num_agents))
+        if racing_stats_i is not None:
+            print("\tRacing rungs: {} -- Evaluations saved: {:.1f}".format(racing_stats_i["rung_sizes"], racing_stats_i["evaluations_saved"]))
+        if PROFILER.enabled:
+            print("\t{:.2f} s -- {:.1f} evaluations / s -- fit {:.2f} s, X {:.2f} s, importances {:.2f} s".format(
+                profile_i["epoch_seconds"], profile_i["evaluations_per_second"], profile_i["seconds"]["forest_fit"],
+                profile_i["seconds"]["get_expression_levels"], profile_i["seconds"]["feature_importances"]))
+
+        # Immigrants replace the worst agents' next positions
+        if self.migration is not None and not self.stop_reason:
+            self.migration.exchange(self, epoch_i, evaluator.name)
+
+        # Checkpoint after the position update, so a resumed run starts with the next evaluation
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_save(self, epoch_i + 1, force=bool(self.stop_reason))
+
+        if savings_i is not None:
+            print("Stopping early ({}) -- {} epochs / ~{:.0f} evaluations saved".format(self.stop_reason, savings_i["epochs_saved"], savings_i["evaluations_saved"]))
+
+        return bool(self.stop_reason)
+
+    def _run_async(self, first_epoch):
+        """
+            Steady-state PSO on the process pool: as soon as an agent's evaluation returns, the agent updates the global best,
+            moves (using the global best at that moment) and its next position is submitted; there is no epoch barrier.
+            Every async_epoch_evaluations completed evaluations (default: one per agent) form a logical epoch for the
+            history, stopping rules and checkpoints. Evaluations still running at a checkpoint are simply redone on resume.
+        """
+        evaluator = self.evaluator
+        prefix = evaluator.name.encode("utf-8") + b":"
+        epoch_evaluations = self.async_epoch_evaluations or self.num_agents
+        print("Asynchronous updates: {} evaluations per logical epoch".format(epoch_evaluations))
+
+        in_flight = {}                      # future -> (agent, cache key)
+        ready = collections.deque()         # (agent, result) waiting to be applied
+
+        def dispatch(agent_i):
+            key = prefix + FitnessCache.key(agent_i.current_position)
+            cached = self.fitness_cache.get(key)
+            if cached is not None:
+                ready.append((agent_i, cached))
+            else:
+                in_flight[self.parallel_evaluator.submit(agent_i.current_position, evaluator.forest_params)] = (agent_i, key)
+
+        epoch_i = first_epoch
+        num_completed = 0
+        epoch_start = time.perf_counter()
+        PROFILER.reset()
+
+        for agent_i in self.swarm:
+            dispatch(agent_i)
+
+        try:
+            while True:
+                # Wait for the next finished evaluation
+                if not ready:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        agent_i, key = in_flight.pop(future)
+                        result = self.parallel_evaluator.collect(future)
+                        self._store_result(evaluator, key, result)
+                        ready.append((agent_i, result))
+
+                # Apply it and move that agent only
+                agent_i, result = ready.popleft()
+                agent_i.set_fitness(*result)
+
+                with PROFILER.section("global_best"):
+                    self._update_global_best([agent_i])
 
-            # Update agent positions and velocities
-            for agent_i in self.swarm:
-                agent_i.update_velocity(self.best_global_position)
-                agent_i.update_position()
+                rows = slice(agent_i.id, agent_i.id + 1)
+                with PROFILER.section("velocity_update"):
+                    self.state.update_velocities(self.best_global_position, rows)
+                with PROFILER.section("position_update"):
+                    self.state.update_positions(rows)
 
-            # Store timestep global best
-            self.history["error"].append(self.best_global_error)
-            self.history["position"].append(self.best_global_position)
-            self.history["feature_importance"].append(self.best_global_feature_importances)
-            self.history["error_stats"].append(swarm_error_stats_i)
-            self.history["num_genes_active"].append(self.best_global_position[self.best_global_position > 0].shape[0])
+                # Logical epoch boundary
+                num_completed += 1
+                if num_completed == epoch_evaluations:
+                    cache_stats_i = self.fitness_cache.epoch_stats()
+                    cache_stats_i["duplicates"] = 0
+                    if self._end_epoch(epoch_i, evaluator, cache_stats_i, None, mean_pairwise_hamming(self.state.positions, self.state.num_genes), epoch_start):
+                        break
 
-            # Update user with training info
-            print("{} / {} -- Best Error: {}".format(epoch_i, self.max_epochs, self.best_global_error))
+                    epoch_i += 1
+                    num_completed = 0
+                    epoch_start = time.perf_counter()
+                    PROFILER.reset()
 
-        # Save data
-        self._save_data()
+                dispatch(agent_i)
+        finally:
+            for future in in_flight:
+                future.cancel()
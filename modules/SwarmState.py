@@ -0,0 +1,148 @@
+import numpy as np
+
+from modules.Position import PackedPosition, packed_size, pack, unpack
+from modules.RandomStreams import RandomStreams, AGENT_STREAM
+
+class SwarmState(object):
+    """
+        Struct-of-arrays storage for every particle in the swarm.
+        Row i of each matrix belongs to agent i and each column is one of the correlated genes, so the
+        velocity / position updates for the whole swarm are a handful of batched NumPy operations per epoch.
+        Positions are bit-packed (modules/Position.py): 1 bit per gene instead of a float64, and only the rows being
+        updated are unpacked. Velocities are the only dense per-gene state, kept as float32.
+        Every agent draws from its own Generator (stream AGENT_STREAM, agent_i of the run seed), so an agent's random
+        numbers do not depend on how many agents there are or on the order rows are updated in.
+    """
+    # Per-agent arrays (what a checkpoint has to store)
+    ARRAYS = ("positions", "velocities", "current_errors", "best_positions", "best_errors")
+
+    def __init__(self, num_agents, num_genes, c1, c2, v_min, v_max, weight, num_importances=0, seed=None):
+
+        self.num_agents = num_agents
+        self.num_genes = num_genes
+
+        # Hyper-parameters
+        self.c1 = c1                    # cognative constant
+        self.c2 = c2                    # social constant
+        self.v_min = v_min              # Init v_min
+        self.v_max = v_max              # Init v_max
+        self.weight = weight            # Momentum
+
+        # Current Information (agents x genes; positions agents x packed bytes)
+        self.positions = np.zeros((num_agents, packed_size(num_genes)), dtype=np.uint8)         # particle positions
+        self.velocities = np.zeros((num_agents, num_genes), dtype=np.float32)                  # particle velocities
+        self.current_errors = np.full(num_agents, -1.0)                                         # error per individual
+        self.importances = np.full((num_agents, num_importances), np.nan, dtype=np.float32)     # importance vector of the last evaluation
+        self.full_fidelity = np.ones(num_agents, dtype=bool)                                    # current error is a full fit (not a racing estimate)
+
+        # Individual History
+        self.best_positions = np.zeros((num_agents, packed_size(num_genes)), dtype=np.uint8)    # best position per individual
+        self.best_errors = np.full(num_agents, -1.0)                                            # best error per individual
+
+        # PackedPosition view of each row, holding its cached active gene indices until the row moves
+        self._position_views = [None] * num_agents
+
+        # Per-agent random streams
+        random_streams = RandomStreams(seed)
+        self.generators = [random_streams.generator(AGENT_STREAM, agent_i) for agent_i in range(num_agents)]
+
+        # Initialize positions and velocities
+        self._init_particles()
+
+    def _init_particles(self):
+        # Initialize velocities
+        self.velocities[:] = self._uniform(slice(None), self.v_min, self.v_max)
+
+        # Initialize positions
+        self.positions[:] = pack(self._uniform(slice(None)) > 0.5)
+
+    def _uniform(self, rows, low=0.0, high=1.0):
+        """
+            (rows x genes) uniform draws; each row comes from its agent's own generator
+        """
+        return np.stack([self.generators[agent_i].uniform(low, high, self.num_genes) for agent_i in range(self.num_agents)[rows]])
+
+    def generator_states(self):
+        return [generator.bit_generator.state for generator in self.generators]
+
+    def set_generator_states(self, states):
+        for generator, state in zip(self.generators, states):
+            generator.bit_generator.state = state
+
+    def position(self, agent_i):
+        """
+            PackedPosition of agent_i's current position (a view: copy() it to keep it past the next position update)
+        """
+        view = self._position_views[agent_i]
+        if view is None:
+            view = self._position_views[agent_i] = PackedPosition(self.positions[agent_i], self.num_genes)
+        return view
+
+    def best_position(self, agent_i):
+        return PackedPosition(self.best_positions[agent_i], self.num_genes)
+
+    def dense_positions(self, rows=slice(None), dtype=np.float64):
+        return unpack(self.positions[rows], self.num_genes, dtype)
+
+    def set_positions(self, positions, rows=slice(None)):
+        """
+            Overwrite positions from a dense 0/1 (agents x genes) array
+        """
+        self.positions[rows] = pack(positions)
+        self.invalidate_positions(rows)
+
+    def invalidate_positions(self, rows=slice(None)):
+        """
+            Drop the cached PackedPosition views of rows after their positions were written directly
+        """
+        for agent_i in range(self.num_agents)[rows]:
+            self._position_views[agent_i] = None
+
+    def record_fitness(self, agent_i, error, full_fidelity=True):
+        """
+            Store the fitness of agent_i's current position and update its personal best.
+            A low-fidelity error (a racing estimate) is only stored as the current error: it never becomes a personal best.
+        """
+        self.current_errors[agent_i] = error
+        self.full_fidelity[agent_i] = full_fidelity
+        if not full_fidelity:
+            # Until a full fit scores it, an agent's personal best is where it started (error -1: replaced by any full fit)
+            if self.best_errors[agent_i] == -1:
+                self.best_positions[agent_i] = self.positions[agent_i]
+            return
+
+        # Set best position/best error to current position/error for first iteration,
+        # or if the current position is an individual best
+        if self.best_errors[agent_i] == -1 or (error < self.best_errors[agent_i] and error > 0):
+            self.best_positions[agent_i] = self.positions[agent_i]
+            self.best_errors[agent_i] = error
+
+    def update_velocities(self, best_global_position, rows=slice(None)):
+        """
+            Update the velocities of the agents in rows (all by default; a slice keeps the updates in place)
+        """
+        velocities = self.velocities[rows]
+        positions = self.dense_positions(rows)
+        r1 = self._uniform(rows)
+        r2 = self._uniform(rows)
+
+        # Velocity update based on agent best history
+        cognitive_velocity = self.c1 * r1 * (unpack(self.best_positions[rows], self.num_genes) - positions)
+
+        # Set current velocity
+        velocities *= self.weight
+        velocities += cognitive_velocity
+
+        # Velocity update based on global best history (none yet if no agent has scored an error > 0)
+        if best_global_position is not None:
+            velocities += self.c2 * r2 * (best_global_position.dense()[np.newaxis, :] - positions)
+
+    def _velocity_sigmoid(self, velocities):
+        # tanh form of the logistic function: same values as 1 / (1 + exp(-v)) without overflow for large |v|
+        return 0.5 * (1.0 + np.tanh(0.5 * velocities))
+
+    def update_positions(self, rows=slice(None)):
+        # Update current positions
+        velocities = self.velocities[rows]
+        self.positions[rows] = pack(self._velocity_sigmoid(velocities) > self._uniform(rows))
+        self.invalidate_positions(rows)
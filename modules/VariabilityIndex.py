@@ -0,0 +1,80 @@
+import os
+import sys
+import numpy as np
+
+STATISTICS = ("range", "mean", "std", "cv", "mad")
+
+
+def compute_variability_stats(matrix, chunk_size=4096):
+    """
+        Single streaming pass over the rows of matrix (genes x samples) computing, per gene:
+        range, mean, std, coefficient of variation (std / mean, 0 when the mean is 0) and median absolute deviation.
+        Returns a (genes x len(STATISTICS)) float64 array with columns in STATISTICS order.
+    """
+    num_genes = matrix.shape[0]
+    stats = np.zeros((num_genes, len(STATISTICS)), dtype=np.float64)
+
+    for start in range(0, num_genes, chunk_size):
+        stop = min(start + chunk_size, num_genes)
+        chunk = np.asarray(matrix[start:stop], dtype=np.float64)
+
+        mean = chunk.mean(axis=1)
+        std = chunk.std(axis=1)
+        median = np.median(chunk, axis=1)
+
+        stats[start:stop, 0] = chunk.max(axis=1) - chunk.min(axis=1)
+        stats[start:stop, 1] = mean
+        stats[start:stop, 2] = std
+        stats[start:stop, 3] = np.divide(std, mean, out=np.zeros_like(std), where=mean != 0)
+        stats[start:stop, 4] = np.median(np.abs(chunk - median[:, np.newaxis]), axis=1)
+
+        sys.stdout.write("\r Gene {} / {}".format(stop, num_genes))
+        sys.stdout.flush()
+    print("")
+
+    return stats
+
+
+class VariabilityIndex(object):
+    """
+        Compact binary table of per-gene expression statistics with a presorted (high to low) rank index
+        per statistic, so the top-k genes by any statistic are a slice.
+    """
+    def __init__(self, stats, ranks, gene_symbols, fingerprint):
+        self.stats = stats                  # genes x statistics (float32)
+        self.ranks = ranks                  # statistics x genes (int32), row indices sorted high to low
+        self.gene_symbols = gene_symbols
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, matrix, gene_symbols, fingerprint, chunk_size=4096):
+        stats = compute_variability_stats(matrix, chunk_size)
+
+        # Stable descending sort per statistic
+        ranks = np.stack([np.argsort(-stats[:, stat_i], kind="stable") for stat_i in range(len(STATISTICS))]).astype(np.int32)
+
+        return cls(stats.astype(np.float32), ranks, gene_symbols, fingerprint)
+
+    @classmethod
+    def load(cls, path, gene_symbols):
+        with np.load(path) as table:
+            return cls(table["stats"], table["ranks"], gene_symbols, str(table["fingerprint"]))
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, stats=self.stats, ranks=self.ranks, statistics=np.array(STATISTICS), fingerprint=np.array(self.fingerprint))
+        os.replace(tmp_path, path)
+
+    def column(self, statistic):
+        return self.stats[:, STATISTICS.index(statistic)]
+
+    def top_k(self, statistic, k):
+        """
+            The k genes with the highest value of statistic: list of {"gene_symbol", "row", statistic} dicts
+        """
+        stat_i = STATISTICS.index(statistic)
+        return [{
+            "gene_symbol"   : self.gene_symbols[row],
+            "row"           : int(row),
+            statistic       : float(self.stats[row, stat_i])
+        } for row in self.ranks[stat_i, :k]]
@@ -2,6 +2,7 @@ TESTING = True
 
 # PSO Hyperparameters
 # -----------------------------------------------------------------------------------------------------------------------
+SEED = 0                                        # Run seed of every random stream: gene subset, agents, forest fits (None: a fresh seed, printed at load)
 MAX_EPOCHS = 10 if TESTING else 50
 NUM_AGENTS = 200                                # Set to None for auto-scaling (set num agents = 10% of num genes)
 C1 = 2                                          # 1.49445
@@ -9,6 +10,33 @@ C2 = 2                                          # 1.49445
 W = 0.4                                         # 0.729
 VMIN = -4
 VMAX = 4
+FITNESS_CACHE_SIZE = 10000                      # Max number of evaluated positions kept in the LRU fitness cache (0 disables)
+NUM_WORKERS = None                              # Number of evaluation processes. Set to None to evaluate agents serially
+FOREST_N_JOBS = None                            # n_jobs of each RandomForestRegressor (workers default to 1)
+PROXY_EVALUATOR = None                          # Cheap fitness evaluator for the first PROXY_EPOCHS epochs: "ridge" or None
+PROXY_EPOCHS = 0
+RIDGE_ALPHA = 1.0                               # L2 penalty of the ridge proxy evaluator
+RACING_RUNGS = None                             # Successive-halving forest rungs, cheapest first, e.g. [{"n_estimators" : 10, "max_samples" : 0.5}, {"n_estimators" : 30}, {}]. None to disable
+RACING_PROMOTION_RATIO = 0.33                   # Fraction of agents promoted to the next rung
+COORDINATOR_ADDRESS = None                      # (host, port) to listen on for worker.py evaluation workers, e.g. ("0.0.0.0", 5555). None to disable
+TASK_TIMEOUT = 600                              # Seconds before a distributed evaluation is reassigned to another worker
+HEARTBEAT_INTERVAL = 5                          # Seconds between worker heartbeats; workers silent for 6 intervals are dropped
+ASYNCHRONOUS = False                            # Steady-state updates: each agent moves as soon as its own evaluation returns (needs NUM_WORKERS)
+ASYNC_EPOCH_EVALUATIONS = None                  # Completed evaluations per logical epoch in asynchronous mode (None: NUM_AGENTS)
+CHECKPOINT_PATH = "experiments/checkpoint.pkl"  # Resume with: python main.py --resume
+CHECKPOINT_EVERY_EPOCHS = 5                     # Write a checkpoint every N epochs (None to disable)
+CHECKPOINT_EVERY_SECONDS = 600                  # ... or every T seconds, whichever comes first (None to disable)
+PROFILING = True                                # Time the hot paths; per-epoch summaries are stored in the history log
+STOP_PATIENCE = None                            # Stop after N epochs without improving the best error by more than STOP_MIN_IMPROVEMENT (None to disable)
+STOP_MIN_IMPROVEMENT = 0.0                      # Relative improvement of the best error that resets the patience counter
+STOP_MIN_DIVERSITY = None                       # Stop once the mean pairwise Hamming distance drops below this fraction of genes (None to disable)
+MAX_SECONDS = None                              # Wall-clock budget of a run in seconds (None for no limit)
+MAX_EVALUATIONS = None                          # Budget of forest fits per run (None for no limit)
+METRICS_PATH = None                             # Prometheus textfile written every epoch, e.g. "/var/lib/node_exporter/textfile_collector/pso.prom"
+ISLANDS = None                                  # Number of island swarms run in parallel processes, NUM_AGENTS split between them (None for one swarm)
+MIGRATION_INTERVAL = 5                          # Epochs between migrations of each island's global best
+MIGRATION_TOPOLOGY = "ring"                     # "ring": to the next island, "full": to every other island
+ISLAND_OUTPUT_PATH = "experiments/islands"      # Per-island history logs / checkpoints and the merged history log
 # -----------------------------------------------------------------------------------------------------------------------
 
 # Data Handler parameters
@@ -19,13 +47,24 @@ PERCENTILES = {
     "bottom"    : 5
 }
 TOP_K_VARIABLE_GENES = 10                           # Set the number of genes able to select from for setting target
+RANK_STATISTIC = "range"                            # Statistic used to rank candidate targets: range, mean, std, cv or mad
 BASELINE_ITERATIONS = 5                             # How many times to run the baseline regressor
+BASELINE_N_JOBS = -1                                # Cores used by each baseline forest (-1: all). Scores are cached in data/baselines
 FEATURES = ["age", "gender", "structure_acronym"]   # all four: ["donor_name", "age", "gender", "structure_acronym"]
-NUM_SUBSET_GENES = 5000                             # How much data to subset from ~50k genes. Set to False to disable
+NUM_SUBSET_GENES = 5000                             # How much data to subset from ~50k genes. Set to False to screen all genes (takes seconds)
+LAZY_LOADING = True                                 # Load metadata, expression rows and the ridge Gram matrix on first use (False: all at load time)
+# -----------------------------------------------------------------------------------------------------------------------
+
+# Batch parameters (batch.py)
+# -----------------------------------------------------------------------------------------------------------------------
+BATCH_OUTPUT_PATH = "experiments/batch"             # One sub-directory of outputs per target gene
+BATCH_NUM_WORKERS = None                            # Threads for the per-target correlation / baseline stages. None uses every core
 # -----------------------------------------------------------------------------------------------------------------------
 
 # Plot parameters
 # -----------------------------------------------------------------------------------------------------------------------
 PLOT_GENE_ACTIVITY = True
 PLOT_GENE_VARIABILITY_ON_LOAD = False
+PLOT_NUM_WORKERS = None                         # Processes rendering heatmap frames. None uses every core
+PLOT_DPI = 300
 # -----------------------------------------------------------------------------------------------------------------------
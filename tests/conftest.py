@@ -0,0 +1,68 @@
+import io
+import contextlib
+import pytest
+
+from benchmarks.synthetic_data import generate
+from modules.DataHandler import DataHandler
+from modules.Swarm import Swarm
+
+FEATURES = ["age", "gender", "structure_acronym"]
+
+
+def make_data_handler(data_dir, **params):
+    """
+        Small DataHandler on the synthetic data; params override the defaults (e.g., target_gene, seed)
+    """
+    handler_params = {
+        "percentiles"           : {"top" : 95, "bottom" : 5},
+        "features"              : FEATURES,
+        "data_dir"              : data_dir,
+        "num_agents"            : 6,
+        "baseline_iterations"   : 1,
+        "baseline_n_jobs"       : 1,
+        "num_subset_genes"      : False,
+        "seed"                  : 0
+    }
+    handler_params.update(params)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DataHandler(**handler_params)
+
+def make_swarm(data, history_path, **params):
+    """
+        Swarm over data without plots or checkpoints; params override the defaults (e.g., max_epochs, racing, evaluator)
+    """
+    swarm_params = {
+        "num_agents"            : data.num_agents,
+        "max_epochs"            : 3,
+        "agent_params"          : {"c1" : 2.0, "c2" : 2.0, "v_min" : -4.0, "v_max" : 4.0, "weight" : 0.9, "data" : data},
+        "plot_gene_activity"    : False,
+        "forest_params"         : {"n_estimators" : 20, "n_jobs" : 1},
+        "history_path"          : str(history_path),
+        "profiling"             : False
+    }
+    swarm_params.update(params)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Swarm(**swarm_params)
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    """
+        Synthetic expression data (benchmarks/synthetic_data.py) with the real file layout: 300 genes x 60 samples
+    """
+    data_dir = str(tmp_path_factory.mktemp("data"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate(data_dir, num_genes=300, num_samples=60, seed=0)
+    return data_dir
+
+@pytest.fixture(scope="session")
+def target_gene(data_dir):
+    # The most variable gene, as the interactive prompt would offer first
+    data = make_data_handler(data_dir, load_target=False)
+    return data.variability_index.top_k("range", 1)[0]["gene_symbol"]
+
+@pytest.fixture(scope="session")
+def data(data_dir, target_gene):
+    return make_data_handler(data_dir, target_gene=target_gene)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from modules.Checkpoint import Checkpointer, load_checkpoint, CHECKPOINT_VERSION
+from modules.FitnessEvaluator import RidgeEvaluator
+from modules.HistoryLog import HistoryReader
+from tests.conftest import make_swarm
+
+NUM_EPOCHS = 5
+PROXY_EPOCHS = 2
+
+# Per-epoch columns that a resumed run must reproduce exactly (timings and the stop reason of the interrupted run differ)
+COLUMNS = ("best_error", "num_genes_active", "evaluator", "errors", "best_position", "importances", "cache_stats", "diversity", "evaluations")
+
+
+def run_swarm(data, history_path, max_epochs, checkpoint_path=None, checkpoint=None):
+    swarm = make_swarm(
+        data, history_path,
+        max_epochs=max_epochs,
+        proxy_evaluator=RidgeEvaluator(alpha=1.0),
+        proxy_epochs=PROXY_EPOCHS,
+        checkpointer=Checkpointer(str(checkpoint_path), every_epochs=1) if checkpoint_path else None
+    )
+    if checkpoint is not None:
+        swarm.restore(checkpoint)
+    swarm.run()
+    return swarm
+
+
+# Interrupted during the proxy epochs (ridge factors in the evaluator state) and after the switch to the forest
+@pytest.mark.parametrize("interrupted_after", [1, 3])
+def test_resume_matches_uninterrupted_run(data, tmp_path, interrupted_after):
+    uninterrupted = run_swarm(data, tmp_path / "full.bin", NUM_EPOCHS)
+
+    run_swarm(data, tmp_path / "resumed.bin", interrupted_after, checkpoint_path=tmp_path / "checkpoint.pkl")
+    checkpoint = load_checkpoint(str(tmp_path / "checkpoint.pkl"))
+    assert checkpoint["version"] == CHECKPOINT_VERSION
+    assert checkpoint["next_epoch"] == interrupted_after
+    resumed = run_swarm(data, tmp_path / "unused.bin", NUM_EPOCHS, checkpoint=checkpoint)
+
+    # The resumed swarm appended to the interrupted run's log
+    assert resumed.history_path == str(tmp_path / "resumed.bin")
+    expected = HistoryReader(str(tmp_path / "full.bin"))
+    history = HistoryReader(resumed.history_path)
+    assert len(history) == len(expected) == NUM_EPOCHS
+    for name in COLUMNS:
+        np.testing.assert_array_equal(history.column(name), expected.column(name), err_msg=name)
+
+    assert resumed.best_global_error == uninterrupted.best_global_error
+    assert resumed.best_global_position == uninterrupted.best_global_position
+    np.testing.assert_array_equal(resumed.best_global_feature_importances, uninterrupted.best_global_feature_importances)
+    for name in ("positions", "velocities", "best_positions", "best_errors"):
+        np.testing.assert_array_equal(getattr(resumed.state, name), getattr(uninterrupted.state, name), err_msg=name)
+    np.testing.assert_array_equal(resumed.importance_accumulator.mean, uninterrupted.importance_accumulator.mean)
@@ -0,0 +1,95 @@
+import os
+import time
+import signal
+import threading
+import multiprocessing
+import numpy as np
+import pytest
+
+from modules.Distributed import DistributedEvaluator, run_worker
+from modules.FitnessEvaluator import evaluate_position
+from modules.Position import PackedPosition
+
+FOREST_PARAMS = {"n_estimators" : 30, "seed" : 0}
+NUM_POSITIONS = 24
+
+
+def random_positions(num_genes, seed=0):
+    rng = np.random.default_rng(seed)
+    return [PackedPosition.from_dense(rng.random(num_genes) < 0.5) for _ in range(NUM_POSITIONS)]
+
+def start_workers(data_dir, port, num_workers=2):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, args=("127.0.0.1", port, data_dir), kwargs={"heartbeat_interval" : 0.2, "retry_interval" : 0.1}, daemon=True)
+               for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def wait_for(condition, timeout=60.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+def evaluate_in_background(evaluator, positions):
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(value=evaluator.evaluate(positions, FOREST_PARAMS)), daemon=True)
+    thread.start()
+    return thread, results
+
+
+@pytest.mark.parametrize("failure", ["kill", "stop"])
+def test_worker_failure_mid_epoch(data, data_dir, failure):
+    """
+        Two workers on 127.0.0.1; one dies ("kill": connection drops) or hangs ("stop": heartbeats stop) while running a task.
+        Every result still arrives, in order, and equals the serial evaluation.
+    """
+    positions = random_positions(data.num_genes)
+    serial = [evaluate_position(data, position, dict(FOREST_PARAMS, n_jobs=1)) for position in positions]
+
+    evaluator = DistributedEvaluator(data, ("127.0.0.1", 0), task_timeout=60.0, heartbeat_timeout=1.0)
+    workers = start_workers(data_dir, evaluator.server.getsockname()[1])
+    try:
+        wait_for(lambda: evaluator._num_ready() == 2)
+        thread, results = evaluate_in_background(evaluator, positions)
+
+        # Fail a worker while it holds a task
+        wait_for(lambda: all(worker.task_id is not None for worker in list(evaluator.workers)) or not thread.is_alive())
+        assert thread.is_alive(), "epoch finished before a worker could fail"
+        os.kill(workers[0].pid, signal.SIGKILL if failure == "kill" else signal.SIGSTOP)
+
+        thread.join(timeout=120.0)
+        assert not thread.is_alive()
+        assert len(evaluator.workers) == 1
+
+        for (error, importances), (serial_error, serial_importances) in zip(results["value"], serial):
+            assert error == serial_error
+            np.testing.assert_array_equal(importances, serial_importances)
+    finally:
+        evaluator.close()
+        for worker in workers:
+            worker.kill()
+            worker.join()
+
+def test_worker_joins_mid_run(data, data_dir):
+    """
+        A worker that connects after the first epoch is set up and takes tasks from the next one
+    """
+    positions = random_positions(data.num_genes, seed=1)
+    evaluator = DistributedEvaluator(data, ("127.0.0.1", 0), heartbeat_timeout=5.0)
+    port = evaluator.server.getsockname()[1]
+    workers = start_workers(data_dir, port, num_workers=1)
+    try:
+        first = evaluator.evaluate(positions[:4], FOREST_PARAMS)
+        workers += start_workers(data_dir, port, num_workers=1)
+        wait_for(lambda: evaluator._num_ready() == 2)
+        second = evaluator.evaluate(positions[4:], FOREST_PARAMS)
+
+        serial = [evaluate_position(data, position, dict(FOREST_PARAMS, n_jobs=1))[0] for position in positions]
+        assert [error for error, _ in first + second] == serial
+    finally:
+        evaluator.close()
+        for worker in workers:
+            worker.join(timeout=10.0)
+            worker.kill()
@@ -0,0 +1,68 @@
+import numpy as np
+
+from modules.FeatureImportance import ImportanceLayout, ImportanceAccumulator, covariate_groups
+
+GENE_NAMES = ["GENE{}".format(gene_i) for gene_i in range(30)]
+FEATURES = ["age", "gender", "structure_acronym"]
+ENCODING_SIZES = {"donor" : 7, "age" : 4, "gender" : 2, "structure" : 5}
+
+
+def make_layout():
+    return ImportanceLayout(GENE_NAMES, covariate_groups(FEATURES, ENCODING_SIZES))
+
+
+def test_groups_follow_features_not_encoding_sizes():
+    # donor is encoded but not selected, so it has no group
+    assert covariate_groups(FEATURES, ENCODING_SIZES) == [("age", 4), ("gender", 2), ("structure", 5)]
+
+def test_vector_matches_direct_computation():
+    layout = make_layout()
+    rng = np.random.default_rng(0)
+    widths = [ENCODING_SIZES[feature.split("_")[0]] for feature in FEATURES]
+
+    for _ in range(20):
+        active = np.flatnonzero(rng.random(len(GENE_NAMES)) < 0.4)
+        importances = rng.random(len(active) + sum(widths))
+        vector = layout.vector(importances, active)
+
+        assert vector.dtype == np.float32 and vector.shape == (layout.size,)
+        expected_genes = np.full(len(GENE_NAMES), np.nan)
+        expected_genes[active] = importances[:len(active)]
+        np.testing.assert_allclose(vector[:len(GENE_NAMES)], expected_genes, rtol=1e-6)
+
+        # Group sums: np.add.reduceat over the covariate columns, and the same sums taken slice by slice
+        covariates = importances[len(active):]
+        starts = np.concatenate([[0], np.cumsum(widths)[:-1]])
+        np.testing.assert_allclose(vector[len(GENE_NAMES):], np.add.reduceat(covariates, starts), rtol=1e-6)
+        np.testing.assert_allclose(vector[len(GENE_NAMES):], [covariates[start:start + width].sum() for start, width in zip(starts, widths)], rtol=1e-6)
+
+def test_accumulator_matches_nan_statistics():
+    layout = make_layout()
+    rng = np.random.default_rng(1)
+
+    vectors = []
+    for _ in range(200):
+        active = np.flatnonzero(rng.random(len(GENE_NAMES)) < 0.3)
+        active = active[active != 3]                # a gene that is never selected
+        vectors.append(layout.vector(rng.random(len(active) + layout.num_covariate_columns), active))
+
+    accumulator = ImportanceAccumulator(layout.names)
+    for vector in vectors:
+        accumulator.add(vector)
+    vectors = np.array(vectors, dtype=np.float64)
+    never = np.arange(len(layout.names)) == 3
+
+    count = np.sum(~np.isnan(vectors), axis=0)
+    np.testing.assert_array_equal(accumulator.count, count)
+    np.testing.assert_allclose(accumulator.frequency(), count / 200.0)
+
+    seen = count > 1
+    np.testing.assert_allclose(accumulator.mean[seen], np.nanmean(vectors[:, seen], axis=0), rtol=1e-6)
+    np.testing.assert_allclose(accumulator.variance()[seen], np.nanvar(vectors[:, seen], axis=0, ddof=1), rtol=1e-6)
+    assert accumulator.mean[never] == 0 and accumulator.variance()[never] == 0
+
+    # Ranking by mean over entries seen often enough
+    ranking = accumulator.ranking(top_k=5, min_count=10)
+    means = [mean for _, mean, _, _ in ranking]
+    assert means == sorted(means, reverse=True)
+    assert all(accumulator.count[layout.names.index(name)] >= 10 for name, _, _, _ in ranking)
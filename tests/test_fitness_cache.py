@@ -0,0 +1,89 @@
+import numpy as np
+
+from modules.FitnessCache import FitnessCache
+from modules.FitnessEvaluator import FitnessEvaluator
+from tests.conftest import make_swarm
+
+
+class CountingEvaluator(FitnessEvaluator):
+    """
+        Deterministic stand-in evaluator: error = scale * number of active genes; records every position it scores
+    """
+    def __init__(self, name, scale):
+        self.name = name
+        self.scale = scale
+        self.calls = []
+
+    def evaluate(self, data, position, agent_id=None):
+        self.calls.append(position.key())
+        return self.scale * position.popcount(), data.importance_layout.empty()
+
+
+def test_lru_eviction_order():
+    cache = FitnessCache(max_size=3)
+    for key in (b"a", b"b", b"c"):
+        cache.put(key, len(key), None)
+
+    # Reading "a" makes "b" the least recently used, so it goes first
+    assert cache.get(b"a") == (1, None)
+    cache.put(b"d", 1, None)
+    assert list(cache.entries) == [b"c", b"a", b"d"]
+    assert b"b" not in cache and cache.get(b"b") is None
+
+    # Re-putting an entry refreshes it too
+    cache.put(b"c", 2, None)
+    cache.put(b"e", 1, None)
+    assert list(cache.entries) == [b"d", b"c", b"e"]
+    assert cache.get(b"c") == (2, None)
+
+    assert cache.epoch_stats() == {"hits" : 2, "misses" : 1, "size" : 3}
+    assert cache.epoch_stats() == {"hits" : 0, "misses" : 0, "size" : 3}
+
+def test_disabled_cache():
+    cache = FitnessCache(max_size=0)
+    cache.put(b"a", 1, None)
+    assert len(cache) == 0 and cache.get(b"a") is None
+
+
+def test_duplicates_evaluated_once(data, tmp_path):
+    evaluator = CountingEvaluator("forest", 1.0)
+    swarm = make_swarm(data, tmp_path / "history.bin", evaluator=evaluator)
+
+    # Six agents on three distinct positions
+    rng = np.random.default_rng(0)
+    distinct = rng.random((3, data.num_genes)) < 0.5
+    swarm.state.set_positions(distinct[[0, 1, 0, 2, 1, 0]])
+
+    cache_stats, _ = swarm._evaluate_swarm(evaluator)
+    assert len(evaluator.calls) == 3
+    assert len(set(evaluator.calls)) == 3
+    assert (cache_stats["hits"], cache_stats["misses"], cache_stats["duplicates"], cache_stats["size"]) == (0, 3, 3, 3)
+    np.testing.assert_array_equal(swarm.state.current_errors, distinct[[0, 1, 0, 2, 1, 0]].sum(axis=1))
+
+    # The next epoch on the same positions is served from the cache
+    cache_stats, _ = swarm._evaluate_swarm(evaluator)
+    assert len(evaluator.calls) == 3
+    assert (cache_stats["hits"], cache_stats["misses"], cache_stats["duplicates"]) == (3, 0, 3)
+    np.testing.assert_array_equal(swarm.state.current_errors, distinct[[0, 1, 0, 2, 1, 0]].sum(axis=1))
+
+def test_evaluators_do_not_share_entries(data, tmp_path):
+    """
+        The proxy and main evaluators score the same positions on different scales: neither may read the other's entries
+    """
+    evaluator = CountingEvaluator("forest", 1.0)
+    proxy_evaluator = CountingEvaluator("ridge", 100.0)
+    swarm = make_swarm(data, tmp_path / "history.bin", evaluator=evaluator, proxy_evaluator=proxy_evaluator, proxy_epochs=1)
+    num_active = swarm.state.dense_positions().sum(axis=1)
+
+    swarm._evaluate_swarm(proxy_evaluator)
+    np.testing.assert_array_equal(swarm.state.current_errors, 100.0 * num_active)
+
+    cache_stats, _ = swarm._evaluate_swarm(evaluator)
+    assert cache_stats["hits"] == 0
+    assert len(evaluator.calls) == len(proxy_evaluator.calls) == data.num_agents
+    np.testing.assert_array_equal(swarm.state.current_errors, num_active)
+
+    # Both evaluators' entries are kept side by side
+    swarm._evaluate_swarm(proxy_evaluator)
+    np.testing.assert_array_equal(swarm.state.current_errors, 100.0 * num_active)
+    assert len(proxy_evaluator.calls) == data.num_agents
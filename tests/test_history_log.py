@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pytest
+
+from modules.HistoryLog import HistoryWriter, HistoryReader
+from modules.Position import PackedPosition
+
+NUM_AGENTS = 4
+GENE_NAMES = ["GENE{}".format(gene_i) for gene_i in range(21)]
+COVARIATE_NAMES = ["age", "gender"]
+EVALUATORS = ["ridge", "forest"]
+
+
+def open_writer(path, resume_epoch=None):
+    return HistoryWriter(str(path), NUM_AGENTS, GENE_NAMES, COVARIATE_NAMES, EVALUATORS, resume_epoch=resume_epoch)
+
+def append_epoch(writer, epoch_i):
+    """
+        Record with values derived from epoch_i, so every epoch is distinguishable
+    """
+    rng = np.random.default_rng(epoch_i)
+    position = PackedPosition.from_dense(rng.random(len(GENE_NAMES)) < 0.5)
+    writer.append(
+        best_error=0.1 * epoch_i,
+        best_position=position,
+        errors=rng.random(NUM_AGENTS),
+        feature_importances=rng.random(len(GENE_NAMES) + len(COVARIATE_NAMES)),
+        cache_stats={"hits" : epoch_i, "misses" : NUM_AGENTS - epoch_i},
+        evaluator_name=EVALUATORS[epoch_i % 2]
+    )
+
+def expected_records(path, num_epochs):
+    # The same epochs written to a log that was never interrupted
+    writer = open_writer(path)
+    for epoch_i in range(num_epochs):
+        append_epoch(writer, epoch_i)
+    writer.close()
+    return HistoryReader(str(path)).records
+
+
+@pytest.fixture
+def torn_log(tmp_path):
+    """
+        Log with 4 complete epochs and the first half of a 5th, as left by a crash in the middle of a write
+    """
+    path = tmp_path / "history.bin"
+    writer = open_writer(path)
+    for epoch_i in range(5):
+        append_epoch(writer, epoch_i)
+    writer.close()
+
+    record_size = HistoryReader(str(path)).dtype.itemsize
+    with open(path, "r+b") as outfile:
+        outfile.truncate(os.path.getsize(path) - record_size // 2)
+    return path
+
+
+def test_reader_drops_partial_record(torn_log, tmp_path):
+    history = HistoryReader(str(torn_log))
+    assert len(history) == 4
+    np.testing.assert_array_equal(history.records, expected_records(tmp_path / "expected.bin", 4))
+    np.testing.assert_allclose(history.column("best_error"), [0.0, 0.1, 0.2, 0.3])
+
+@pytest.mark.parametrize("resume_epoch", [4, 2])
+def test_writer_appends_after_reopening(torn_log, tmp_path, resume_epoch):
+    """
+        Reopening at the checkpoint's epoch cuts the partial record (and any epoch after the checkpoint), then appends
+    """
+    writer = open_writer(torn_log, resume_epoch=resume_epoch)
+    for epoch_i in range(resume_epoch, 6):
+        append_epoch(writer, epoch_i)
+    writer.close()
+
+    history = HistoryReader(str(torn_log))
+    assert len(history) == 6
+    assert os.path.getsize(torn_log) == history.header_size + 6 * history.dtype.itemsize
+    np.testing.assert_array_equal(history.records, expected_records(tmp_path / "expected.bin", 6))
+
+def test_reopening_another_runs_log_fails(torn_log):
+    with pytest.raises(ValueError):
+        HistoryWriter(str(torn_log), NUM_AGENTS + 1, GENE_NAMES, COVARIATE_NAMES, EVALUATORS, resume_epoch=4)
@@ -0,0 +1,46 @@
+import threading
+
+from modules.Instrumentation import Profiler, SECTIONS, LATENCY_SECTION
+
+NUM_THREADS = 4
+NUM_MERGES = 2000
+NUM_ADDS = 20000
+
+
+def worker_snapshot():
+    # What a remote worker sends after one task
+    profiler = Profiler()
+    profiler.add(LATENCY_SECTION, 0.003)
+    profiler.add("forest_fit", 0.002)
+    return profiler.drain()
+
+
+def test_merge_from_threads_while_timing():
+    """
+        Snapshots merged from reader threads while the main thread adds its own timings: no update is lost
+    """
+    profiler = Profiler()
+    snapshot = worker_snapshot()
+
+    def merge_loop():
+        for _ in range(NUM_MERGES):
+            profiler.merge(snapshot)
+
+    threads = [threading.Thread(target=merge_loop) for _ in range(NUM_THREADS)]
+    for thread in threads:
+        thread.start()
+    for _ in range(NUM_ADDS):
+        profiler.add("global_best", 1e-6)
+        profiler.add(LATENCY_SECTION, 0.003)
+    for thread in threads:
+        thread.join()
+
+    summary = profiler.drain()
+    assert summary["calls"][LATENCY_SECTION] == NUM_THREADS * NUM_MERGES + NUM_ADDS
+    assert summary["calls"]["forest_fit"] == NUM_THREADS * NUM_MERGES
+    assert summary["calls"]["global_best"] == NUM_ADDS
+    assert sum(summary["latency"]) == NUM_THREADS * NUM_MERGES + NUM_ADDS
+
+    # drain() resets
+    assert all(calls == 0 for calls in profiler.drain()["calls"].values())
+    assert set(summary["seconds"]) == set(SECTIONS)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from modules.Position import PackedPosition, pack, unpack, packed_size, popcount, hamming
+
+
+def random_positions(num_agents, num_genes, seed=0):
+    return np.random.default_rng(seed).random((num_agents, num_genes)) < 0.4
+
+
+def test_pack_unpack_round_trip():
+    # Gene counts that are and are not a multiple of 8 (padding bits in the last byte)
+    for num_genes in (1, 7, 8, 9, 64, 101):
+        positions = random_positions(5, num_genes)
+        packed = pack(positions)
+
+        assert packed.dtype == np.uint8
+        assert packed.shape == (5, packed_size(num_genes))
+        np.testing.assert_array_equal(unpack(packed, num_genes), positions.astype(np.float64))
+        np.testing.assert_array_equal(popcount(packed), positions.sum(axis=1))
+
+def test_packed_position_matches_dense():
+    positions = random_positions(2, 101, seed=1)
+    a, b = (PackedPosition.from_dense(position) for position in positions)
+
+    assert len(a) == 101
+    np.testing.assert_array_equal(a.dense(), positions[0].astype(np.float64))
+    np.testing.assert_array_equal(a.active_indices, np.flatnonzero(positions[0]))
+    assert a.popcount() == positions[0].sum()
+    assert a.hamming(b) == np.sum(positions[0] != positions[1])
+    assert hamming(pack(positions[0]), pack(positions[1])) == np.sum(positions[0] != positions[1])
+
+    added, removed = a.diff(b)
+    np.testing.assert_array_equal(added, np.flatnonzero(positions[0] & ~positions[1]))
+    np.testing.assert_array_equal(removed, np.flatnonzero(positions[1] & ~positions[0]))
+
+def test_key_and_copy():
+    position = random_positions(1, 50, seed=2)[0]
+    a = PackedPosition.from_dense(position)
+    copy = a.copy()
+
+    assert copy == a
+    assert copy.key() == a.key() == PackedPosition.from_dense(position.astype(np.float64)).key()
+
+    # The copy keeps its bits when the original row changes in place
+    a.bits[:] = 0
+    assert copy != a
+    np.testing.assert_array_equal(copy.active_indices, np.flatnonzero(position))
@@ -0,0 +1,76 @@
+import numpy as np
+
+from modules.Racing import SuccessiveHalving
+from modules.FitnessEvaluator import FitnessEvaluator, RandomForestEvaluator
+from tests.conftest import make_swarm
+
+# Cheap rungs underestimate the error, so their scores would win every comparison if they leaked into the bests
+CHEAP_ESTIMATE = 0.25
+
+
+class RungEvaluator(FitnessEvaluator):
+    """
+        Deterministic stand-in for one racing rung: the full rung scores 1 + active fraction, cheaper rungs a quarter of it
+    """
+    name = "forest"
+
+    def __init__(self, full_fidelity):
+        self.full_fidelity = full_fidelity
+        self.forest_params = {}
+
+    def evaluate(self, data, position, agent_id=None):
+        error = 1.0 + position.popcount() / float(len(position))
+        return (error if self.full_fidelity else CHEAP_ESTIMATE * error), data.importance_layout.empty()
+
+
+class StubHalving(SuccessiveHalving):
+    def rung_evaluators(self, evaluator):
+        return [RungEvaluator(rung_i == len(self.rungs) - 1) for rung_i in range(len(self.rungs))]
+
+
+def test_only_survivors_are_full_fidelity():
+    true_errors = np.array([0.7, 0.1, 0.9, 0.3, 0.5, 0.2, 0.8, 0.4])
+    rung_sizes = [5, 20, 100]
+    racing = SuccessiveHalving([{"n_estimators" : n_estimators} for n_estimators in rung_sizes], promotion_ratio=0.5)
+    fits = []
+
+    def fit(rung_evaluator, indices):
+        rung_i = rung_sizes.index(rung_evaluator.forest_params["n_estimators"])
+        fits.append((rung_i, list(indices)))
+        return [(true_errors[i] + 0.01 * rung_i, rung_i) for i in indices]
+
+    results, full_fidelity, stats = racing.race(RandomForestEvaluator(), len(true_errors), fit)
+
+    # Halving 8 -> 4 -> 2: the two lowest errors reach the full rung
+    assert stats["rung_sizes"] == [8, 4, 2]
+    assert [sorted(indices) for _, indices in fits] == [list(range(8)), [1, 3, 5, 7], [1, 5]]
+    np.testing.assert_array_equal(np.flatnonzero(full_fidelity), [1, 5])
+
+    # Eliminated candidates keep the score of the last rung they ran
+    assert [rung_i for _, rung_i in results] == [0, 2, 0, 1, 0, 2, 0, 1]
+    assert stats["evaluations_saved"] == 8 - stats["evaluation_cost"]
+
+def test_estimates_never_become_bests(data, tmp_path):
+    racing = StubHalving([{"n_estimators" : 5}, {}], promotion_ratio=0.33)
+    swarm = make_swarm(data, tmp_path / "history.bin", evaluator=RungEvaluator(True), racing=racing)
+
+    for epoch_i in range(3):
+        swarm._evaluate_swarm(swarm.evaluator)
+        swarm._update_global_best(swarm.swarm)
+
+        # 6 agents, 2 promoted: the other 4 hold a cheap estimate as their current error only (later epochs add cache hits)
+        if epoch_i == 0:
+            assert int(np.sum(swarm.state.full_fidelity)) == 2
+            assert np.sum(swarm.state.best_errors == -1) == 4
+        full_errors = 1.0 + swarm.state.dense_positions().mean(axis=1)
+        np.testing.assert_allclose(swarm.state.current_errors[~swarm.state.full_fidelity], CHEAP_ESTIMATE * full_errors[~swarm.state.full_fidelity])
+
+        # Every personal best is either unset (-1) or a full-fidelity score
+        assert np.all((swarm.state.best_errors == -1) | (swarm.state.best_errors >= 1.0))
+        assert swarm.best_global_error >= 1.0
+
+        swarm.state.update_velocities(swarm.best_global_position)
+        swarm.state.update_positions()
+
+    # Only full-fidelity results were cached
+    assert all(error >= 1.0 for error, _ in swarm.fitness_cache.entries.values())
@@ -0,0 +1,113 @@
+import types
+import numpy as np
+
+from modules.FitnessEvaluator import RidgeEvaluator
+from modules.FeatureImportance import ImportanceLayout
+from modules.Position import PackedPosition
+
+NUM_SAMPLES = 60
+NUM_GENES = 40
+COVARIATE_WIDTHS = [3, 2]
+ALPHA = 0.5
+
+
+def make_data(seed=0):
+    """
+        Stand-in for a DataHandler with the Gram matrix of standardized random genes + covariates, as __5C_setup_gram_matrix builds it
+    """
+    rng = np.random.default_rng(seed)
+    Z = rng.standard_normal((NUM_SAMPLES, NUM_GENES + sum(COVARIATE_WIDTHS)))
+    Z = (Z - Z.mean(axis=0)) / Z.std(axis=0)
+    y = Z[:, :5].sum(axis=1) + rng.standard_normal(NUM_SAMPLES)
+    y = y - y.mean()
+
+    gene_names = ["GENE{}".format(gene_i) for gene_i in range(NUM_GENES)]
+    groups = [("covariate{}".format(group_i), width) for group_i, width in enumerate(COVARIATE_WIDTHS)]
+    data = types.SimpleNamespace(
+        num_genes=NUM_GENES,
+        num_samples=NUM_SAMPLES,
+        gram_matrix=Z.T @ Z,
+        gram_target=Z.T @ y,
+        gram_target_sum_squares=float(y @ y),
+        importance_layout=ImportanceLayout(gene_names, groups)
+    )
+    return data, Z, y
+
+def dense_gcv(Z, y, columns, alpha):
+    """
+        GCV error of ridge on the given columns of Z, from a dense solve on the raw samples
+    """
+    Z_S = Z[:, columns]
+    A = Z_S.T @ Z_S + alpha * np.identity(len(columns))
+    beta = np.linalg.solve(A, Z_S.T @ y)
+    rss = np.sum((y - Z_S @ beta) ** 2)
+    trace_hat = np.trace(Z_S @ np.linalg.solve(A, Z_S.T))
+    n = Z.shape[0]
+    return n * rss / (n - trace_hat) ** 2
+
+def random_walk(rng, num_steps, max_changes=3):
+    """
+        Positions that each add and/or remove up to max_changes genes from the previous one
+    """
+    position = rng.random(NUM_GENES) < 0.3
+    for _ in range(num_steps):
+        flips = rng.choice(NUM_GENES, rng.integers(1, max_changes + 1), replace=False)
+        position = position.copy()
+        position[flips] = ~position[flips]
+        if position.any():
+            yield position
+
+
+def test_incremental_factor_matches_dense_solve():
+    data, _, _ = make_data()
+    evaluator = RidgeEvaluator(alpha=ALPHA, max_updates=NUM_GENES, refactor_every=10 ** 9)
+    covariate_columns = list(range(NUM_GENES, data.gram_matrix.shape[0]))
+    rng = np.random.default_rng(1)
+
+    num_incremental = 0
+    for position in random_walk(rng, 300):
+        columns = covariate_columns + list(np.flatnonzero(position))
+        factor = evaluator._get_factor(data, columns, agent_id=0)
+        num_incremental += factor["updates"] > 0
+
+        order = factor["order"]
+        assert sorted(order) == sorted(columns)
+
+        A = data.gram_matrix[np.ix_(order, order)] + ALPHA * np.identity(len(order))
+        L = factor["L"]
+        np.testing.assert_allclose(L @ L.T, A, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(factor["trace_inv"], np.trace(np.linalg.inv(A)), rtol=1e-9)
+
+        b = data.gram_target[order]
+        beta = np.linalg.solve(L.T, np.linalg.solve(L, b))
+        np.testing.assert_allclose(beta, np.linalg.solve(A, b), rtol=1e-8, atol=1e-10)
+
+    # Every step after the first was an up/downdate, not a refactorization
+    assert num_incremental > 250
+
+def test_error_matches_dense_gcv():
+    data, Z, y = make_data()
+    incremental = RidgeEvaluator(alpha=ALPHA)
+    fresh = RidgeEvaluator(alpha=ALPHA)
+    covariate_columns = list(range(NUM_GENES, data.gram_matrix.shape[0]))
+    rng = np.random.default_rng(2)
+
+    for position in random_walk(rng, 100):
+        packed = PackedPosition.from_dense(position)
+        error, importances = incremental.evaluate(data, packed, agent_id=0)
+        fresh_error, fresh_importances = fresh.evaluate(data, packed)
+
+        expected = dense_gcv(Z, y, covariate_columns + list(np.flatnonzero(position)), ALPHA)
+        np.testing.assert_allclose(error, expected, rtol=1e-8)
+        np.testing.assert_allclose(fresh_error, expected, rtol=1e-8)
+        np.testing.assert_allclose(importances, fresh_importances, rtol=1e-6, atol=1e-9)
+
+        # Inactive genes are NaN, the rest of the vector sums to 1
+        assert np.isnan(importances[:NUM_GENES][~position]).all()
+        np.testing.assert_allclose(np.nansum(importances), 1.0, rtol=1e-5)
+
+def test_empty_position():
+    data, _, _ = make_data()
+    error, importances = RidgeEvaluator(alpha=ALPHA).evaluate(data, PackedPosition.from_dense(np.zeros(NUM_GENES)), agent_id=0)
+    assert error == 500
+    assert np.isnan(importances).all()
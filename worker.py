@@ -0,0 +1,18 @@
+import argparse
+
+from modules.config import DATA_PATH, COORDINATOR_ADDRESS, HEARTBEAT_INTERVAL
+from modules.Distributed import run_worker
+
+def main():
+    default_host, default_port = COORDINATOR_ADDRESS or ("localhost", 5555)
+
+    parser = argparse.ArgumentParser(description="PSO evaluation worker: connects to a coordinator started by main.py with COORDINATOR_ADDRESS set")
+    parser.add_argument("--host", default=default_host if default_host not in ("", "0.0.0.0") else "localhost")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--data-dir", default=DATA_PATH, help="directory containing expression_store (same dataset as the coordinator)")
+    args = parser.parse_args()
+
+    run_worker(args.host, args.port, args.data_dir, heartbeat_interval=HEARTBEAT_INTERVAL)
+
+if __name__ == "__main__":
+    main()